@@ -4,7 +4,12 @@ import logging.handlers
 
 CONFIG = {
     "mailLogger": logging.handlers.SMTPHandler(),
+    "mailDigest": {
+        "window": 60,   # seconds to collect log messages for one mail
+        "maxMails": 10  # mails per hour
+    },
     "defaultApi": "API_NAME", # optional
+    "maxBodySize": 5242880, # optional, bytes
     
     "protection": {
         # basic authentication for manual deployment
@@ -21,12 +26,45 @@ CONFIG = {
         }
     },
     
+    # optional, limits of git commands and scripts
+    "commands": {
+        "timeout": 900,        # seconds per git command
+        "scriptTimeout": 1800, # seconds for setup/reload scripts
+        "maxOutput": 1048576,  # captured bytes per command
+        "killScriptProcessGroup": True  # on timeout, kill background processes of setup/reload scripts as well
+    },
+    
+    "deliveries": {
+        "maxEntries": 1000, # remembered webhook deliveries
+        "ttl": 86400        # seconds
+    },
+    
+    # optional, one JSON line per branch deploy
+    "traces": {
+        "path": "/path/to/deploys.jsonl"
+    },
+    
+    # optional, worker threads for webhook deploys (0 deploys synchronously)
+    "concurrency": {
+        "deployWorkers": 2,
+        "branchWorkers": 4, # parallel branch deploys of release/tag events
+        "hostLimit": 2      # concurrent branch deploys per git host
+    },
+    
     "API_NAME": {
         "accessToken":"TOKEN",
         "username":"USERNAME",
         "baseUrl": "git@github.com:Kavakuo/",
         "hmacSecret": b"secret",
-        "deployPath": "/home/kavakuo/GitProjects/"
+        "deployPath": "/home/kavakuo/GitProjects/",
+
+        # optional, settings for provider API calls
+        "http": {
+            "timeout": 10,
+            "retries": 3,
+            "backoff": 0.5,
+            "poolSize": 10
+        }
     },
 
 
@@ -38,6 +76,17 @@ CONFIG = {
             ".Releases":True
         },
 
+        # optional, share one bare mirror between all branch working copies (default: False)
+        # working copies borrow the objects of the mirror, don't prune or remove it while they exist
+        "mirror": False,
+
+        # optional, reduced first-time clones (can't be combined with 'mirror')
+        # "clone": {
+        #     "depth": 1,
+        #     "singleBranch": True,
+        #     "filter": "blob:none"
+        # },
+
         # only required, if defaultAPI is not set
         "api":"API_NAME",
     },
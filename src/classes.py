@@ -1,19 +1,26 @@
 # coding=utf-8
 
 from utils import logger
-import requests, os
+import requests, os, re, threading, time
 import requests.auth
 from context import CONTEXT
+from client import clientFor
+from metrics import METRICS
 
 LOGGER = logger.logging.Logger("logger")
 
+# flags of a pattern without inline flags
+_DEFAULT_FLAGS = re.compile("").flags
+
 
 
 
 class APISettings(object):
-    def __init__(self, apiName):
+    def __init__(self, apiName, config=None):
         self.apiName = apiName
-        self.rawApiSettings = CONTEXT.CONFIG.get(self.apiName) if CONTEXT.CONFIG.get(self.apiName) else dict()
+        # snapshot of the configuration for the whole request, a reload in between replaces CONTEXT.CONFIG
+        self.config = CONTEXT.CONFIG if config is None else config
+        self.rawApiSettings = self.config.get(self.apiName) if self.config.get(self.apiName) else dict()
         self.baseUrl = self.rawApiSettings.get("baseUrl")
         self.deployPath = self.rawApiSettings.get("deployPath")
         
@@ -22,6 +29,8 @@ class APISettings(object):
         self.username = self.rawApiSettings.get("username")
         self.hmacSecret = self.rawApiSettings.get("hmacSecret")
         self.invalidCredentials = False
+        self.releaseCacheTTL = self.rawApiSettings.get("releaseCacheTTL", 300)
+        self.apiUrl = self.rawApiSettings.get("apiUrl", "https://api.github.com").rstrip("/")
         
         # Gitlab special
         self.secret = self.rawApiSettings.get("secret")
@@ -41,11 +50,49 @@ class APISettings(object):
         return True
 
 
+class ReleaseCache(object):
+    def __init__(self):
+        """
+        Process wide cache of latest release tags, keyed by (username, repoName).
+        Entries older than the TTL are revalidated with their ETag, a 304 response doesn't count against the API rate limit.
+        """
+
+        self._lock = threading.Lock()
+        self._entries = dict()
+
+    def get(self, key):
+        """
+        :return: (tagName, etag, expiry timestamp) or None
+        """
+
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key, tagName, etag, ttl):
+        with self._lock:
+            self._entries[key] = (tagName, etag, time.time() + ttl)
+
+    def isFresh(self, key):
+        entry = self.get(key)
+        return bool(entry) and entry[2] > time.time()
+
+    def invalidate(self, key):
+        # keep the etag, the next lookup revalidates
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries[key] = (entry[0], entry[1], 0)
+
+
+RELEASE_CACHE = ReleaseCache()
+
+
 class Release(object):
     def __init__(self, settings, isRelease=False):
         self.latestReleaseTag = None
         self.isRelease = isRelease
         self._tried = False
+        self._lock = threading.Lock()
         self.settings = settings
         
         if self.settings.apiName == "github":
@@ -62,6 +109,11 @@ class Release(object):
 
         """
         
+        # branches of one event are deployed in parallel and share this object
+        with self._lock, METRICS.stage("release_lookup"):
+            self._getLatestReleaseTag(repoName)
+    
+    def _getLatestReleaseTag(self, repoName):
         if self._tried or not self.isSupported:
             return
         
@@ -73,26 +125,58 @@ class Release(object):
             if not self.settings.username:
                 LOGGER.warning("Username unknown! Take a look at config.py.")
             
-            baseUrl = "https://api.github.com/repos/" + self.settings.username + "/" + repoName
+            client = clientFor(self.settings.apiName, self.settings.config)
+            baseUrl = self.settings.apiUrl + "/repos/" + str(self.settings.username) + "/" + repoName
             url = baseUrl + "/releases/latest"
             auth = None
             if self.settings.username and self.settings.accessToken:
                 auth = requests.auth.HTTPBasicAuth(self.settings.username, self.settings.accessToken)
             
-            resp = requests.get(url, auth=auth).json()
-            self.latestReleaseTag = resp.get("tag_name")
+            cacheKey = (self.settings.username, repoName)
+            cached = RELEASE_CACHE.get(cacheKey)
+            resp = None
             
-            if CONTEXT.TESTING:
-                # manual overriding for tests because requests can fail (GitHub API Limit)
-                self.latestReleaseTag = "dev22"
+            if cached and RELEASE_CACHE.isFresh(cacheKey):
+                self.latestReleaseTag = cached[0]
+            else:
+                headers = {"If-None-Match": cached[1]} if cached and cached[1] else None
+                try:
+                    resp = client.get(url, auth=auth, headers=headers)
+                except requests.RequestException as e:
+                    LOGGER.critical("GitHub API request failed: " + str(e))
+                    if cached:
+                        # API unavailable, the last known release is better than none
+                        self.latestReleaseTag = cached[0]
                 
-                if CONTEXT.CONFIG["github"]["username"] != "Kavakuo":
-                    self.latestReleaseTag = None
-                    self.settings.invalidCredentials = True
+                if resp is not None and resp.status_code == 304:
+                    # release unchanged
+                    self.latestReleaseTag = cached[0]
+                    RELEASE_CACHE.set(cacheKey, cached[0], cached[1], self.settings.releaseCacheTTL)
+                elif resp is not None and resp.status_code == 200:
+                    try:
+                        self.latestReleaseTag = resp.json().get("tag_name")
+                    except ValueError as e:
+                        LOGGER.critical("GitHub API returned an invalid release: " + str(e))
+                        resp = None
+                        if cached:
+                            self.latestReleaseTag = cached[0]
+                    
+                    if self.latestReleaseTag and resp is not None:
+                        RELEASE_CACHE.set(cacheKey, self.latestReleaseTag, resp.headers.get("ETag"), self.settings.releaseCacheTTL)
+                elif resp is not None and resp.status_code not in (401, 403, 404):
+                    # server error after all retries, same as an unavailable API
+                    LOGGER.critical("GitHub API request failed with status " + str(resp.status_code))
+                    resp = None
+                    if cached:
+                        self.latestReleaseTag = cached[0]
             
-            elif not self.latestReleaseTag:
+            if not self.latestReleaseTag and resp is not None:
                 # testing credentials
-                resp = requests.get(baseUrl, auth=auth).json()
+                try:
+                    resp = client.get(baseUrl, auth=auth).json()
+                except (requests.RequestException, ValueError) as e:
+                    LOGGER.critical("GitHub API request failed: " + str(e))
+                    resp = {"name": None}
                 
                 if not resp.get("name"):
                     # invalid accessToken
@@ -125,15 +209,230 @@ class DeployInfo(object):
         
         self.gitUrl = os.path.join(settings.baseUrl, repoName + ".git")
         self.branchName = branchName
-        self.pullBranch = self.branchName
+        self.pullBranch = DeployInfo.pullBranchFor(branchName)
         self.repoName = repoName
         self.settings = settings
         
         if branchName[0] == ".":
-            self.pullBranch = "master"
             self.repoPath = os.path.join(settings.deployPath, repoName + "-" + branchName[1:])
         
         self.repoPath = os.path.realpath(self.repoPath)
+        self.deployedShaPath = os.path.join(self.repoPath, ".git", "DEPLOYED_HEAD")
+    
+    @staticmethod
+    def pullBranchFor(branchName):
+        # branch names with a leading '.' are based on master
+        return "master" if branchName[0] == "." else branchName
+    
+    def deployedSha(self):
+        # commit of the last successful deploy of this working copy
+        try:
+            with open(self.deployedShaPath, "r") as a:
+                return a.read().strip()
+        except (IOError, OSError):
+            return None
+    
+    def setDeployedSha(self, sha):
+        with open(self.deployedShaPath, "w") as a:
+            a.write(sha + "\n")
+
+
+class BranchDecision(object):
+    def __init__(self, branch, pullBranch, notWhitelisted, blacklisted, releaseOnly, tagsOnly):
+        self.branch = branch
+        self.pullBranch = pullBranch
+        self.notWhitelisted = notWhitelisted
+        self.blacklisted = blacklisted
+        self.allowed = not notWhitelisted and not blacklisted
+        self.releaseOnly = releaseOnly
+        self.tagsOnly = tagsOnly
+
+    def toDict(self):
+        return {
+            "branch": self.branch,
+            "pullBranch": self.pullBranch,
+            "allowed": self.allowed,
+            "notWhitelisted": self.notWhitelisted,
+            "blacklisted": self.blacklisted,
+            "releaseOnly": self.releaseOnly,
+            "tagsOnly": self.tagsOnly
+        }
+
+
+class BranchPolicy(object):
+    def __init__(self, repoConfig):
+        """
+        White-/blacklists and releasesOnly/tagsOnly modes of a repo, compiled once per config load.
+
+        :param repoConfig: repo dictionary of the configuration or None
+        :type repoConfig: dict
+        """
+
+        self.configured = bool(repoConfig)
+        repoConfig = repoConfig if repoConfig else dict()
+
+        self._whitelist = self._compile(repoConfig.get("whitelistedBranches"))
+        self._blacklist = self._compile(repoConfig.get("blacklistedBranches"))
+
+        self.releasesOnlyBranches = self._modeBranches(repoConfig.get("releasesOnly"))
+        self.tagsOnlyBranches = self._modeBranches(repoConfig.get("tagsOnly"))
+        self._releasesOnly = frozenset(self.releasesOnlyBranches)
+        self._tagsOnly = frozenset(self.tagsOnlyBranches)
+
+        self._decisions = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return None
+
+        compiled = list(map(re.compile, patterns))
+        if any(map(lambda x: x.groups > 0 or x.flags != _DEFAULT_FLAGS, compiled)):
+            # group numbers would shift and inline flags like (?i) would apply to all patterns
+            # in a combined pattern, match one by one
+            return compiled
+
+        try:
+            return [re.compile("|".join(map(lambda x: "(?:%s)" % x, patterns)))]
+        except re.error:
+            return compiled
+
+    @staticmethod
+    def _modeBranches(modeConfig):
+        # bool applies to master, dictionaries enable the mode per branch
+        if type(modeConfig) == bool:
+            return ["master"] if modeConfig else []
+        elif type(modeConfig) == dict:
+            return list(map(lambda x: x[0], filter(lambda x: x[1], modeConfig.items())))
+        return []
+
+    @staticmethod
+    def _matches(patterns, branch):
+        return bool(patterns) and any(map(lambda x: x.match(branch), patterns))
+
+    def evaluate(self, branch):
+        """
+        :param branch: branch name as used in the request (may have a leading '.')
+        :type branch: str
+
+        :rtype: BranchDecision
+        """
+
+        decision = self._decisions.get(branch)
+        if decision:
+            return decision
+
+        pullBranch = DeployInfo.pullBranchFor(branch)
+        if self.configured:
+            decision = BranchDecision(branch, pullBranch,
+                                      notWhitelisted=not self._matches(self._whitelist, pullBranch),
+                                      blacklisted=self._matches(self._blacklist, pullBranch),
+                                      releaseOnly=branch in self._releasesOnly,
+                                      tagsOnly=branch in self._tagsOnly)
+        else:
+            decision = BranchDecision(branch, pullBranch, False, False, False, False)
+
+        with self._lock:
+            if len(self._decisions) > 1000:
+                self._decisions.clear()
+            self._decisions[branch] = decision
+
+        return decision
+
+
+_policies = {"config": None, "policies": dict()}
+_policiesLock = threading.Lock()
+
+
+def policyFor(repoName, config=None):
+    """
+    Compiled BranchPolicy of *repoName*, rebuilt whenever CONTEXT.CONFIG is replaced.
+
+    :param config: configuration snapshot of the request, default is CONTEXT.CONFIG
+    :type config: dict
+
+    :rtype: BranchPolicy
+    """
+
+    config = CONTEXT.CONFIG if config is None else config
+    with _policiesLock:
+        if _policies["config"] is not config:
+            _policies["config"] = config
+            _policies["policies"] = dict()
+
+        policy = _policies["policies"].get(repoName)
+        if not policy:
+            policy = BranchPolicy((config or dict()).get(repoName))
+            _policies["policies"][repoName] = policy
+
+        return policy
+
+
+class CloneOptions(object):
+    def __init__(self, repoName, config=None):
+        """
+        Shallow, single branch and partial clone options of a repo (`clone` key in repo configuration).
+
+        :param repoName: name of the repository
+        :type repoName: str
+
+        :param config: configuration snapshot of the request, default is CONTEXT.CONFIG
+        :type config: dict
+        """
+
+        repoConfig = (CONTEXT.CONFIG if config is None else config).get(repoName)
+        cloneConfig = repoConfig.get("clone") if repoConfig else None
+        cloneConfig = cloneConfig if cloneConfig else dict()
+
+        self.depth = cloneConfig.get("depth")
+        self.singleBranch = cloneConfig.get("singleBranch")
+        self.filter = cloneConfig.get("filter")
+
+    def isReduced(self):
+        # the working copy may miss history or tags
+        return bool(self.depth or self.singleBranch)
+
+    def cloneArgs(self, branch, gitUrl):
+        args = ["git", "clone"]
+        if self.depth:
+            args.append("--depth=%d" % self.depth)
+        if self.singleBranch:
+            args.append("--single-branch")
+        elif self.singleBranch is not None or self.depth:
+            # --depth implies --single-branch
+            args.append("--no-single-branch")
+        if self.filter:
+            args.append("--filter=" + self.filter)
+
+        return args + ["-b", branch, gitUrl, "."]
+
+    def fetchArgs(self):
+        # keep the working copy as shallow as it was cloned
+        if self.depth:
+            return ["git", "fetch", "--depth=%d" % self.depth]
+        return ["git", "fetch"]
+
+    def tagFetchArgs(self):
+        # tags of other branches or outside the shallow history are missing, fetch only them
+        args = ["git", "fetch", "--tags"]
+        if self.depth:
+            args.append("--depth=%d" % self.depth)
+        return args
+
+    def tagRefFetchArgs(self, remote, tag):
+        # only the ref of one tag, e.g. for tag events
+        args = ["git", "fetch"]
+        if self.depth:
+            args.append("--depth=%d" % self.depth)
+        return args + [remote, "+refs/tags/%s:refs/tags/%s" % (tag, tag)]
+
+    def shaFetchArgs(self, remote, sha, branch):
+        # only the commit of a push event, the remote branch is moved to it
+        args = ["git", "fetch"]
+        if self.depth:
+            args.append("--depth=%d" % self.depth)
+        return args + [remote, "+%s:refs/remotes/origin/%s" % (sha, branch)]
 
 
 class TEST_SEQs(object):
@@ -147,6 +446,7 @@ class TEST_SEQs(object):
     dl_whQueryNotAllowed = dl_unhandledReleaseEvent = dl_autoDeployConfigDisabled = dl_autoDeployFileDisabled = dl_autoDeployConfigDisabledOW = dl_autoDeployFileDisabledOW = 1
     dl_releaseOnlyRelUnknown = dl_releaseOnlyRelUnknownOW = dl_releaseOnlyNoRelease = 1
     dl_tagRequiredNoTag = dl_tagRequiredNoTagOW = 1
+    dl_outdatedPush = dl_outdatedPushOW = 1
     dl_releaseNotSupported = 1
     
     # after pulling, tags
@@ -157,7 +457,7 @@ class TEST_SEQs(object):
     dl_checkoutFailed = dl_checkoutPathNotAvailable = 1
     
     # overall
-    dl_deploySuccess = 1
+    dl_deploySuccess = dl_nothingToDo = dl_nothingToDoOW = 1
     
     
 # every class attribute is set to its name
@@ -0,0 +1,77 @@
+# coding=utf-8
+from context import CONTEXT
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import requests, threading
+
+DEFAULT_HTTP_CONFIG = {
+    "timeout": 10,
+    "retries": 3,
+    "backoff": 0.5,
+    "poolSize": 10
+}
+
+_clients = dict()
+_clientsLock = threading.Lock()
+
+
+class APIClient(object):
+    def __init__(self, httpConfig=None):
+        """
+        Pooled HTTP session for provider API calls with keep-alive, timeouts and retries.
+
+        :param httpConfig: `http` dictionary of an API configuration, missing keys use DEFAULT_HTTP_CONFIG
+        :type httpConfig: dict
+        """
+
+        config = dict(DEFAULT_HTTP_CONFIG)
+        config.update(httpConfig or dict())
+
+        self.timeout = config["timeout"]
+        self.retries = config["retries"]
+        self.backoff = config["backoff"]
+        self.poolSize = config["poolSize"]
+
+        # retry connection errors and server errors with exponential backoff
+        retry = Retry(total=self.retries, backoff_factor=self.backoff, status_forcelist=[500, 502, 503, 504], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.poolSize, pool_maxsize=self.poolSize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def clientFor(apiName, config=None):
+    """
+    Shared client of an API configuration. The client is rebuilt, if its `http` configuration changes.
+
+    :param apiName: github, gitlab or bitbucket
+    :type apiName: str
+
+    :param config: configuration snapshot of the request, default is CONTEXT.CONFIG
+    :type config: dict
+
+    :rtype: APIClient
+    """
+
+    apiConfig = (CONTEXT.CONFIG if config is None else config).get(apiName) or dict()
+    httpConfig = apiConfig.get("http") or dict()
+    key = tuple(sorted(httpConfig.items()))
+
+    with _clientsLock:
+        cached = _clients.get(apiName)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        # other threads may still use the replaced client, its session is closed once it is garbage collected
+        client = APIClient(httpConfig)
+        _clients[apiName] = (key, client)
+
+    return client
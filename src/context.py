@@ -5,7 +5,7 @@ from utils import logger
 import sys, os
 projectFolder = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, projectFolder)
-import config, hashlib
+import config, hashlib, threading, queue, atexit
 from copy import copy
 import validateConfig
 
@@ -51,8 +51,10 @@ class __Context(object):
         self.TESTING = False
         self.DEBUG = False
         self.TEST_SEQUENCE = set()
+        self.TEST_SEQ_OBSERVERS = []
         self.LOGGER = logger.loggerWithName("Deployment")
         self.MAIL_HANDLER = None
+        self.LOG_LISTENER = None
         
         self.CONFIG = config.CONFIG
         self.PROJECT_FOLDER = projectFolder
@@ -61,7 +63,9 @@ class __Context(object):
         self.PROTECTION_COOKIE = None
         
         self.configPath = os.path.join(self.PROJECT_FOLDER, "config.py")
+        self.configStat = self._statConfig()
         self.configHash = self._calcConfigHash()
+        self._reloadLock = threading.Lock()
         
         # validate CONFIG
         if "github" not in self.CONFIG and "gitlab" not in self.CONFIG and "bitbucket" not in self.CONFIG:
@@ -72,6 +76,7 @@ class __Context(object):
             self.DEBUG = True
             
         self._configureLogger()
+        atexit.register(self._stopLogging)
         self._validateConfigFile()
         self._loadProtection()
         
@@ -81,35 +86,73 @@ class __Context(object):
         logPath = os.path.join(self.PROJECT_FOLDER, "Logs", "log.log")
         os.makedirs(os.path.join(self.PROJECT_FOLDER, "Logs"), exist_ok=True)
         
-        while len(self.LOGGER.handlers) > 0:
-            self.LOGGER.handlers.remove(self.LOGGER.handlers[0])
-        
         STREAM_HANDLER = logger.StreamHandler(sys.stdout)
-        self.LOGGER.addHandler(logger.configureHandler(_CustomWatchedFileHandler(logPath, encoding="utf-8"), _CustomFormatter()))
-        self.LOGGER.addHandler(logger.configureHandler(STREAM_HANDLER, logger.logging.Formatter()))
-        self.LOGGER.setLevel(logger.logging.DEBUG)
+        handlers = [
+            logger.configureHandler(_CustomWatchedFileHandler(logPath, encoding="utf-8"), _CustomFormatter()),
+            logger.configureHandler(STREAM_HANDLER, logger.logging.Formatter())
+        ]
         
+        mailHandler = None
         if not self.DEBUG and "mailLogger" in self.CONFIG and not self.TESTING:
-            self.MAIL_HANDLER = logger.configureHandler(self.CONFIG["mailLogger"], logger.PNMailLogFormatter(), logLevel=logger.logging.CRITICAL)
-            self.LOGGER.addHandler(self.MAIL_HANDLER)
+            # critical logs and success messages are collected and sent as digest
+            digest = self.CONFIG.get("mailDigest") or dict()
+            mailHandler = logger.DigestMailHandler(self.CONFIG["mailLogger"], window=digest.get("window", 60),
+                                                   maxMails=digest.get("maxMails", 10), maxRecords=digest.get("maxRecords", 100))
+            logger.configureHandler(mailHandler, logger.PNMailLogFormatter(), logLevel=logger.logging.INFO)
+            mailHandler.addFilter(logger.MailFilter())
+            if self.MAIL_HANDLER:
+                mailHandler.takeOver(self.MAIL_HANDLER)
+            handlers.append(mailHandler)
+        
+        # log calls only enqueue the record, a listener thread writes files and sends mails
+        listener = logger.QueueListener(queue.Queue(), *handlers, respect_handler_level=True)
+        listener.start()
+        
+        oldListener = self.LOG_LISTENER
+        
+        # swap all handlers at once, concurrent log calls never see a logger without handlers
+        self.LOGGER.handlers = [logger.QueueHandler(listener.queue)]
+        self.LOGGER.setLevel(logger.logging.DEBUG)
+        self.LOG_LISTENER = listener
+        self.MAIL_HANDLER = mailHandler
+        
+        if oldListener:
+            self._stopListener(oldListener)
+    
+    @staticmethod
+    def _stopListener(listener):
+        # handles queued records before closing the handlers
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    
+    def _stopLogging(self):
+        if self.LOG_LISTENER:
+            self._stopListener(self.LOG_LISTENER)
+            self.LOG_LISTENER = None
 
 
     def _loadProtection(self):
-        protection = self.CONFIG.get("protection")
+        self.PROTECTION, self.PROTECTION_COOKIE = self._parseProtection(self.CONFIG)
+    
+    def _parseProtection(self, CONFIG):
+        rawProtection = CONFIG.get("protection")
+        protection = None
+        protectionCookie = None
         
-        if protection:
-            username = protection.get("username")
-            password = protection.get("password")
-            cookie = protection.get("cookie")
+        if rawProtection:
+            username = rawProtection.get("username")
+            password = rawProtection.get("password")
+            cookie = rawProtection.get("cookie")
             if not username or not password:
                 # invalid configuration
                 if not cookie:
                     self.LOGGER.critical("Invalid 'protection' dictonary, username or password is missing.")
                 else:
                     self.LOGGER.warning("Invalid 'protection' dictonary, username or password is missing.")
-                self.PROTECTION = None
+                protection = None
             else:
-                self.PROTECTION = protection
+                protection = rawProtection
                 
             if cookie:
                 cookieVal = cookie.get("value")
@@ -117,23 +160,28 @@ class __Context(object):
                 
                 if not cookieVal or not cookieName:
                     # invalid cookie configuration
-                    if not self.PROTECTION:
+                    if not protection:
                         self.LOGGER.critical("Invalid 'protection' cookie dictionary, name or value is missing.")
                     else:
                         self.LOGGER.warning("Invalid 'protection' cookie dictionary, name or value is missing.")
                         
-                    self.PROTECTION_COOKIE = None
+                    protectionCookie = None
                 else:
-                    self.PROTECTION_COOKIE = cookie
+                    protectionCookie = cookie
                     
-            if self.PROTECTION and not self.PROTECTION_COOKIE:
+            if protection and not protectionCookie:
                 self.LOGGER.info("Authentication for manual deployment only possible with username/password")
-            elif self.PROTECTION_COOKIE and not self.PROTECTION:
+            elif protectionCookie and not protection:
                 self.LOGGER.info("Authentication for manual deployment only possible with cookie")
         else:
-            self.PROTECTION = None
-            self.PROTECTION_COOKIE = None
+            protection = None
+            protectionCookie = None
         
+        return protection, protectionCookie
+    
+    def _statConfig(self):
+        st = os.stat(self.configPath)
+        return st.st_mtime_ns, st.st_size, st.st_ino
     
     def _calcConfigHash(self):
         with open(self.configPath, "rb") as a:
@@ -142,7 +190,17 @@ class __Context(object):
             
             
     def _configNeedsReload(self):
-        return self.configHash != self._calcConfigHash()
+        # cheap stat check first, only hash the file if it was touched
+        configStat = self._statConfig()
+        if configStat == self.configStat:
+            return False
+        
+        configHash = self._calcConfigHash()
+        if configHash == self.configHash:
+            self.configStat = configStat
+            return False
+        
+        return True
         
     def _validateConfigFile(self):
         validateConfig.LOGGER = self.LOGGER
@@ -156,19 +214,41 @@ class __Context(object):
     def addTestSeq(self, seq):
         assert seq != 1
         
+        # outcomes are counted in production as well (metrics)
+        for observer in self.TEST_SEQ_OBSERVERS:
+            observer(seq)
+        
         if self.TESTING:
             self.TEST_SEQUENCE.add(seq)
 
     def reloadCONFIG(self):
-        if self._configNeedsReload():
-            self.configHash = self._calcConfigHash()
+        if not self._configNeedsReload():
+            return
+        
+        with self._reloadLock:
+            # another request may have reloaded the config in the meantime
+            if not self._configNeedsReload():
+                return
+            
+            configStat = self._statConfig()
+            configHash = self._calcConfigHash()
             
             self.LOGGER.debug("reload config")
-            reload(config)
-            self.CONFIG = config.CONFIG
-            self._validateConfigFile()
+            try:
+                reload(config)
+                validateConfig.LOGGER = self.LOGGER
+                validateConfig.main()
+            except Exception as e:
+                # keep the current config, the file is checked again after the next change
+                self.configStat, self.configHash = configStat, configHash
+                self.LOGGER.critical("Reloading config file failed, keep using the previous configuration: %s" % str(e))
+                return
+            
+            protection, protectionCookie = self._parseProtection(config.CONFIG)
             
-            self._loadProtection()
+            # swap the new configuration in at once
+            self.CONFIG, self.PROTECTION, self.PROTECTION_COOKIE = config.CONFIG, protection, protectionCookie
+            self.configStat, self.configHash = configStat, configHash
             self._configureLogger()
 
 
@@ -0,0 +1,137 @@
+# coding=utf-8
+from context import CONTEXT
+from collections import OrderedDict
+import threading, sqlite3, time, os
+
+
+class Delivery(object):
+    def __init__(self, statusCode, body, contentType, jobId=None, seen=None):
+        self.statusCode = statusCode
+        self.body = body
+        self.contentType = contentType
+        self.jobId = jobId
+        self.seen = seen if seen else time.time()
+
+
+class DeliveryCache(object):
+    def __init__(self):
+        """
+        Bounded LRU/TTL cache of webhook delivery ids and the response of their first delivery.
+        Entries are persisted in a small sqlite database, so redeliveries are detected across restarts.
+        """
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._pending = dict()
+        self._db = None
+        self._dbPath = None
+
+    @staticmethod
+    def _config():
+        config = CONTEXT.CONFIG.get("deliveries") or dict()
+        path = config.get("path") or os.path.join(CONTEXT.PROJECT_FOLDER, "Logs", "deliveries.sqlite")
+        return path, config.get("maxEntries", 1000), config.get("ttl", 86400)
+
+    def _open(self, path, ttl):
+        # (re)load the store, if the configured path changed
+        if self._dbPath == path:
+            return
+
+        if self._db:
+            self._db.close()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS deliveries (key TEXT PRIMARY KEY, statusCode INTEGER, body TEXT, contentType TEXT, jobId TEXT, seen REAL)")
+        self._db.execute("DELETE FROM deliveries WHERE seen < ?", (time.time() - ttl,))
+        self._db.commit()
+        self._dbPath = path
+
+        self._entries = OrderedDict()
+        for row in self._db.execute("SELECT key, statusCode, body, contentType, jobId, seen FROM deliveries ORDER BY seen"):
+            self._entries[row[0]] = Delivery(*row[1:])
+
+    def _trim(self, maxEntries, ttl):
+        expired = time.time() - ttl
+        removed = []
+        for key in list(self._entries.keys()):
+            if len(self._entries) > maxEntries or self._entries[key].seen < expired:
+                del self._entries[key]
+                removed.append((key,))
+            else:
+                break
+
+        if removed:
+            self._db.executemany("DELETE FROM deliveries WHERE key = ?", removed)
+            self._db.commit()
+
+    def begin(self, key):
+        """
+        Claims a delivery id. Concurrent duplicates wait until the first delivery finished,
+        if it finished without a result, the next waiter claims the id.
+
+        :param key: e.g. "github:<X-GitHub-Delivery>"
+        :type key: str
+
+        :return: Delivery of the first request for duplicates, None for new deliveries
+        :rtype: Delivery
+        """
+
+        path, maxEntries, ttl = self._config()
+        with self._lock:
+            self._open(path, ttl)
+            self._trim(maxEntries, ttl)
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry:
+                    self._entries.move_to_end(key)
+                    return entry
+
+                pending = self._pending.get(key)
+                if not pending:
+                    self._pending[key] = threading.Event()
+                    return None
+
+            # the first delivery failed without a result, if nothing is stored afterwards,
+            # one waiter takes over the claim and the others wait for it
+            pending.wait()
+
+    def finish(self, key, delivery):
+        """
+        Stores the result of a claimed delivery, *delivery* None forgets the claim (e.g. after a crash).
+
+        :type delivery: Delivery
+        """
+
+        with self._lock:
+            if delivery:
+                self._entries[key] = delivery
+                self._entries.move_to_end(key)
+                self._db.execute("INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?, ?, ?, ?)",
+                                 (key, delivery.statusCode, delivery.body, delivery.contentType, delivery.jobId, delivery.seen))
+                self._db.commit()
+
+            pending = self._pending.pop(key, None)
+
+        if pending:
+            pending.set()
+
+    def forget(self, key):
+        # e.g. the deploy of the delivery failed, a redelivery deploys again
+        with self._lock:
+            if self._entries.pop(key, None) and self._db:
+                self._db.execute("DELETE FROM deliveries WHERE key = ?", (key,))
+                self._db.commit()
+
+    def clear(self):
+        path, maxEntries, ttl = self._config()
+        with self._lock:
+            self._open(path, ttl)
+            self._entries = OrderedDict()
+            self._db.execute("DELETE FROM deliveries")
+            self._db.commit()
+
+
+DELIVERIES = DeliveryCache()
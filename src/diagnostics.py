@@ -0,0 +1,106 @@
+# coding=utf-8
+from context import CONTEXT
+from functions import call, addOutput
+from concurrent.futures import ThreadPoolExecutor
+import threading, shutil, time, os, pwd, sys
+
+DEFAULT_TTL = 300
+
+
+def _which(name):
+    # like `which`, without a process
+    path = shutil.which(name)
+    return (path, False) if path else ("", True)
+
+
+def _whoami():
+    try:
+        return pwd.getpwuid(os.geteuid()).pw_name, False
+    except KeyError:
+        return "cannot find name for user ID %d" % os.geteuid(), True
+
+
+# name shown at /info, probe returning (output, error)
+PROBES = [
+    ("which git", lambda: _which("git")),
+    ("git --version", lambda: call(["git", "--version"])),
+    ("whoami", _whoami),
+    ("git config --global -l", lambda: call(["git", "config", "--global", "-l"])),
+    ("which python", lambda: _which("python")),
+    ("which python3", lambda: _which("python3")),
+]
+
+
+class Diagnostics(object):
+    def __init__(self, ttl=DEFAULT_TTL):
+        """
+        Environment probes of the /info endpoint. The probes are independent and run concurrently,
+        their results are cached for *ttl* seconds.
+
+        :param ttl: seconds until the probes run again
+        :type ttl: float
+        """
+
+        self.ttl = ttl
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._results = None
+        self._expires = 0
+
+    def probes(self):
+        """
+        :return: (name, output, error) of every probe
+        :rtype: list
+        """
+
+        # concurrent requests wait for one refresh
+        with self._lock:
+            if self._results is None or time.time() >= self._expires:
+                with ThreadPoolExecutor(max_workers=len(PROBES)) as executor:
+                    results = list(executor.map(lambda x: x[1](), PROBES))
+                self._results = list(map(lambda x: (x[0][0],) + tuple(x[1]), zip(PROBES, results)))
+                self._expires = time.time() + self.ttl
+
+            return self._results
+
+    def invalidate(self):
+        with self._lock:
+            self._results = None
+
+    def report(self):
+        """
+        Probe results followed by sys.path and the environment, formatted like deploy output.
+
+        :rtype: str
+        """
+
+        output = "".join(map(lambda x: addOutput("[+] " + x[0], x[1], x[2]), self.probes()))
+        output += "[+] current sys.path:\n" + "\n".join(map(lambda x: "    %s" % x, sys.path)) + "\n\n"
+        return output
+
+    @staticmethod
+    def environment():
+        return addOutput("[+] env", "\n".join(map(lambda x: "%s=%s" % x, sorted(os.environ.items()))), False)
+
+    def health(self):
+        """
+        Status for frequent health checks, never spawns a process.
+        The git version is only known, if /info ran before.
+
+        :rtype: dict
+        """
+
+        results = self._results
+        gitVersion = None
+        if results:
+            output, error = dict(map(lambda x: (x[0], x[1:]), results))["git --version"]
+            gitVersion = output.strip().replace("git version ", "") if not error else None
+
+        return {
+            "status": "ok" if CONTEXT.CONFIG else "unconfigured",
+            "uptime": round(time.time() - self.started, 3),
+            "git": gitVersion
+        }
+
+
+DIAGNOSTICS = Diagnostics()
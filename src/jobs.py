@@ -0,0 +1,363 @@
+# coding=utf-8
+from context import CONTEXT
+from flask import has_request_context, copy_current_request_context
+from functions import gitHost
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading, queue, uuid, time
+
+
+class DeployJob(object):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+    def __init__(self, name, func):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.func = func
+        self.status = DeployJob.QUEUED
+        self.statusCode = None
+        self.output = ""
+        self.response = None
+        self.wasQueued = False
+
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+        self._callbacks = []
+        self._callbacksLock = threading.Lock()
+
+    def run(self):
+        self.status = DeployJob.RUNNING
+        self.started = time.time()
+
+        try:
+            self.response = self.func()
+            self.statusCode = self.response.status_code
+            self.output = self.response.get_data(as_text=True)
+            self.status = DeployJob.FINISHED if self.statusCode < 400 else DeployJob.FAILED
+        except Exception as e:
+            CONTEXT.LOGGER.critical("Deploy job '%s' (%s) crashed: %s" % (self.name, self.id, str(e)))
+            self.statusCode = 500
+            self.output = "Deploy job crashed: " + str(e)
+            self.status = DeployJob.FAILED
+        finally:
+            # drop the closure, it holds the request context
+            self.func = None
+            self.finished = time.time()
+            with self._callbacksLock:
+                self.done.set()
+                callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback(self)
+
+    def onDone(self, callback):
+        """
+        *callback* is called with the job after it finished, immediately if it finished already.
+
+        :type callback: callable
+        """
+
+        with self._callbacksLock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def toDict(self):
+        trace = getattr(self.response, "deployTrace", None)
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "statusCode": self.statusCode,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "output": self.output,
+            "trace": trace.toDict() if trace else None
+        }
+
+
+class _PendingRun(object):
+    def __init__(self, func):
+        self.func = func
+        self.requests = 1
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class WorkingCopyLocks(object):
+    def __init__(self):
+        """
+        Serializes deploys per working copy. While a deploy for a path is running, further requests
+        for the same path collapse into a single pending run, which executes the newest request.
+        The newest request isn't necessarily the newest event (e.g. late deliveries), `coalesced()` tells
+        the pending run to deploy the current state of its branch instead of the commit of its request.
+        """
+
+        self._mutex = threading.Lock()
+        self._locks = dict()
+        self._pending = dict()
+        self._local = threading.local()
+
+    def run(self, path, func, variant=None):
+        """
+        :param path: working copy path, used as lock key
+        :type path: str
+
+        :param func: deploy callable
+        :type func: callable
+
+        :param variant: requests are only coalesced if their variants are equal (e.g. the requested tag)
+        :type variant: hashable
+
+        :return: result of *func* or of the newer request it was coalesced with
+        """
+
+        key = (path, variant)
+        with self._mutex:
+            lock = self._locks.setdefault(path, threading.Lock())
+            pending = self._pending.get(key)
+
+            if pending:
+                # a run is already waiting for this working copy, let it deploy the newest request
+                pending.func = func
+                pending.requests += 1
+                joined = True
+            else:
+                pending = _PendingRun(func)
+                self._pending[key] = pending
+                joined = False
+        self._local.joined = joined
+
+        if joined:
+            CONTEXT.LOGGER.debug("deploy request for '" + path + "' coalesced with a pending deploy")
+            pending.done.wait()
+            if pending.error:
+                raise pending.error
+            return pending.result
+
+        with lock:
+            with self._mutex:
+                del self._pending[key]
+                func = pending.func
+            self._local.coalesced = pending.requests > 1
+
+            try:
+                pending.result = func()
+            except Exception as e:
+                pending.error = e
+                raise
+            finally:
+                self._local.coalesced = False
+                pending.done.set()
+
+        return pending.result
+
+    def joined(self):
+        """
+        :return: if the last `run()` of the current thread was coalesced into a run of another thread
+        :rtype: bool
+        """
+
+        return getattr(self._local, "joined", False)
+
+    def coalesced(self):
+        """
+        :return: if the deploy running in the current thread stands for several requests
+        :rtype: bool
+        """
+
+        return getattr(self._local, "coalesced", False)
+
+
+class BranchPool(object):
+    def __init__(self):
+        """
+        Bounded thread pool to deploy several branches of one event in parallel.
+        The number of concurrent deploys per git host is limited as well.
+        """
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._workers = None
+        self._hostLimit = None
+        self._hosts = dict()
+
+    @staticmethod
+    def _config():
+        concurrency = CONTEXT.CONFIG.get("concurrency") or dict()
+        branchWorkers = concurrency.get("branchWorkers")
+        hostLimit = concurrency.get("hostLimit")
+        return 4 if branchWorkers is None else branchWorkers, 2 if hostLimit is None else hostLimit
+
+    def _setup(self):
+        branchWorkers, hostLimit = self._config()
+
+        with self._lock:
+            if self._workers != branchWorkers:
+                # running maps keep submitting to the old executor, its idle threads exit once it is garbage collected
+                self._executor = ThreadPoolExecutor(max_workers=branchWorkers, thread_name_prefix="BranchWorker") if branchWorkers > 0 else None
+                self._workers = branchWorkers
+
+            # rebuild host semaphores if the limit changed
+            if self._hostLimit != hostLimit:
+                self._hosts = dict()
+                self._hostLimit = hostLimit
+
+            return self._executor
+
+    def _hostSemaphore(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(max(self._hostLimit, 1))
+            return self._hosts[host]
+
+    def map(self, func, items, gitUrl):
+        """
+        Calls *func* for every item in parallel.
+
+        :param func: callable taking one item
+        :type func: callable
+
+        :param items: e.g. list of branch names
+        :type items: list
+
+        :param gitUrl: git base url, used for the per host limit
+        :type gitUrl: str
+
+        :return: results in the order of *items*
+        :rtype: list
+        """
+
+        executor = self._setup()
+        semaphore = self._hostSemaphore(gitHost(gitUrl))
+
+        def limited(item):
+            with semaphore:
+                return func(item)
+
+        if not executor or len(items) < 2:
+            return list(map(limited, items))
+
+        futures = []
+        for item in items:
+            task = (lambda x: lambda: limited(x))(item)
+            if has_request_context():
+                task = copy_current_request_context(task)
+            futures.append(executor.submit(task))
+
+        return list(map(lambda x: x.result(), futures))
+
+
+class JobQueue(object):
+    def __init__(self, maxJobs=100):
+        """
+        Runs deploy jobs on a pool of worker threads and keeps the last *maxJobs* jobs for lookup.
+
+        :param maxJobs: number of jobs to remember
+        :type maxJobs: int
+        """
+
+        self.maxJobs = maxJobs
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._workers = 0
+        self._retiring = 0
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def workerCount():
+        concurrency = CONTEXT.CONFIG.get("concurrency") or dict()
+        workers = concurrency.get("deployWorkers")
+        return 2 if workers is None else workers
+
+    def submit(self, name, func):
+        """
+        Queue *func* as deploy job. If no deploy workers are configured, the job runs synchronously.
+
+        :param name: human readable job name
+        :type name: str
+
+        :param func: callable returning a flask Response
+        :type func: callable
+
+        :rtype: DeployJob
+        """
+
+        if has_request_context():
+            func = copy_current_request_context(func)
+
+        job = DeployJob(name, func)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+
+        workers = self.workerCount()
+        self._resize(workers)
+        if workers == 0:
+            job.run()
+        else:
+            job.wasQueued = True
+            self._queue.put(job)
+
+        return job
+
+    def get(self, jobId):
+        with self._lock:
+            return self._jobs.get(jobId)
+    
+    def depth(self):
+        # stop markers of retired workers aren't jobs
+        with self._lock:
+            return max(self._queue.qsize() - self._retiring, 0)
+    
+    def running(self):
+        with self._lock:
+            return len(list(filter(lambda x: x.status == DeployJob.RUNNING, self._jobs.values())))
+
+    def _trim(self):
+        # forget the oldest finished jobs
+        for jobId in list(self._jobs.keys()):
+            if len(self._jobs) <= self.maxJobs:
+                break
+            if self._jobs[jobId].done.is_set():
+                del self._jobs[jobId]
+
+    def _resize(self, count):
+        # follows deployWorkers of the current configuration, surplus workers exit after the jobs queued before
+        with self._lock:
+            self._threads = list(filter(lambda x: x.is_alive(), self._threads))
+            while self._workers < count:
+                self._workers += 1
+                worker = threading.Thread(target=self._work, name="DeployWorker-%d" % self._workers, daemon=True)
+                worker.start()
+                self._threads.append(worker)
+            while self._workers > count:
+                self._workers -= 1
+                self._retiring += 1
+                self._queue.put(None)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    with self._lock:
+                        self._retiring -= 1
+                    return
+                job.run()
+            finally:
+                self._queue.task_done()
+
+
+JOBS = JobQueue()
+WORKING_COPIES = WorkingCopyLocks()
+BRANCHES = BranchPool()
@@ -1,11 +1,19 @@
 # coding=utf-8
 
-from flask import Flask, request, Response
-import hmac, hashlib, os, sys, shutil, json, re
+from flask import Flask, request, Response, copy_current_request_context
+import os, shutil, json, threading, html
 from utils import logger
-from classes import DeployInfo, APISettings, Release, TEST_SEQs
+from classes import DeployInfo, APISettings, Release, CloneOptions, RELEASE_CACHE, TEST_SEQs, policyFor
 from context import CONTEXT
-from functions import call, addOutput
+from functions import call, addOutput, commandConfig, OutputStream, streamOutput, commitSha, isAncestor
+from jobs import JOBS, WORKING_COPIES, BRANCHES
+from mirror import Mirror
+from metrics import METRICS, OTHER_BRANCH
+from tracing import traceDeploy, currentTrace
+from deliveries import DELIVERIES, Delivery
+from signatures import verifierFor, maxBodySize
+from tags import TagIndex
+from diagnostics import DIAGNOSTICS
 from functools import wraps
 
 
@@ -17,6 +25,9 @@ app.logger.setLevel(logger.logging.DEBUG)
 
 contenttype = "text/plain; charset=utf-8"
 
+METRICS.gauge("deployer_job_queue_depth", "Deploy jobs waiting for a worker.", JOBS.depth)
+METRICS.gauge("deployer_jobs_running", "Deploy jobs currently running.", JOBS.running)
+
 LOGGER = CONTEXT.LOGGER
 
 
@@ -36,8 +47,170 @@ def logErrorRespToLevel(resp, level):
     return resp
 
 
+def sendSuccessMail(mailHeader, resp):
+    if resp.status_code == 200 and CONTEXT.MAIL_HANDLER:
+        # marked records pass the mail filter, the mail is part of the next digest
+        LOGGER.info(mailHeader + resp.get_data(as_text=True).strip(), extra={"mail": True})
+
+
+def enqueueDeploy(name, func, mailHeader=None):
+    def runDeploy():
+        resp = logErrorRespToLevel(func(), LOGGER.critical)
+        if mailHeader:
+            sendSuccessMail(mailHeader, resp)
+        return resp
+    
+    job = JOBS.submit(name, runDeploy)
+    if not job.wasQueued:
+        # no deploy workers configured, job already finished
+        if job.response is None:
+            return requestError(job.output, code=500)
+        job.response.jobId = job.id
+        return job.response
+    
+    LOGGER.debug("queued deploy job '" + name + "' with id " + job.id)
+    resp = Response("Deploy job queued with id '" + job.id + "'.\n" +
+                    "Look at /jobs/" + job.id + " for the result.", status=202, content_type=contenttype)
+    resp.jobId = job.id
+    return resp
+
+
+
+def _dropped(repoName, settings, resp, name):
+    # counted per repo, see deployer_dropped_events_total at /metrics and /info
+    METRICS.droppedEvents.inc((settings.apiName, repoName))
+    LOGGER.debug("dropped " + name + " before deploying")
+    logErrorRespToLevel(resp, LOGGER.critical)
+    return resp
+
+
+def preFilterPush(repoName, settings, branch):
+    """
+    Decides from the payload and the compiled branch policy, if a branch push webhook can lead to a deploy.
+    Rejected events get the same response as in _downloadFromGit, without touching disk or network.
+
+    :return: Response for dropped events, None otherwise
+    :rtype: Response
+    """
+
+    if not settings.deployPossible():
+        return None
+
+    with METRICS.labeled(repoName, metricsBranch(repoName, settings, branch)):
+        resp = _preFilterPush(repoName, settings, branch)
+    
+    if resp:
+        return _dropped(repoName, settings, resp, "push event for " + branch + "@" + repoName)
+    
+    return resp
+
+
+def metricsBranch(repoName, settings, branch):
+    """
+    Branch label for metrics, OTHER_BRANCH for branches the policy doesn't deploy (e.g. pushes to throwaway branches).
+
+    :rtype: str
+    """
+
+    return branch if policyFor(repoName, settings.config).evaluate(branch).allowed else OTHER_BRANCH
+
+
+def preFilterTagEvent(repoName, settings, mode):
+    """
+    Like preFilterPush for release (*mode* releasesOnly) and tag events (*mode* tagsOnly),
+    events without a branch in this mode are rejected before they are queued.
+
+    :return: Response for dropped events, None otherwise
+    :rtype: Response
+    """
+
+    if not settings.deployPossible():
+        return None
+
+    branches, resp = eventBranches(repoName, settings, mode)
+    if resp:
+        return _dropped(repoName, settings, resp, ("release" if mode == "releasesOnly" else "tag") + " event for " + repoName)
+    
+    return None
+
+
+def eventBranches(repoName, settings, mode):
+    """
+    Branches of *repoName* in *mode* (releasesOnly or tagsOnly).
+
+    :return: branches, error response if the event can't be deployed
+    :rtype: (list, Response)
+    """
+
+    kind = "release" if mode == "releasesOnly" else "tag"
+    policy = policyFor(repoName, settings.config)
+    if not policy.configured or not settings.config[repoName].get(mode):
+        return [], Response("No " + kind + " event configured for repo '" + repoName + "'!", content_type=contenttype)
+    
+    branches = policy.releasesOnlyBranches if mode == "releasesOnly" else policy.tagsOnlyBranches
+    if len(branches) == 0:
+        return [], requestError("No branch set to " + ("releaseOnly" if mode == "releasesOnly" else "tagsOnly") + " mode. Ignoring this event.", code=500)
+    
+    return branches, None
+
+
+def _preFilterPush(repoName, settings, branch):
+    resp = None
+    if any(map(lambda x: request.args.get(x) and request.args.get(x) != "0", ["force", "ignoreRelease", "ignoreTagDate"])):
+        CONTEXT.addTestSeq(TEST_SEQs.dl_whQueryNotAllowed)
+        resp = requestError("Query parameters to overwrite certain behaviours are not supported when using webhooks!")
+    else:
+        decision = policyFor(repoName, settings.config).evaluate(branch)
+        
+        if decision.releaseOnly and settings.apiName != "github":
+            CONTEXT.addTestSeq(TEST_SEQs.dl_releaseNotSupported)
+            resp = requestError("Release Only branches are not supported for " + settings.apiName + " API!")
+        
+        elif not decision.allowed:
+            CONTEXT.addTestSeq(TEST_SEQs.dl_autoDeployConfigDisabled)
+            resp = Response("Auto deployment for branch ('" + branch + "') in config disabled, add query param 'force=1' to deploy anyway.", content_type=contenttype)
+        
+        elif decision.tagsOnly:
+            CONTEXT.addTestSeq(TEST_SEQs.dl_tagRequiredNoTag)
+            resp = requestError("This branch '" + branch + "' has tagOnly mode enabled.\n" +
+                                "Current event is not a tag create event.\nAborting...", code=200)
+        
+        elif decision.releaseOnly:
+            CONTEXT.addTestSeq(TEST_SEQs.dl_releaseOnlyNoRelease)
+            resp = requestError("This branch '" + branch + "' has releaseOnly mode enabled.\n" +
+                                "Current event is not a release event.\nAborting...", code=200)
+    
+    return resp
+
+
 
-def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False, release=None):
+def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False, release=None, updateMirror=True, sha=None, forcedPush=False):
+    with METRICS.deploy(repoName, metricsBranch(repoName, settings, branch)), traceDeploy(repoName, branch, tag) as trace:
+        def deploy():
+            # coalesced requests may have arrived out of order, deploy the head of the branch instead of the commit of the last one
+            coalesced = WORKING_COPIES.coalesced()
+            resp = _downloadFromGit(repoName, settings, branch=branch, tag=tag, webhook=webhook, release=release, updateMirror=updateMirror,
+                                    sha=None if coalesced else sha, forcedPush=forcedPush and not coalesced)
+            # set before coalesced requests get the response, they share the trace of the run which did the work
+            resp.deployTrace = currentTrace()
+            return resp
+        
+        if not settings.deployPossible():
+            resp = deploy()
+        else:
+            # one deploy per working copy at a time, redundant requests are coalesced
+            repoPath = DeployInfo(settings, repoName, branch).repoPath
+            # the commit of an event isn't part of the variant, a coalesced run deploys the branch head
+            variant = (tag, webhook, tuple(sorted(request.args.items())))
+            resp = WORKING_COPIES.run(repoPath, deploy, variant)
+            # the waiting request didn't run any command, its trace would be empty
+            trace.discarded = WORKING_COPIES.joined()
+        
+        trace.finish(resp.status_code)
+        return resp
+
+
+def _downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False, release=None, updateMirror=True, sha=None, forcedPush=False):
     if not release:
         release = Release(settings)
 
@@ -63,49 +236,21 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
     
 
     # evaluate CONFIG
-    stop = False
-    releaseOnly = False
-    tagsOnly = False
-
-    repoConfig = None
-    if CONTEXT.CONFIG and CONTEXT.CONFIG.get(repoName):
-        repoConfig = CONTEXT.CONFIG[repoName]
+    policy = policyFor(repoName, settings.config)
 
-    if not repoConfig and release.isRelease:
+    if not policy.configured and release.isRelease:
         CONTEXT.addTestSeq(TEST_SEQs.dl_unhandledReleaseEvent)
         return requestError("Release event could not be handled for repo '"+repoName+"'!")
 
+    decision = policy.evaluate(branch)
+    stop = not decision.allowed
+    releaseOnly = decision.releaseOnly
+    tagsOnly = decision.tagsOnly
 
-    if repoConfig:
-        # white/blacklists
-        whitelist = repoConfig.get("whitelistedBranches")
-        blacklist = repoConfig.get("blacklistedBranches")
-        matchWhitelist = list(filter(lambda x: re.compile(x).match(deployInfo.pullBranch), whitelist)) if whitelist else list()
-        matchBlacklist = list(filter(lambda x: re.compile(x).match(deployInfo.pullBranch), blacklist)) if blacklist else list()
-        if not matchWhitelist and len(matchWhitelist) == 0:
-            stop = True
-            LOGGER.info("'"+ deployInfo.pullBranch +"' not on whitelist!")
-        if len(matchBlacklist) > 0:
-            stop = True
-            LOGGER.info("'"+ deployInfo.pullBranch +"' is on blacklist!")
-
-        # current Branch is releaseOnly Branch
-        if repoConfig.get("releasesOnly") :
-            releasesOnlyConfig = repoConfig["releasesOnly"]
-            if type(releasesOnlyConfig) == bool and branch == "master":
-                releaseOnly = releasesOnlyConfig
-
-            elif type(releasesOnlyConfig) == dict:
-                releaseOnly = bool(releasesOnlyConfig.get(branch))
-        
-        # current Branch is tagsOnly Branch
-        if repoConfig.get("tagsOnly") :
-            tagsOnlyConfig = repoConfig["tagsOnly"]
-            if type(tagsOnlyConfig) == bool and branch == "master":
-                tagsOnly = tagsOnlyConfig
-
-            elif type(tagsOnlyConfig) == dict:
-                tagsOnly = bool(tagsOnlyConfig.get(branch))
+    if decision.notWhitelisted:
+        LOGGER.info("'"+ deployInfo.pullBranch +"' not on whitelist!")
+    if decision.blacklisted:
+        LOGGER.info("'"+ deployInfo.pullBranch +"' is on blacklist!")
 
 
     if releaseOnly:
@@ -236,7 +381,22 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
     
     
 
+    cloneOptions = CloneOptions(repoName, settings.config)
+    
+    # shared object store
+    mirror = None
+    if Mirror.enabledFor(repoName, settings.config):
+        mirror = Mirror(settings, repoName)
+        if updateMirror and sha and not tag and mirror.hasCommit(sha):
+            output += "[+] Commit " + sha[:7] + " is already in the mirror, skipping mirror fetch\n\n"
+        elif updateMirror or not os.path.exists(mirror.path):
+            mirrorOut, mirrorError = mirror.update()
+            output += mirrorOut
+            error |= mirrorError
+
     firstSetup = False
+    tagFetched = False
+    tagIndex = TagIndex(deployInfo.repoPath)
     # deploy
     if not os.path.exists(deployInfo.repoPath):
         # clone git repo
@@ -245,56 +405,147 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
         except:
             pass
 
-        args = ["git", "clone", "-b", deployInfo.pullBranch, deployInfo.gitUrl, "."]
+        if mirror:
+            args = mirror.cloneArgs(deployInfo.pullBranch)
+        else:
+            args = cloneOptions.cloneArgs(deployInfo.pullBranch, deployInfo.gitUrl)
         gitOut, gitError = call(args, cwd=deployInfo.repoPath)
         output += addOutput("[+] " + " ".join(args), gitOut, gitError)
         error |= gitError
 
+        if mirror and not gitError:
+            # origin should still point to the real remote
+            args = ["git", "remote", "set-url", "origin", deployInfo.gitUrl]
+            gitOut, gitError = call(args, cwd=deployInfo.repoPath)
+            output += addOutput("[+] " + " ".join(args), gitOut, gitError)
+            error |= gitError
+
         if gitError:
             shutil.rmtree(deployInfo.repoPath, ignore_errors=True)
 
         firstSetup = True
+    elif webhook and tag and not release.isRelease:
+        # tag event, fetch only the tag and check it out without updating the branch
+        indexOut, indexError = tagIndex.load()
+        output += indexOut
+        error |= indexError
+        
+        tagSha = tagIndex.commit(tag)
+        if sha and tagSha == sha:
+            output += "[+] Tag '" + tag + "' (" + sha[:7] + ") is already available, skipping fetch\n\n"
+        else:
+            cmd = cloneOptions.tagRefFetchArgs(mirror.path if mirror else "origin", tag)
+            gitOut, gitError = call(cmd, cwd=deployInfo.repoPath, capped=False)
+            output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
+            error |= gitError
+            if not gitError:
+                tagIndex.applyFetch(gitOut)
+        tagFetched = True
     else:
-        # pull from repo
-        cmd = ["git", "clean", "-d", "-f"]
-        gitOut, gitError = call(cmd, cwd=deployInfo.repoPath)
-        output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
-        error |= gitError
-
-        cmd = ["git", "reset", "--hard"]
-        gitOut, gitError = call(cmd, cwd=deployInfo.repoPath)
-        output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
-        error |= gitError
-
-        cmd = ["git", "checkout", deployInfo.pullBranch]
-        gitOut, gitError = call(cmd, cwd=deployInfo.repoPath)
-        output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
-        error |= gitError
-
-        cmd = ["git", "fetch"]
-        gitOut, gitError = call(cmd, cwd=deployInfo.repoPath)
-        output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
-        error |= gitError
-
-        cmd = ["git", "reset", "--hard", "origin/" + deployInfo.pullBranch]
-        gitOut, gitError = call(cmd, cwd=deployInfo.repoPath)
-        output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
-        error |= gitError
+        # pull from repo, compare the local HEAD with the remote branch first
+        remote = mirror.path if mirror else "origin"
+        shaAvailable = False
+        if sha and not tag:
+            # the push event names the commit, no need to ask the remote
+            remoteOut, remoteError = "", False
+            remoteSha = sha
+            # missing objects are no error, the commit is fetched then
+            revOut, revError = call(["git", "rev-list", "-n", "1", "--no-walk", "--ignore-missing", sha], cwd=deployInfo.repoPath)
+            shaAvailable = not revError and revOut.strip() == sha
+        else:
+            cmd = ["git", "ls-remote", remote, "refs/heads/" + deployInfo.pullBranch]
+            remoteOut, remoteError = call(cmd, cwd=deployInfo.repoPath)
+            remoteSha = remoteOut.split()[0] if remoteOut.strip() and not remoteError else None
+        localOut, localError = call(["git", "rev-parse", "HEAD"], cwd=deployInfo.repoPath)
+        
+        # special or unknown tags need a fetch, even if the branch didn't move
+        # fetched tag changes are applied to the index afterwards
+        indexOut, indexError = tagIndex.load()
+        tagMissing = False
+        if tag:
+            tagMissing = tag in ["latest", "latestRelease"] or indexError or tagIndex.rank(tag) is None
+        
+        if remoteError:
+            output += addOutput("[+] " + ' '.join(cmd), remoteOut, remoteError)
+            error = True
+        
+        elif remoteSha and not localError and localOut.strip() == remoteSha and not tagMissing:
+            output += "[+] '" + deployInfo.pullBranch + "' is up to date (" + remoteSha[:7] + "), skipping fetch and reset\n\n"
+        
+        else:
+            target = "origin/" + deployInfo.pullBranch
+            if sha and not tag:
+                # deploy the commit of the event, even if the branch moved on in the meantime
+                target = sha
+            
+            if shaAvailable and not localError and isAncestor(sha, deployInfo.repoPath):
+                rollback = force or forcedPush
+                if not rollback:
+                    # not every provider flags forced pushes (e.g. GitLab), a rollback leaves the remote branch at sha
+                    cmd = ["git", "ls-remote", "origin", "refs/heads/" + deployInfo.pullBranch]
+                    headOut, headError = call(cmd, cwd=deployInfo.repoPath)
+                    rollback = not headError and headOut.split()[:1] == [sha]
+                
+                # late delivery of an older push, don't move the branch backwards
+                if not rollback:
+                    CONTEXT.addTestSeq(TEST_SEQs.dl_outdatedPush)
+                    output += "[+] Commit " + sha[:7] + " is already contained in '" + deployInfo.pullBranch + "' (" + localOut.strip()[:7] + "), skipping deploy.\n" + \
+                              "    Deploy manually or add query param 'force=1' to check it out anyway."
+                    return Response(output.strip(), content_type=contenttype)
+                else:
+                    # e.g. a rollback with `git push --force`
+                    CONTEXT.addTestSeq(TEST_SEQs.dl_outdatedPushOW)
+                    output += "[!] Commit " + sha[:7] + " is older than '" + deployInfo.pullBranch + "' (" + localOut.strip()[:7] + "), checking it out anyway...\n\n"
+            
+            if shaAvailable:
+                output += "[+] Commit " + sha[:7] + " is already available, skipping fetch\n\n"
+            else:
+                cmd = mirror.fetchArgs() if mirror else cloneOptions.fetchArgs()
+                if target == sha:
+                    cmd = cloneOptions.shaFetchArgs(remote, sha, deployInfo.pullBranch)
+                # the fetched tag updates are parsed by the tag index
+                gitOut, gitError = call(cmd, cwd=deployInfo.repoPath, capped=False)
+                
+                if gitError and target == sha:
+                    # the remote may refuse to serve a commit by id, fetch the branches instead
+                    output += "[!] Fetching commit " + sha[:7] + " failed, fetching all branches\n\n"
+                    cmd = mirror.fetchArgs() if mirror else cloneOptions.fetchArgs()
+                    gitOut, gitError = call(cmd, cwd=deployInfo.repoPath, capped=False)
+                
+                output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
+                error |= gitError
+                if not gitError:
+                    tagIndex.applyFetch(gitOut)
+            
+            # switch to the branch and reset index and files in one step
+            cmd = ["git", "checkout", "-f", "-B", deployInfo.pullBranch, target]
+            gitOut, gitError = call(cmd, cwd=deployInfo.repoPath)
+            output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
+            error |= gitError
+            
+            cmd = ["git", "clean", "-d", "-f"]
+            gitOut, gitError = call(cmd, cwd=deployInfo.repoPath)
+            output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
+            error |= gitError
 
 
 
     # check for newest tag
     if tag:
-        # get all tags
-        gitOut, gitError = call(["git", "tag", "--sort=-committerdate"], cwd=deployInfo.repoPath)
-
-        if gitError:
-            output += addOutput("[+] git tag --sort=-committerdate", gitOut, gitError)
+        if cloneOptions.isReduced() and not mirror and not error and not tagFetched:
+            # shallow or single branch working copy, fetch the missing tags
+            cmd = cloneOptions.tagFetchArgs()
+            gitOut, gitError = call(cmd, cwd=deployInfo.repoPath, capped=False)
+            output += addOutput("[+] " + ' '.join(cmd), gitOut, gitError)
             error |= gitError
-
-        gitOut = gitOut.strip()
-        gitTags = gitOut.splitlines()
-        tagsAnnotated = list(map(lambda x: x.strip(), gitTags[:]))
+            if not gitError:
+                tagIndex.applyFetch(gitOut)
+        
+        # get all tags (newest first) from the tag index
+        indexOut, indexError = tagIndex.load()
+        output += indexOut
+        error |= indexError
+        gitTags = tagIndex.tags
 
         if tag == "latest" and not webhook:
             # only manual deploy
@@ -324,17 +575,13 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
 
 
         # tag exists
-        if tag in gitTags:
-            tagNumber = gitTags.index(tag)
-            releaseTagNumber = -1 if not release.latestReleaseTag else gitTags.index(release.latestReleaseTag)
-            
-            tagsAnnotated[tagNumber] = "%s <= specified tag" % tagsAnnotated[tagNumber]
-            if releaseTagNumber > -1:
-                tagsAnnotated[releaseTagNumber] = "%s <= latest published release" % tagsAnnotated[releaseTagNumber]
-            
-            
-            historyOfTags = "History of tags (newest top, oldest bottom):\n" + \
-                              "%s" % '\n'.join(map(lambda x: "  %s" % x, tagsAnnotated))
+        tagNumber = tagIndex.rank(tag)
+        if tagNumber is not None:
+            # only built for warnings
+            annotations = {tag: "specified tag"}
+            if release.latestReleaseTag and release.latestReleaseTag != tag:
+                annotations[release.latestReleaseTag] = "latest published release"
+            historyOfTags = lambda: tagIndex.history(annotations)
             
             # conutinue condition
             if (releaseOnly and release.isLatestRelease(tag)) or \
@@ -350,7 +597,7 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
                     temp = "ATTENTION!\n" + \
                            "Specified tag ('%s') is not the newest on this branch. Will set tag to the newest one ('%s').\n" % (tag, gitTags[0]) + \
                            "If you want to checkout your tag anyway, add query param 'ignoreTagDate=1' to URL.\n" + \
-                           historyOfTags + "\n\n" + \
+                           historyOfTags() + "\n\n" + \
                            "If you want to silence this warning, specify the latest tag or set the tag name to 'latest'\n"+\
                            "to always deploy the latest tag.\n\n\n===========================\n"
                     output = temp + output
@@ -368,7 +615,7 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
                 CONTEXT.addTestSeq(TEST_SEQs.dl_notNewestTag)
                 temp = "ATTENTION!\n" + \
                        "Specified tag ('%s') is not the newest on this branch. Setting tag to the newest one ('%s').\n" % (tag, gitTags[0]) + \
-                       historyOfTags + "\n\n" + \
+                       historyOfTags() + "\n\n" + \
                        "Invocation per webhook only pulls latest tag version.\n\n\n===========================\n"
     
                 output = temp + output
@@ -384,7 +631,7 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
                     CONTEXT.addTestSeq(TEST_SEQs.dl_releaseOnlyNotLatestRelRelKnown)
                     temp = "ATTENTION!\nreleaseOnly Mode is enabled for this branch ('" + deployInfo.branchName + "').\n" + \
                            "Specified tag is not the newest release. Setting tag to '"+ release.latestReleaseTag +"'.\n" + \
-                           historyOfTags + "\n\n" + \
+                           historyOfTags() + "\n\n" + \
                            "To deploy the specified tag anyway, add query prameter 'ignoreRelease=1' to URL.\n\n\n===========================\n"
                     output = temp + output
                     tag = release.latestReleaseTag
@@ -394,7 +641,7 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
                     # not latest release, overriding
                     temp = "ATTENTION!\nreleaseOnly Mode is enabled for this branch ('" + deployInfo.branchName + "').\n" + \
                            "Specified tag is not the newest release." + \
-                           historyOfTags + "\n\n" + \
+                           historyOfTags() + "\n\n" + \
                            "Ignoring this and checking out this tag ('" + tag + "') anyway...\n\n\n===========================\n"
                     output = temp + output
 
@@ -403,7 +650,7 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
                 # not latest release and releaseOnly branch (auto deploy)
                 temp = "ATTENTION!\nreleaseOnly Mode is enabled for this branch ('" + deployInfo.branchName + "').\n" + \
                        "Specified release is not the newest release. Invocation per webhook only pulls latest release.\n" + \
-                       historyOfTags + "\n\n" + \
+                       historyOfTags() + "\n\n" + \
                        "Set deploying version to tag '"+ release.latestReleaseTag +"'\n\n\n===========================\n"
                 output = temp + output
                 tag = release.latestReleaseTag
@@ -417,15 +664,16 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
                 # latest release unknown, overriding (manual deploy)
                 temp = "ATTENTION!\n" + \
                        "This branch '" + deployInfo.branchName + "' has releaseOnly mode enabled.\n" + \
-                       historyOfTags + "\n\n" + \
+                       historyOfTags() + "\n\n" + \
                        "Latest release version is unkown, ignoring this and deploying to tag '"+ tag +"' anyway...\n\n\n===========================\n"
                 output = temp + output
 
 
     # checkout tag
     if tag and os.path.exists(deployInfo.repoPath):
-        verOut, verErr = call("git checkout " + str(tag), cwd=deployInfo.repoPath, shell=True)
-        output += addOutput("[+] git checkout " + str(tag), verOut, verErr)
+        # the tag fast path doesn't reset the working copy, discard local changes here
+        verOut, verErr = call(["git", "checkout", "-f", str(tag)], cwd=deployInfo.repoPath)
+        output += addOutput("[+] git checkout -f " + str(tag), verOut, verErr)
         error |= verErr
         if verErr:
             CONTEXT.addTestSeq(TEST_SEQs.dl_checkoutFailed)
@@ -435,25 +683,48 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
         output += "[!] skip checkout version, deployment path doesn't exist. Check logs!\n\n"
 
 
+    # skip scripts, if the checked out commit is already deployed
+    if not firstSetup and not error and os.path.exists(deployInfo.repoPath):
+        shaOut, shaError = call(["git", "rev-parse", "HEAD"], cwd=deployInfo.repoPath)
+        
+        if not shaError and shaOut.strip() == deployInfo.deployedSha():
+            if not force:
+                CONTEXT.addTestSeq(TEST_SEQs.dl_nothingToDo)
+                output += "[+] Nothing to do, commit " + shaOut.strip()[:7] + " is already deployed on ('" + deployInfo.branchName + "').\n" + \
+                          "    Add query param 'force=1' to deploy anyway."
+                return Response(output.strip(), content_type=contenttype)
+            else:
+                CONTEXT.addTestSeq(TEST_SEQs.dl_nothingToDoOW)
+                output += "[!] Commit " + shaOut.strip()[:7] + " is already deployed, deploying anyway...\n\n"
+
+
     # scripts
     if firstSetup and not error:
         # launch setup script
         if os.path.exists(os.path.join(deployInfo.repoPath, "setup")):
-            setupOut, setupErr = call([os.path.join(deployInfo.repoPath, "setup"), deployInfo.branchName, request.headers["Host"]], cwd=deployInfo.repoPath)
+            setupOut, setupErr = call([os.path.join(deployInfo.repoPath, "setup"), deployInfo.branchName, request.headers["Host"]], cwd=deployInfo.repoPath,
+                                      timeout=commandConfig()["scriptTimeout"], killGroup=commandConfig()["killScriptProcessGroup"])
             output += addOutput("[+] Setup Script", setupOut, setupErr)
-            error |= gitError
+            error |= setupErr
         else:
             output += "[!] No setup script found\n\n"
     elif not error:
         # launch reload script
         if os.path.exists(os.path.join(deployInfo.repoPath, "reload")):
-            relOut, relErr = call([os.path.join(deployInfo.repoPath, "reload"), deployInfo.branchName, request.headers["Host"]], cwd=deployInfo.repoPath)
+            relOut, relErr = call([os.path.join(deployInfo.repoPath, "reload"), deployInfo.branchName, request.headers["Host"]], cwd=deployInfo.repoPath,
+                                  timeout=commandConfig()["scriptTimeout"], killGroup=commandConfig()["killScriptProcessGroup"])
             output += addOutput("[+] Reload script", relOut, relErr)
             error |= relErr
         else:
             output += "[!] No reload script found\n\n"
     elif error:
         output += "[!] Skip reload or setup script (deploying failed)\n\n"
+    
+    if not error:
+        # remember the deployed commit to skip duplicate deliveries
+        shaOut, shaError = call(["git", "rev-parse", "HEAD"], cwd=deployInfo.repoPath)
+        if not shaError:
+            deployInfo.setDeployedSha(shaOut.strip())
 
     output = output.strip()
 
@@ -472,31 +743,46 @@ def downloadFromGit(repoName, settings, branch="master", tag=None, webhook=False
 
 
 
-def createTagEvent(repoName, tag, settings, release):
-    repoConfig = CONTEXT.CONFIG.get(repoName)
-    if not repoConfig or not repoConfig.get("tagsOnly"):
-        return Response("No tag event configured for repo '" + repoName + "'!", content_type=contenttype)
+def updateMirrorForEvent(repoName, settings):
+    """
+    Fetches the shared mirror of *repoName* once for all branches of an event.
+
+    :return: output of the fetch and an error response, if the fetch failed
+    :rtype: (str, Response)
+    """
+    
+    if not Mirror.enabledFor(repoName, settings.config) or not settings.deployPossible():
+        return "", None
+    
+    # the fetch is shared by all branches of the event, so it is traced on its own
+    with traceDeploy(repoName, None) as trace:
+        mirrorOut, mirrorError = Mirror(settings, repoName).update()
+        trace.finish(500 if mirrorError else 200)
+    if mirrorError:
+        return mirrorOut, requestError("Updating the mirror failed, no branch deployed.\n" + mirrorOut.strip(), code=500)
     
-    tagsOnlyConfig = repoConfig["tagsOnly"]
-    tagsOnlyBranches = []
+    return mirrorOut, None
+
+
+
+def createTagEvent(repoName, tag, settings, release, sha=None):
+    tagsOnlyBranches, resp = eventBranches(repoName, settings, "tagsOnly")
+    if resp:
+        return resp
     
-    # get tagsOnly branches
-    if type(tagsOnlyConfig) == bool and tagsOnlyConfig:
-        tagsOnlyBranches.append("master")
-    elif type(tagsOnlyConfig) == dict:
-        for k, v in tagsOnlyConfig.items():
-            if v:
-                tagsOnlyBranches.append(k)
+    # one remote fetch for all branches
+    output, mirrorError = updateMirrorForEvent(repoName, settings)
+    if mirrorError:
+        return mirrorError
     
-    if len(tagsOnlyBranches) == 0:
-        return requestError("No branch set to tagsOnly mode. Ignoring this event.", code=500)
+    # deploy all branches in parallel, each branch has its own working copy
+    responses = BRANCHES.map(lambda x: downloadFromGit(repoName, settings, branch=x, tag=tag, webhook=True, release=release, updateMirror=False, sha=sha),
+                             tagsOnlyBranches, settings.baseUrl)
     
-    output = ''
     error = 200
-    for branch in tagsOnlyBranches:
+    for branch, resp in zip(tagsOnlyBranches, responses):
         output += "Start to deploy tag to '" + branch + "'...\n" + \
                   "=============================" + "\n"
-        resp = downloadFromGit(repoName, settings, branch=branch, tag=tag, webhook=True, release=release)
         output += resp.get_data(as_text=True) + "\n" + \
                   "Finished with status code: %d\n\n\n" % resp.status_code
         if resp.status_code > error:
@@ -508,34 +794,28 @@ def createTagEvent(repoName, tag, settings, release):
 
 
 def releaseEvent(repoName, tag, settings, release):
+    releasesOnlyBranches, resp = eventBranches(repoName, settings, "releasesOnly")
+    if resp:
+        return resp
+    
     release.isRelease = True
+    # a new release was published, don't trust the cached tag
+    RELEASE_CACHE.invalidate((settings.username, repoName))
     release.getLatestReleaseTag(repoName)
     
-    repoConfig = CONTEXT.CONFIG.get(repoName)
-    if not repoConfig or not repoConfig.get("releasesOnly"):
-        return Response("No release event configured for repo '" + repoName + "'!", content_type=contenttype)
-    
-    releasesOnlyConfig = repoConfig["releasesOnly"]
-    releasesOnlyBranches = []
+    # one remote fetch for all branches
+    output, mirrorError = updateMirrorForEvent(repoName, settings)
+    if mirrorError:
+        return mirrorError
     
-    # get releaseOnly branches
-    if type(releasesOnlyConfig) == bool and releasesOnlyConfig:
-        releasesOnlyBranches.append("master")
-    elif type(releasesOnlyConfig) == dict:
-        for k,v in releasesOnlyConfig.items():
-            if v:
-                releasesOnlyBranches.append(k)
-
-    if len(releasesOnlyBranches) == 0:
-        return requestError("No branch set to releaseOnly mode. Ignoring this event.", code=500)
-
+    # deploy all branches in parallel, each branch has its own working copy
+    responses = BRANCHES.map(lambda x: downloadFromGit(repoName, settings, branch=x, tag=tag, webhook=True, release=release, updateMirror=False),
+                             releasesOnlyBranches, settings.baseUrl)
     
-    output = ''
     error = 200
-    for branch in releasesOnlyBranches:
+    for branch, resp in zip(releasesOnlyBranches, responses):
         output += "Start to deploy release to '" + branch + "'...\n" + \
                   "=============================" + "\n"
-        resp = downloadFromGit(repoName, settings, branch=branch, tag=tag, webhook=True, release=release)
         output += resp.get_data(as_text=True) + "\n" +\
                   "Finished with status code: %d\n\n\n" % resp.status_code
         if resp.status_code > error:
@@ -544,10 +824,112 @@ def releaseEvent(repoName, tag, settings, release):
     return Response(output, status=error, content_type=contenttype)
 
 
+def jsonDeployResponse(resp):
+    # deploy output with the timing trace of its steps
+    trace = getattr(resp, "deployTrace", None)
+    data = {
+        "statusCode": resp.status_code,
+        "output": resp.get_data(as_text=True),
+        "trace": trace.toDict() if trace else None
+    }
+    return Response(json.dumps(data, indent=4), status=resp.status_code, content_type="application/json; charset=utf-8")
+
+
+def streamDeploy(func, sse=False):
+    """
+    Runs *func* in a background thread and streams the output of its commands while they run,
+    as chunked plain text or as Server-Sent Events. The response of *func* follows at the end.
+    """
+    
+    stream = OutputStream()
+    result = dict()
+    
+    @copy_current_request_context
+    def run():
+        with streamOutput(stream):
+            try:
+                result["resp"] = logErrorRespToLevel(func(), LOGGER.warning)
+            except Exception as e:
+                LOGGER.critical("Streamed deploy crashed: " + str(e))
+            finally:
+                stream.close()
+    
+    thread = threading.Thread(target=run, name="StreamedDeploy", daemon=True)
+    thread.start()
+    
+    def event(data, name=None):
+        ret = "event: " + name + "\n" if name else ""
+        return ret + "".join(map(lambda x: "data: " + x + "\n", data.split("\n"))) + "\n"
+    
+    def generate():
+        while True:
+            lines = stream.read()
+            if lines is None:
+                break
+            if sse:
+                yield ": keepalive\n\n" if not lines else "".join(map(event, lines))
+            elif lines:
+                yield "\n".join(lines) + "\n"
+        
+        thread.join()
+        resp = result.get("resp")
+        body = resp.get_data(as_text=True).strip() if resp else "Deploy crashed, look at the logs."
+        code = resp.status_code if resp else 500
+        
+        if sse:
+            yield event(body, "result") + event(str(code), "status")
+        else:
+            yield "\n" + "=============================" + "\n" + body + "\n\n" + \
+                  "Finished with status code: %d\n" % code
+    
+    contentType = "text/event-stream; charset=utf-8" if sse else contenttype
+    return Response(generate(), content_type=contentType, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def deduplicated(apiName, deliveryId, func):
+    """
+    Calls *func* only for the first delivery of a webhook, redeliveries get the stored response.
+    If the first delivery queued a job which finished in the meantime, the job result is returned.
+    Only deliveries which started a deploy are stored, failed deploys are forgotten so they can be redelivered.
+    """
+    
+    if not deliveryId:
+        return func()
+    
+    key = apiName + ":" + deliveryId
+    delivery = DELIVERIES.begin(key)
+    if delivery:
+        LOGGER.info("Duplicate " + apiName + " delivery '" + deliveryId + "', no deploy started")
+        METRICS.duplicateDeliveries.inc((apiName,))
+        
+        job = JOBS.get(delivery.jobId) if delivery.jobId else None
+        if job and job.done.is_set():
+            return Response(job.output, status=job.statusCode, content_type=contenttype,
+                            headers={"X-Duplicate-Delivery": "1"})
+        return Response(delivery.body, status=delivery.statusCode, content_type=delivery.contentType,
+                        headers={"X-Duplicate-Delivery": "1"})
+    
+    resp = None
+    try:
+        resp = func()
+    finally:
+        job = JOBS.get(getattr(resp, "jobId", None)) if resp is not None else None
+        if job and resp.status_code < 400:
+            DELIVERIES.finish(key, Delivery(resp.status_code, resp.get_data(as_text=True), resp.content_type, job.id))
+            job.onDone(lambda x: DELIVERIES.forget(key) if x.statusCode >= 400 else None)
+        else:
+            # pings, filtered events and failed deploys don't touch the store
+            DELIVERIES.finish(key, None)
+    
+    return resp
+
+
 def reloadConfig(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
         CONTEXT.reloadCONFIG()
+        # oversized bodies are rejected with 413 before they are read
+        app.config["MAX_CONTENT_LENGTH"] = maxBodySize()
         return func(*args, **kwargs)
     return wrapper
 
@@ -558,7 +940,7 @@ def github():
     settings = APISettings("github")
 
     headers = request.headers
-    jsonData = request.get_json(silent=True)
+    jsonData = None
 
     if CONTEXT.DEBUG and not CONTEXT.TESTING:
         # check local HMAC calculation
@@ -573,55 +955,86 @@ def github():
     else:
         rawData = request.get_data(as_text=False)
 
-    if not jsonData:
-        LOGGER.critical("No json data in request! Expected a request with an application/json body.")
-        return requestError("No json data in request! Expected a request with an application/json body.")
+    if len(rawData) > maxBodySize():
+        LOGGER.critical("Request body exceeds 'maxBodySize', automatic deploy failed!")
+        return requestError("Request Entity Too Large", 413)
 
     if "X-GitHub-Delivery" not in headers or "X-GitHub-Event" not in headers or "GitHub-Hookshot" not in headers["User-Agent"]:
         LOGGER.critical("Unsupported Header combination:\n" + "\n".join(map(lambda x: "    \"%s\": \"%s\"" %(x[0], x[1]), headers.items())))
         return requestError("Invalid Request")
 
 
-    # calculate HMAC
-    if settings.hmacSecret and "X-Hub-Signature" in headers:
-        secret = settings.hmacSecret
-        mac = hmac.new(secret, rawData, hashlib.sha1).hexdigest()
+    # verify HMAC before the payload is parsed
+    verifier = verifierFor(settings, settings.hmacSecret)
+    if settings.hmacSecret and not verifier.hasHmacSignature(headers):
+        LOGGER.critical("Missing GitHub signature, automatic deploy failed!")
+        return requestError("Missing Signature 401", 401)
+    
+    elif settings.hmacSecret:
+        with METRICS.stage("signature"):
+            valid = verifier.verifyHmac(headers, rawData)
 
-        if "sha1=" + mac != headers["X-Hub-Signature"]:
+        if not valid:
             LOGGER.critical("Invalid GitHub signature, automatic deploy failed!")
-            LOGGER.debug("Computed Mac: sha1=" + mac + "\n" +
-                         "Sent Mac    : " + headers["X-Hub-Signature"])
-            LOGGER.debug("type(data) = " + str(type(rawData)) + "\nPayload:\n" + rawData.decode())
+            LOGGER.debug("Sent Mac: " + str(headers.get("X-Hub-Signature-256") or headers.get("X-Hub-Signature")))
             return requestError("Invalid Signature 401", 401)
     else:
         LOGGER.warning("Skip signature validation!")
 
+    if jsonData is None:
+        jsonData = request.get_json(silent=True)
+
+    if not jsonData:
+        LOGGER.critical("No json data in request! Expected a request with an application/json body.")
+        return requestError("No json data in request! Expected a request with an application/json body.")
+
+
+    # redeliveries get the result of the first delivery
+    return deduplicated("github", headers.get("X-GitHub-Delivery"), lambda: githubEvent(settings, headers, jsonData))
+
 
+def githubEvent(settings, headers, jsonData):
     # setup git operation
     repoName = jsonData["repository"]["name"]
-    release = Release(settings)
     event = headers["X-GitHub-Event"]
     
-    mailHeader = ""
-
     if event == "push":
         if "refs/heads" not in jsonData["ref"]:
             LOGGER.debug("No branch push detected, ignore push event.")
             return Response("No branch push detected, ignore push event", content_type=contenttype)
 
         branch = jsonData["ref"].replace("refs/heads/", "")
-        mailHeader = "Push event successful!\n\n"
-        resp = logErrorRespToLevel(downloadFromGit(repoName, settings, branch=str(branch), release=release, webhook=True), LOGGER.critical)
+        dropped = preFilterPush(repoName, settings, branch)
+        if dropped:
+            return dropped
+        
+        release = Release(settings)
+        sha = commitSha(jsonData.get("after"))
+        forcedPush = bool(jsonData.get("forced"))
+        return enqueueDeploy(branch + "@" + repoName,
+                             lambda: downloadFromGit(repoName, settings, branch=str(branch), release=release, webhook=True, sha=sha, forcedPush=forcedPush),
+                             mailHeader="Push event successful!\n\n")
 
     elif event == "release":
+        dropped = preFilterTagEvent(repoName, settings, "releasesOnly")
+        if dropped:
+            return dropped
+        
         tag = jsonData["release"]["tag_name"]
-        mailHeader = "Release event successful!\n\n"
-        resp = logErrorRespToLevel(releaseEvent(repoName, tag, settings, release), LOGGER.critical)
+        release = Release(settings)
+        return enqueueDeploy("release " + tag + "@" + repoName,
+                             lambda: releaseEvent(repoName, tag, settings, release),
+                             mailHeader="Release event successful!\n\n")
 
     elif event == "create" and jsonData["ref_type"] == "tag":
+        dropped = preFilterTagEvent(repoName, settings, "tagsOnly")
+        if dropped:
+            return dropped
+        
         tag = jsonData["ref"]
-        mailHeader = "Create event successful!\n\n"
-        resp = logErrorRespToLevel(createTagEvent(repoName, tag, settings, release), LOGGER.critical)
+        return enqueueDeploy("tag " + tag + "@" + repoName,
+                             lambda: createTagEvent(repoName, tag, settings, Release(settings)),
+                             mailHeader="Create event successful!\n\n")
 
     elif event == "ping":
         events = jsonData["hook"]["events"]
@@ -648,19 +1061,13 @@ def github():
             LOGGER.critical("Error during github ping event...\n" + output)
             return requestError(output, code=400)
         else:
-            mailHeader = "Ping event successful!\n\n"
             resp = Response("Everything looks good!", content_type=contenttype)
+            sendSuccessMail("Ping event successful!\n\n", resp)
+            return resp
 
     else:
         LOGGER.critical("Received an unsupported GitHub Event: "  + headers["X-GitHub-Event"])
         return requestError("Received an unsupported GitHub Event", code=405)
-    
-    if resp.status_code == 200 and CONTEXT.MAIL_HANDLER:
-        CONTEXT.MAIL_HANDLER.setLevel(logger.logging.INFO)
-        LOGGER.info(mailHeader + resp.get_data(as_text=True).strip())
-        CONTEXT.MAIL_HANDLER.setLevel(logger.logging.CRITICAL)
-        
-    return resp
         
         
         
@@ -670,24 +1077,33 @@ def gitlab():
     settings = APISettings("gitlab")
 
     headers = request.headers
-    jsonData = request.get_json(silent=True)
-
-    if not jsonData:
-        LOGGER.critical("No json data in request! Expected a request with an application/json body.")
-        return requestError("No json data in request! Expected a request with an application/json body.")
 
     if "X-Gitlab-Event" not in headers:
         LOGGER.critical("Unsupported Header combination:\n" + "\n".join(map(lambda x: "    \"%s\": \"%s\"" %(x[0], x[1]), headers.items())))
         return requestError("Invalid Request")
 
-    if settings.secret and "X-Gitlab-Token" in headers:
-        if settings.secret != headers["X-Gitlab-Token"]:
+    # verify the token before the payload is parsed
+    if settings.secret and "X-Gitlab-Token" not in headers:
+        LOGGER.critical("Missing Gitlab token, automatic deploy failed!")
+        return requestError("Missing Signature 401", 401)
+    
+    elif settings.secret:
+        if not verifierFor(settings, settings.secret).verifyToken(headers["X-Gitlab-Token"]):
             return requestError("Invalid Signature 401", 401)
     
     else:
         LOGGER.warning("Skip signature validation!")
 
+    jsonData = request.get_json(silent=True)
+    if not jsonData:
+        LOGGER.critical("No json data in request! Expected a request with an application/json body.")
+        return requestError("No json data in request! Expected a request with an application/json body.")
+
+
+    return deduplicated("gitlab", headers.get("X-Gitlab-Event-UUID"), lambda: gitlabEvent(settings, headers, jsonData))
 
+
+def gitlabEvent(settings, headers, jsonData):
     # setup git operation
     repoName = jsonData["repository"]["name"]
     
@@ -697,15 +1113,25 @@ def gitlab():
             return Response("No branch push detected, ignore push event", content_type=contenttype)
 
         branch = jsonData["ref"].replace("refs/heads/", "")
-        return logErrorRespToLevel(downloadFromGit(repoName, settings, branch=str(branch), webhook=True), LOGGER.critical)
+        dropped = preFilterPush(repoName, settings, branch)
+        if dropped:
+            return dropped
+        
+        sha = commitSha(jsonData.get("checkout_sha") or jsonData.get("after"))
+        return enqueueDeploy(branch + "@" + repoName, lambda: downloadFromGit(repoName, settings, branch=str(branch), webhook=True, sha=sha))
     
     elif headers["X-Gitlab-Event"] == "Tag Push Hook" and jsonData["object_kind"] == "tag_push":
         if "refs/tags" not in jsonData["ref"]:
             LOGGER.debug("No tag push detected, ignore push event.")
             return Response("No tag push detected, ignore push event", content_type=contenttype)
         
+        dropped = preFilterTagEvent(repoName, settings, "tagsOnly")
+        if dropped:
+            return dropped
+        
         tag = jsonData["ref"].replace("refs/tags/", "")
-        return logErrorRespToLevel(createTagEvent(repoName, tag, settings, Release(settings)), LOGGER.critical)
+        sha = commitSha(jsonData.get("checkout_sha"))
+        return enqueueDeploy("tag " + tag + "@" + repoName, lambda: createTagEvent(repoName, tag, settings, Release(settings), sha=sha))
     
     else:
         LOGGER.critical("Received an unsupported Gitlab Event: "  + headers["X-Gitlab-Event"])
@@ -730,19 +1156,33 @@ def bitbucket():
     
     
     
+    return deduplicated("bitbucket", headers.get("X-Request-UUID"), lambda: bitbucketEvent(settings, headers, jsonData))
+
+
+def bitbucketEvent(settings, headers, jsonData):
     # setup git operation
     if headers["X-Event-Key"] == "repo:push":
         repoName = jsonData["repository"]["name"]
         
         typ = jsonData["new"]["type"]
+        sha = commitSha((jsonData["new"].get("target") or dict()).get("hash"))
         
         if typ == "branch":
             branch = jsonData["new"]["name"]
-            return logErrorRespToLevel(downloadFromGit(repoName, settings, branch=str(branch), webhook=True), LOGGER.critical)
+            dropped = preFilterPush(repoName, settings, branch)
+            if dropped:
+                return dropped
+            
+            forcedPush = bool(jsonData.get("forced"))
+            return enqueueDeploy(branch + "@" + repoName, lambda: downloadFromGit(repoName, settings, branch=str(branch), webhook=True, sha=sha, forcedPush=forcedPush))
             
         elif typ == "tag":
+            dropped = preFilterTagEvent(repoName, settings, "tagsOnly")
+            if dropped:
+                return dropped
+            
             tag = jsonData["new"]["name"]
-            return logErrorRespToLevel(createTagEvent(repoName, tag, settings, Release(settings)), LOGGER.critical)
+            return enqueueDeploy("tag " + tag + "@" + repoName, lambda: createTagEvent(repoName, tag, settings, Release(settings), sha=sha))
         
         else:
             LOGGER.critical("Received unknown bitbucket push typ: " + typ)
@@ -813,68 +1253,101 @@ def requiresAuth(func):
 def deploy(repoName, branch="master", tag=None):
     
     if request.method == "GET":
-        return Response('<form method="POST"><input id="button" type="submit" value="Start"></form><script>document.getElementById("button").focus();</script>')
+        # the form streams the deploy output
+        action = "?" + "&".join(filter(None, [request.query_string.decode(), "stream=1"]))
+        return Response('<form method="POST" action="' + html.escape(action) + '"><input id="button" type="submit" value="Start"></form><script>document.getElementById("button").focus();</script>')
 
-    # get API for repoName
-    repoSettings = CONTEXT.CONFIG.get(repoName)
+    # get API for repoName, one configuration snapshot for the whole request
+    config = CONTEXT.CONFIG
+    repoSettings = config.get(repoName)
     api = None
     
     if repoSettings:
         api = repoSettings.get("api")
 
     if not api:
-        api = CONTEXT.CONFIG.get("defaultApi")
+        api = config.get("defaultApi")
 
     if not api:
         CONTEXT.addTestSeq(TEST_SEQs.deploy_repoConfigNoApi)
         return requestError("No API specified, can't continue")
 
     # build APISettings object
-    settings = APISettings(api)
+    settings = APISettings(api, config)
 
-    return logErrorRespToLevel(downloadFromGit(repoName, settings, branch=branch, tag=tag, webhook=False), LOGGER.warning)
+    accept = request.headers.get("Accept") or ""
+    sse = "text/event-stream" in accept
+    stream = request.args.get("stream") and request.args.get("stream") != "0"
+    if sse or stream:
+        return streamDeploy(lambda: downloadFromGit(repoName, settings, branch=branch, tag=tag, webhook=False), sse=sse)
+    
+    resp = logErrorRespToLevel(downloadFromGit(repoName, settings, branch=branch, tag=tag, webhook=False), LOGGER.warning)
+    if "application/json" in accept:
+        return jsonDeployResponse(resp)
+    return resp
 
 
 
-@app.route('/info', methods=["GET"])
-def info():
-    output = ""
+@app.route('/jobs/<jobId>', methods=["GET"])
+@reloadConfig
+@requiresAuth
+def jobs(jobId):
+    job = JOBS.get(jobId)
+    if not job:
+        return requestError("Unknown job id '" + jobId + "'", code=404)
+    
+    return Response(json.dumps(job.toDict(), indent=4), content_type="application/json; charset=utf-8")
 
-    cmd = "which git"
-    gitOut, gitError = call(cmd, shell=True)
-    output += addOutput("[+] " + cmd, gitOut, gitError)
 
-    cmd = "git --version"
-    gitOut, gitError = call(cmd, shell=True)
-    output += addOutput("[+] " + cmd, gitOut, gitError)
 
-    cmd = "whoami"
-    gitOut, gitError = call(cmd, shell=True)
-    output += addOutput("[+] " + cmd, gitOut, gitError)
+@app.route('/policy/<repoName>/<branch>', methods=["GET"])
+@reloadConfig
+@requiresAuth
+def policy(repoName, branch):
+    # dry run of the branch policy, nothing is deployed
+    branchPolicy = policyFor(repoName)
+    
+    result = branchPolicy.evaluate(branch).toDict()
+    result["repoName"] = repoName
+    result["configured"] = branchPolicy.configured
+    result["releasesOnlyBranches"] = branchPolicy.releasesOnlyBranches
+    result["tagsOnlyBranches"] = branchPolicy.tagsOnlyBranches
+    
+    return Response(json.dumps(result, indent=4), content_type="application/json; charset=utf-8")
+
+
+
+@app.route('/metrics', methods=["GET"])
+@reloadConfig
+@requiresAuth
+def metrics():
+    return Response(METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-    cmd = "git config --global -l"
-    gitOut, gitError = call(cmd, shell=True)
-    output += addOutput("[+] " + cmd, gitOut, gitError)
 
-    cmd = "which python"
-    gitOut, gitError = call(cmd, shell=True)
-    output += addOutput("[+] " + cmd, gitOut, gitError)
 
-    cmd = "which python3"
-    gitOut, gitError = call(cmd, shell=True)
-    output += addOutput("[+] " + cmd, gitOut, gitError)
+@app.route('/info', methods=["GET"])
+def info():
+    # probes are cached, see diagnostics.DEFAULT_TTL
+    output = DIAGNOSTICS.report()
 
-    output += "[+] current sys.path:\n" + "\n".join(map(lambda x: "    %s" % x, sys.path)) + "\n\n"
+    dropped = METRICS.droppedEvents.items()
+    output += "[+] dropped webhook events:\n" + "\n".join(map(lambda x: "    %s/%s: %d" % (x[0][0], x[0][1], x[1]), dropped)) + "\n\n"
 
     output += "[+] Request-Headers:\n    {\n" + "\n".join(map(lambda x: "       \"%s\": \"%s\"" %(x[0], x[1]), request.headers.items())) + "\n    }\n\n"
 
-    cmd = "env"
-    gitOut, gitError = call(cmd, shell=True)
-    output += addOutput("[+] " + cmd, gitOut, gitError)
+    output += DIAGNOSTICS.environment()
 
     return Response(output, content_type=contenttype)
 
 
+@app.route('/healthz', methods=["GET"])
+def healthz():
+    # no process is spawned, cheap enough for frequent health checks
+    health = DIAGNOSTICS.health()
+    health["jobs"] = {"queued": JOBS.depth(), "running": JOBS.running()}
+    return Response(json.dumps(health, indent=4), content_type="application/json; charset=utf-8")
+
+
 if __name__ == '__main__':
     app.run(debug=CONTEXT.DEBUG)
 
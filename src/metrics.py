@@ -0,0 +1,205 @@
+# coding=utf-8
+from context import CONTEXT
+from functions import addCallObserver
+from contextlib import contextmanager
+import threading, time, os
+
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+_labels = threading.local()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _formatLabels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(map(lambda x: '%s="%s"' % (x[0], _escape(x[1])), pairs)) + "}"
+
+
+class Counter(object):
+    def __init__(self, name, help, labelNames):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def items(self):
+        # (labels, value) sorted by labels
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s counter" % self.name]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append("%s%s %g" % (self.name, _formatLabels(self.labelNames, labels), value))
+        return lines
+
+
+class Histogram(object):
+    def __init__(self, name, help, labelNames, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.buckets = buckets
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            counts, total, count = self._values.get(labels) or ([0] * len(self.buckets), 0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[labels] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucketCount in zip(self.buckets, counts):
+                    lines.append("%s_bucket%s %d" % (self.name, _formatLabels(self.labelNames, labels, [("le", "%g" % bound)]), bucketCount))
+                lines.append("%s_bucket%s %d" % (self.name, _formatLabels(self.labelNames, labels, [("le", "+Inf")]), count))
+                lines.append("%s_sum%s %g" % (self.name, _formatLabels(self.labelNames, labels), total))
+                lines.append("%s_count%s %d" % (self.name, _formatLabels(self.labelNames, labels), count))
+        return lines
+
+
+class Gauge(object):
+    def __init__(self, name, help, func):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def render(self):
+        return ["# HELP %s %s" % (self.name, self.help), "# TYPE %s gauge" % self.name, "%s %g" % (self.name, self.func())]
+
+
+def commandStage(cmd):
+    """
+    Maps a command line of `functions.call` to a pipeline stage.
+
+    :type cmd: str
+    :rtype: str
+    """
+
+    parts = cmd.split() if type(cmd) == str else list(cmd)
+    if not parts:
+        return "other"
+
+    script = os.path.basename(parts[0])
+    if script in ("setup", "reload"):
+        return script
+
+    if script != "git" or len(parts) < 2:
+        return "other"
+
+    subcommand = parts[1]
+    if subcommand == "clone":
+        return "mirror" if "--bare" in parts else "clone"
+    if subcommand == "fetch":
+        return "mirror" if "--prune" in parts else "fetch"
+    if subcommand in ("reset", "clean") or (subcommand == "checkout" and "-B" in parts):
+        return "reset"
+    if subcommand == "checkout":
+        return "checkout"
+    return "git"
+
+
+# branch label of events for branches the policy doesn't deploy, their names would add new time series forever
+OTHER_BRANCH = "other"
+
+
+class Metrics(object):
+    def __init__(self):
+        """
+        Deploy pipeline metrics in the Prometheus text format.
+        Stage durations and outcomes are labeled with the repo and branch of the deploy running in the current thread.
+        """
+
+        self.stages = Histogram("deployer_stage_duration_seconds", "Duration of deploy pipeline stages.", ("repo", "branch", "stage"))
+        self.outcomes = Counter("deployer_outcomes_total", "Deploy outcomes, named like TEST_SEQs.", ("repo", "branch", "outcome"))
+        self.commands = Counter("deployer_commands_total", "Finished commands by stage and result.", ("stage", "result"))
+        self.outputBytes = Counter("deployer_command_output_bytes_total", "Output bytes produced by commands.", ("stage",))
+        self.duplicateDeliveries = Counter("deployer_duplicate_deliveries_total", "Webhook redeliveries answered from the delivery cache.", ("api",))
+        self.droppedEvents = Counter("deployer_dropped_events_total", "Webhook events rejected before deploying.", ("api", "repo"))
+
+        self._inFlight = 0
+        self._inFlightLock = threading.Lock()
+        self._metrics = [self.stages, self.outcomes, self.commands, self.outputBytes, self.droppedEvents, self.duplicateDeliveries,
+                         Gauge("deployer_deploys_in_flight", "Branch deploys currently running.", lambda: self._inFlight)]
+
+    def gauge(self, name, help, func):
+        self._metrics.append(Gauge(name, help, func))
+
+    @staticmethod
+    def currentLabels():
+        return getattr(_labels, "repo", ""), getattr(_labels, "branch", "")
+
+    @contextmanager
+    def labeled(self, repo, branch):
+        # labels everything measured in this thread with repo and branch
+        oldLabels = self.currentLabels()
+        _labels.repo, _labels.branch = repo, branch
+        try:
+            yield
+        finally:
+            _labels.repo, _labels.branch = oldLabels
+
+    @contextmanager
+    def deploy(self, repo, branch):
+        """
+        Measures a whole branch deploy, including the wait for its working copy.
+        """
+
+        with self._inFlightLock:
+            self._inFlight += 1
+
+        try:
+            with self.labeled(repo, branch), self.stage("deploy"):
+                yield
+        finally:
+            with self._inFlightLock:
+                self._inFlight -= 1
+
+    @contextmanager
+    def stage(self, name, repo=None, branch=None):
+        start = time.time()
+        try:
+            yield
+        finally:
+            currentRepo, currentBranch = self.currentLabels()
+            self.stages.observe((currentRepo if repo is None else repo, currentBranch if branch is None else branch, name), time.time() - start)
+
+    def observeCommand(self, result):
+        stage = commandStage(result.cmd)
+        repo, branch = self.currentLabels()
+        self.stages.observe((repo, branch, stage), result.wallTime)
+
+        status = "timeout" if result.timedOut else ("ok" if result.exitCode == 0 else "failed")
+        self.commands.inc((stage, status))
+        self.outputBytes.inc((stage,), result.bytes)
+
+    def outcome(self, seq):
+        repo, branch = self.currentLabels()
+        self.outcomes.inc((repo, branch, seq))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+addCallObserver(METRICS.observeCommand)
+CONTEXT.TEST_SEQ_OBSERVERS.append(METRICS.outcome)
@@ -0,0 +1,86 @@
+# coding=utf-8
+from context import CONTEXT
+from functions import call, addOutput, succeeds
+import os, shutil, threading
+
+_locks = dict()
+_locksLock = threading.Lock()
+
+
+def _lockForPath(path):
+    with _locksLock:
+        return _locks.setdefault(path, threading.Lock())
+
+
+class Mirror(object):
+    def __init__(self, settings, repoName):
+        """
+        Bare mirror of a repository at `[deployPath]/.mirrors/[repoName].git`.
+        Branch working copies borrow its objects, so the history is only downloaded and stored once.
+
+        :param settings: API settings of the repo
+        :type settings: classes.APISettings
+
+        :param repoName: name of the repository
+        :type repoName: str
+        """
+
+        self.repoName = repoName
+        self.gitUrl = os.path.join(settings.baseUrl, repoName + ".git")
+        self.path = os.path.realpath(os.path.join(settings.deployPath, ".mirrors", repoName + ".git"))
+
+    @staticmethod
+    def enabledFor(repoName, config=None):
+        repoConfig = (CONTEXT.CONFIG if config is None else config).get(repoName)
+        return bool(repoConfig and repoConfig.get("mirror"))
+
+    def fetchArgs(self):
+        # fetch branches and tags of the mirror into a working copy
+        return ["git", "fetch", self.path, "+refs/heads/*:refs/remotes/origin/*", "+refs/tags/*:refs/tags/*"]
+
+    def cloneArgs(self, branch):
+        # --shared uses the objects of the mirror via .git/objects/info/alternates
+        return ["git", "clone", "--shared", "-b", branch, self.path, "."]
+
+    def hasCommit(self, sha):
+        # e.g. the commit of a push event was fetched by an earlier event
+        return os.path.exists(self.path) and succeeds(["git", "cat-file", "-e", sha + "^{commit}"], cwd=self.path)
+
+    def update(self):
+        """
+        Creates or fetches the mirror.
+
+        :return: output, error
+        :rtype: (str, bool)
+        """
+
+        output = ""
+        error = False
+
+        with _lockForPath(self.path):
+            if not os.path.exists(self.path):
+                os.makedirs(self.path, exist_ok=True)
+
+                cmd = ["git", "clone", "--bare", self.gitUrl, "."]
+                gitOut, gitError = call(cmd, cwd=self.path)
+                output += addOutput("[+] " + " ".join(cmd), gitOut, gitError)
+                error |= gitError
+
+                if gitError:
+                    shutil.rmtree(self.path, ignore_errors=True)
+                else:
+                    # working copies reference objects of the mirror, never prune them
+                    cmd = ["git", "config", "gc.auto", "0"]
+                    gitOut, gitError = call(cmd, cwd=self.path)
+                    output += addOutput("[+] " + " ".join(cmd), gitOut, gitError)
+                    error |= gitError
+            else:
+                cmd = ["git", "fetch", "--prune", "origin", "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+                gitOut, gitError = call(cmd, cwd=self.path)
+                output += addOutput("[+] " + " ".join(cmd), gitOut, gitError)
+                error |= gitError
+
+        if error:
+            CONTEXT.LOGGER.warning("Updating mirror of '" + self.repoName + "' failed")
+
+        return output, error
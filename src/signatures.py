@@ -0,0 +1,90 @@
+# coding=utf-8
+from context import CONTEXT
+import hmac, hashlib, threading
+
+DEFAULT_MAX_BODY_SIZE = 5 * 1024 * 1024
+
+# signature headers in order of preference
+HMAC_HEADERS = [
+    ("X-Hub-Signature-256", "sha256", hashlib.sha256),
+    ("X-Hub-Signature", "sha1", hashlib.sha1)
+]
+
+
+def maxBodySize():
+    return (CONTEXT.CONFIG or dict()).get("maxBodySize") or DEFAULT_MAX_BODY_SIZE
+
+
+class SignatureVerifier(object):
+    def __init__(self, secret):
+        """
+        Verifies webhook signatures with constant time comparisons.
+        The HMAC key schedule is computed once, every request only copies the prepared state.
+
+        :param secret: HMAC secret (GitHub `hmacSecret`) or token (GitLab `secret`)
+        :type secret: bytes or str
+        """
+
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self._hmacs = dict()
+        if self.secret:
+            for header, prefix, digest in HMAC_HEADERS:
+                self._hmacs[header] = hmac.new(self.secret, digestmod=digest)
+
+    def hasHmacSignature(self, headers):
+        return any(map(lambda x: x[0] in headers, HMAC_HEADERS))
+
+    def verifyHmac(self, headers, rawData):
+        """
+        Checks the strongest signature header sent with the request.
+
+        :return: valid
+        :rtype: bool
+        """
+
+        if len(rawData) > maxBodySize():
+            return False
+
+        for header, prefix, digest in HMAC_HEADERS:
+            sent = headers.get(header)
+            if sent is None:
+                continue
+
+            mac = self._hmacs[header].copy()
+            mac.update(rawData)
+            return hmac.compare_digest((prefix + "=" + mac.hexdigest()).encode(), str(sent).encode())
+
+        return False
+
+    def verifyToken(self, token):
+        return hmac.compare_digest(self.secret, str(token).encode())
+
+
+_verifiers = {"config": None, "verifiers": dict()}
+_verifiersLock = threading.Lock()
+
+
+def verifierFor(settings, secret):
+    """
+    SignatureVerifier of an API, rebuilt whenever CONTEXT.CONFIG is replaced.
+
+    :param settings: API settings
+    :type settings: classes.APISettings
+
+    :param secret: secret of *settings* to verify with
+    :type secret: bytes or str
+
+    :rtype: SignatureVerifier
+    """
+
+    with _verifiersLock:
+        if _verifiers["config"] is not CONTEXT.CONFIG:
+            _verifiers["config"] = CONTEXT.CONFIG
+            _verifiers["verifiers"] = dict()
+
+        verifier = _verifiers["verifiers"].get(settings.apiName)
+        if not verifier or verifier.secret != (secret.encode() if isinstance(secret, str) else secret):
+            verifier = SignatureVerifier(secret)
+            _verifiers["verifiers"][settings.apiName] = verifier
+
+        return verifier
@@ -0,0 +1,182 @@
+# coding=utf-8
+from context import CONTEXT
+from functions import call, addOutput
+import json, os, re
+
+# " * [new tag]   dev31 -> dev31", " t [tag update]   dev18 -> dev18", " - [deleted]   (none) -> dev5", " + 1a2b...3c4d  dev18 -> dev18  (forced update)"
+_FETCH_LINE = re.compile(r"^\s*([*t+\-!=])\s+(\[[^\]]+\]|\S+\.\.\.?\S+)\s+(\S+)\s+->\s+(\S+)")
+
+# marker of capped command output, see functions.call
+_OMITTED = re.compile(r"^\[!\] \d+ bytes of output omitted$", re.MULTILINE)
+
+# annotated tags are peeled to their commit
+_FORMAT = "%(refname:strip=2)%00%(objectname)%00%(*objectname)%00%(committerdate:unix)"
+
+
+class TagIndex(object):
+    def __init__(self, repoPath):
+        """
+        Tags of a working copy ordered like `git tag --sort=-committerdate` (newest first), stored at `.git/TAG_INDEX`.
+        Maps every tag to (commit, committer date, rank) and is only rebuilt, if the tag refs changed
+        without a fetch reported through `applyFetch()`.
+
+        :param repoPath: path of the working copy
+        :type repoPath: str
+        """
+
+        self.repoPath = repoPath
+        self.path = os.path.join(repoPath, ".git", "TAG_INDEX")
+        self.tags = []
+        self._entries = dict()
+        self._loaded = False
+
+    def _fingerprint(self):
+        # loose tag refs change their directory (refs/tags or a subdirectory like refs/tags/release), packed tags the packed-refs file
+        tagsPath = os.path.join(self.repoPath, ".git", "refs", "tags")
+        paths = [tagsPath]
+        for root, dirs, files in os.walk(tagsPath):
+            dirs.sort()
+            paths += map(lambda x: os.path.join(root, x), dirs)
+        paths.append(os.path.join(self.repoPath, ".git", "packed-refs"))
+        
+        fingerprint = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                fingerprint.append([os.path.relpath(path, self.repoPath), st.st_mtime_ns, st.st_size])
+            except OSError:
+                fingerprint.append(None)
+        return fingerprint
+
+    def _setTags(self, entries):
+        # same order as git: newest committer date first, ties by name
+        entries = sorted(entries, key=lambda x: (-x[2], x[0]))
+        self.tags = list(map(lambda x: x[0], entries))
+        self._entries = dict(map(lambda x: (x[1][0], (x[1][1], x[1][2], x[0])), enumerate(entries)))
+        self._loaded = True
+
+    def _query(self, refs=None):
+        cmd = ["git", "for-each-ref", "--format=" + _FORMAT] + (refs if refs else ["refs/tags"])
+        # a truncated listing would drop tags silently
+        gitOut, gitError = call(cmd, cwd=self.repoPath, capped=False)
+        entries = []
+        if not gitError:
+            for line in gitOut.splitlines():
+                parts = line.split("\0")
+                if len(parts) == 4:
+                    entries.append((parts[0], parts[2] or parts[1], int(parts[3]) if parts[3] else 0))
+        return entries, addOutput("[+] " + " ".join(cmd), gitOut, gitError), gitError
+
+    def _save(self):
+        data = {"fingerprint": self._fingerprint(), "tags": list(map(lambda x: [x, self._entries[x][0], self._entries[x][1]], self.tags))}
+        try:
+            with open(self.path + ".tmp", "w") as a:
+                json.dump(data, a)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            CONTEXT.LOGGER.warning("Writing tag index of '" + self.repoPath + "' failed: " + str(e))
+
+    def load(self):
+        """
+        Loads the stored index, it is rebuilt with one `git for-each-ref`, if it is missing or outdated.
+
+        :return: output of failed git commands, error
+        :rtype: (str, bool)
+        """
+
+        try:
+            with open(self.path) as a:
+                data = json.load(a)
+            if data.get("fingerprint") == self._fingerprint():
+                self._setTags(map(tuple, data["tags"]))
+                return "", False
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        return self.rebuild()
+
+    def rebuild(self):
+        entries, output, error = self._query()
+        if error:
+            return output, error
+
+        self._setTags(entries)
+        self._save()
+        return "", False
+
+    def applyFetch(self, fetchOutput):
+        """
+        Updates the index with the tag changes reported in the output of `git fetch`.
+        Only new or changed tags are looked up, the index has to be loaded before fetching.
+
+        :param fetchOutput: output of git fetch
+        :type fetchOutput: str
+        """
+
+        if not self._loaded:
+            # state before the fetch is unknown
+            self.load()
+            return
+
+        if _OMITTED.search(fetchOutput):
+            # tag updates in the omitted part would be lost
+            self.rebuild()
+            return
+
+        changed = []
+        deleted = []
+        for line in fetchOutput.splitlines():
+            match = _FETCH_LINE.match(line)
+            if not match or match.group(4).startswith("origin/"):
+                # branch updates
+                continue
+
+            flag, summary, name = match.group(1), match.group(2), match.group(4)
+            if flag == "-":
+                deleted.append(name)
+            elif "tag" in summary or flag in ["t", "+"]:
+                changed.append(name)
+
+        if not changed and not deleted:
+            # refs may have changed anyway (e.g. packed), keep the index valid
+            self._save()
+            return
+
+        entries = dict(map(lambda x: (x, (x,) + self._entries[x][:2]), self.tags))
+        for name in deleted:
+            entries.pop(name, None)
+
+        if changed:
+            updated, output, error = self._query(list(map(lambda x: "refs/tags/" + x, changed)))
+            if error:
+                self.rebuild()
+                return
+            for entry in updated:
+                entries[entry[0]] = entry
+
+        self._setTags(entries.values())
+        self._save()
+
+    def rank(self, tag):
+        """
+        :return: position of *tag* (0 is the newest tag) or None
+        :rtype: int
+        """
+
+        entry = self._entries.get(tag)
+        return entry[2] if entry else None
+
+    def commit(self, tag):
+        entry = self._entries.get(tag)
+        return entry[0] if entry else None
+
+    def history(self, annotations):
+        """
+        Tag history for messages (newest top).
+
+        :param annotations: tag -> annotation
+        :type annotations: dict
+        """
+
+        lines = map(lambda x: "  %s <= %s" % (x, annotations[x]) if x in annotations else "  %s" % x, self.tags)
+        return "History of tags (newest top, oldest bottom):\n" + "\n".join(lines)
@@ -6,6 +6,17 @@ from test_data.testGithub import *
 from test_data.testManual import *
 from test_data.testGitlab import *
 from test_data.testBitbucket import *
+from test_data.testClient import *
+from test_data.testPolicy import *
+from test_data.testMail import *
+from test_data.testStream import *
+from test_data.testMetrics import *
+from test_data.testTracing import *
+from test_data.testSignatures import *
+from test_data.testTags import *
+from test_data.testJobs import *
+from test_data.testContext import *
+from test_data.testDiagnostics import *
 from context import CONTEXT
 import unittest
 
@@ -1,9 +1,24 @@
 # coding=utf-8
+from test_data.fixtures import tempPath
 
 
 CONFIG = {
     "defaultApi": "github",
     
+    # deploy synchronously, tests check the working copies right after the request
+    "concurrency": {
+        "deployWorkers": 0
+    },
+    
+    # keep the logs of the Deployer clean
+    "traces": {
+        "path": tempPath("deploys.jsonl")
+    },
+    
+    "deliveries": {
+        "path": tempPath("deliveries.sqlite")
+    },
+    
     "github": {
         "username": "Kavakuo",
         "baseUrl": "git@github.com:Kavakuo/",
@@ -0,0 +1,99 @@
+# coding=utf-8
+import subprocess, tempfile, shutil, atexit, sys, os
+
+# bare repos served as remote for each api, see baseUrl in test_data.config_test
+REPOS = {
+    "github": "TestRepo",
+    "gitlab": "TestRepo-Gitlab",
+    "bitbucket": "TestRepo-Bitbucket"
+}
+
+_built = dict()
+
+
+def _git(args, cwd, date=None):
+    env = dict(os.environ, GIT_AUTHOR_NAME="Deployer", GIT_AUTHOR_EMAIL="deployer@example.com",
+               GIT_COMMITTER_NAME="Deployer", GIT_COMMITTER_EMAIL="deployer@example.com")
+    if date:
+        env["GIT_AUTHOR_DATE"] = env["GIT_COMMITTER_DATE"] = date
+    subprocess.run(["git"] + args, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _commit(work, number):
+    # one file per commit, tests check for dev<number>.txt in the working copies
+    with open(os.path.join(work, "dev%d.txt" % number), "w") as a:
+        a.write("%d\n" % number)
+    _git(["add", "dev%d.txt" % number], work)
+    _git(["commit", "-q", "-m", "dev%d" % number], work, date="2017-01-01T00:00:%02d" % number)
+
+
+def buildFixtures(root):
+    """
+    Builds the remotes of the test suite as local bare repos at `root/[api]/[repoName].git`:
+
+    * master: dev1 ... dev24, tags dev18 ... dev23 (one second apart, dev23 is the newest tag)
+    * noWhitelist: dev1 ... dev6
+    * develop: master + dev25 ... dev30
+
+    :param root: folder of the fixtures, it is replaced
+    :type root: str
+
+    :return: root
+    :rtype: str
+    """
+
+    shutil.rmtree(root, ignore_errors=True)
+    work = os.path.join(root, "_work")
+    os.makedirs(work)
+
+    _git(["init", "-q"], work)
+    _git(["symbolic-ref", "HEAD", "refs/heads/master"], work)
+    for a in range(1, 25):
+        _commit(work, a)
+        if 18 <= a <= 23:
+            _git(["tag", "dev%d" % a], work)
+        if a == 6:
+            _git(["branch", "noWhitelist"], work)
+
+    _git(["checkout", "-q", "-b", "develop"], work)
+    for a in range(25, 31):
+        _commit(work, a)
+    _git(["checkout", "-q", "master"], work)
+
+    for api, repoName in REPOS.items():
+        _git(["clone", "-q", "--bare", work, os.path.join(root, api, repoName + ".git")], root)
+
+    shutil.rmtree(work)
+    return root
+
+
+def tempPath(*names):
+    """
+    Path in the temporary folder of this test run (removed at exit), e.g. for logs written by tests.
+
+    :rtype: str
+    """
+
+    if "temp" not in _built:
+        _built["temp"] = tempfile.mkdtemp(prefix="deployer-tests-")
+        atexit.register(shutil.rmtree, _built["temp"], True)
+
+    return os.path.join(_built["temp"], *names)
+
+
+def fixturesPath():
+    """
+    Fixtures of this test run, built once into the temporary folder.
+
+    :rtype: str
+    """
+
+    if "root" not in _built:
+        _built["root"] = buildFixtures(tempPath("remotes"))
+
+    return _built["root"]
+
+
+if __name__ == '__main__':
+    # e.g. for benchmarks: python -m test_data.fixtures /tmp/fixtures
+    print(buildFixtures(os.path.realpath(sys.argv[1])))
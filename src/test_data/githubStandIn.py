@@ -0,0 +1,101 @@
+# coding=utf-8
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+import threading, json, time
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class GitHubAPIStandIn(object):
+    def __init__(self, releases=None, repos=None):
+        """
+        Local stand-in for the GitHub API endpoints used by the Deployer.
+
+        :param releases: latest release tag per (username, repoName)
+        :type releases: dict
+
+        :param repos: known repositories (username, repoName), repos with releases are added automatically
+        :type repos: list
+        """
+
+        self.releases = dict(releases or dict())
+        self.repos = set(repos or list()) | set(self.releases.keys())
+
+        # failure injection
+        self.failNext = 0
+        self.delay = 0
+
+        # request log: (path, headers, client address)
+        self.requests = []
+
+        standIn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                standIn._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def etag(tag):
+        return '"%s"' % tag
+
+    def _handle(self, handler):
+        self.requests.append((handler.path, dict(handler.headers.items()), handler.client_address))
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        if self.failNext > 0:
+            self.failNext -= 1
+            return self._send(handler, 503, {"message": "Service Unavailable"})
+
+        parts = handler.path.strip("/").split("/")
+        if len(parts) >= 3 and parts[0] == "repos":
+            key = (parts[1], parts[2])
+
+            if parts[3:] == ["releases", "latest"]:
+                tag = self.releases.get(key)
+                if not tag:
+                    return self._send(handler, 404, {"message": "Not Found"})
+                if handler.headers.get("If-None-Match") == self.etag(tag):
+                    return self._send(handler, 304, None, {"ETag": self.etag(tag)})
+                return self._send(handler, 200, {"tag_name": tag}, {"ETag": self.etag(tag)})
+
+            if len(parts) == 3 and key in self.repos:
+                return self._send(handler, 200, {"name": key[1]})
+
+        self._send(handler, 404, {"message": "Not Found"})
+
+    @staticmethod
+    def _send(handler, status, body, headers=None):
+        data = json.dumps(body).encode() if body is not None else b""
+
+        handler.send_response(status)
+        for k, v in (headers or dict()).items():
+            handler.send_header(k, v)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
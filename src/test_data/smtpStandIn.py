@@ -0,0 +1,76 @@
+# coding=utf-8
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+import threading
+
+
+class _Server(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPStandIn(object):
+    def __init__(self):
+        """
+        Minimal local SMTP server, received mails are stored in `mails` as raw message strings.
+        """
+
+        self.mails = []
+        self.received = threading.Condition()
+
+        standIn = self
+
+        class Handler(StreamRequestHandler):
+            def handle(self):
+                standIn._handle(self)
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def waitForMails(self, count, timeout=5):
+        with self.received:
+            return self.received.wait_for(lambda: len(self.mails) >= count, timeout)
+
+    def _handle(self, handler):
+        def reply(line):
+            handler.wfile.write((line + "\r\n").encode())
+
+        reply("220 localhost SMTPStandIn")
+        while True:
+            line = handler.rfile.readline()
+            if not line:
+                return
+
+            command = line.decode().strip().upper()
+            if command.startswith("EHLO") or command.startswith("HELO"):
+                reply("250 localhost")
+            elif command == "DATA":
+                reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    line = handler.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    data.append(line.decode())
+
+                with self.received:
+                    self.mails.append("".join(data))
+                    self.received.notify_all()
+                reply("250 OK")
+            elif command == "QUIT":
+                reply("221 Bye")
+                return
+            else:
+                reply("250 OK")
@@ -1,7 +1,14 @@
 # coding=utf-8
 import unittest, shutil, os, logging
+from unittest.mock import patch, MagicMock
+from copy import deepcopy
 from context import CONTEXT, reload
+from deliveries import DELIVERIES
+from test_data.fixtures import fixturesPath
+from test_data.githubStandIn import GitHubAPIStandIn
+from functions import addCallObserver, removeCallObserver
 import test_data.config_test as config_test
+import main
 
 def verifyTEST_SEQUENCE(*args):
     sequence = CONTEXT.TEST_SEQUENCE
@@ -21,6 +28,13 @@ def verifyTEST_SEQUENCE(*args):
     return noError
 
 
+class ConfigTestCase(unittest.TestCase):
+    # tests on a copy of the test configuration, CONTEXT.CONFIG is restored afterwards
+    def setUp(self):
+        self.addCleanup(setattr, CONTEXT, "CONFIG", CONTEXT.CONFIG)
+        CONTEXT.CONFIG = deepcopy(config_test.CONFIG)
+
+
 class DeployerTestCase(unittest.TestCase):
     def __init__(self, methodname='runTest'):
         self.latestPush_at_master = "dev24.txt"
@@ -32,21 +46,47 @@ class DeployerTestCase(unittest.TestCase):
         CONTEXT.TESTING = True
         CONTEXT.reloadCONFIG = lambda: None
     
-        for handler in CONTEXT.LOGGER.handlers:
+        for handler in CONTEXT.LOG_LISTENER.handlers:
             if isinstance(handler, logging.StreamHandler):
                 handler.setLevel(logging.INFO)
         
         super(DeployerTestCase, self).__init__(methodName=methodname)
     
+    @classmethod
+    def setUpClass(cls):
+        # latest release of the test repo, other users get a 404 (invalid credentials)
+        cls.standIn = GitHubAPIStandIn(releases={("Kavakuo", "TestRepo"): "dev22"}).start()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.standIn.stop()
+    
     def setUp(self):
         shutil.rmtree(os.path.realpath(config_test.CONFIG["github"]["deployPath"]), True)
         CONTEXT.TEST_SEQUENCE = set()
         
         # reload config_test file to undo testing manipulations
         reload(config_test)
+        
+        # local bare repos and the GitHub API stand-in instead of the network
+        for api in ["github", "gitlab", "bitbucket"]:
+            config_test.CONFIG[api]["baseUrl"] = os.path.join(fixturesPath(), api) + "/"
+        config_test.CONFIG["github"]["apiUrl"] = self.standIn.url
+        
         CONTEXT.CONFIG = config_test.CONFIG
         CONTEXT._loadProtection()
-        pass
+        
+        # every test uses the same delivery id
+        DELIVERIES.clear()
+        
+        # helpers like copy_current_request_context need a real request context,
+        # main.request itself is a mock (the tests patch it again), not the proxy of this context
+        context = main.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        requestPatch = patch("main.request", MagicMock())
+        requestPatch.start()
+        self.addCleanup(requestPatch.stop)
     
     def tearDown(self):
         pass
@@ -60,6 +100,20 @@ class DeployerTestCase(unittest.TestCase):
             "ignoreTag":ignoreTag
         }
     
+    def recordCommands(self):
+        """
+        Records the commands run by `call()` until the end of the test.
+
+        :return: list the command lines are appended to
+        :rtype: list
+        """
+
+        commands = []
+        observer = lambda x: commands.append(x.cmd)
+        addCallObserver(observer)
+        self.addCleanup(removeCallObserver, observer)
+        return commands
+    
     @staticmethod
     def pathRelativeToDeployPath(path):
         ret = os.path.join(os.path.realpath(config_test.CONFIG["github"]["deployPath"]), path)
@@ -103,6 +103,8 @@ class BitbucketTestCase(DeployerTestCase):
     @patch("main.request")
     def test_manualWrongApi(self, requestMock):
         # repo not found, using github default API
+        requestMock.headers = dict()
+        requestMock.args = self.setupArgs()
         main.deploy("TestRepo-Bitbucket")
         
         self.assertTrue(verifyTEST_SEQUENCE())
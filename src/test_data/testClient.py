@@ -0,0 +1,118 @@
+# coding=utf-8
+from test_data.githubStandIn import GitHubAPIStandIn
+from test_data.testBase import ConfigTestCase
+from classes import APISettings, Release, RELEASE_CACHE
+import classes
+from client import APIClient, clientFor
+from context import CONTEXT
+from unittest.mock import patch
+import requests
+
+
+class ClientTestCase(ConfigTestCase):
+    def setUp(self):
+        super(ClientTestCase, self).setUp()
+        self.standIn = GitHubAPIStandIn(releases={("Kavakuo", "TestRepo"): "dev22"}).start()
+
+        CONTEXT.CONFIG["github"]["apiUrl"] = self.standIn.url
+        CONTEXT.CONFIG["github"]["releaseCacheTTL"] = 0
+        CONTEXT.CONFIG["github"]["http"] = {"timeout": 2, "retries": 2, "backoff": 0}
+
+    def tearDown(self):
+        self.standIn.stop()
+
+    def test_keepAlive(self):
+        client = APIClient()
+        client.get(self.standIn.url + "/repos/Kavakuo/TestRepo")
+        client.get(self.standIn.url + "/repos/Kavakuo/TestRepo")
+
+        # both requests used the same connection
+        self.assertEqual(len(self.standIn.requests), 2)
+        self.assertEqual(self.standIn.requests[0][2], self.standIn.requests[1][2])
+
+    def test_retry(self):
+        client = APIClient({"retries": 2, "backoff": 0})
+        self.standIn.failNext = 2
+
+        resp = client.get(self.standIn.url + "/repos/Kavakuo/TestRepo")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(self.standIn.requests), 3)
+
+    def test_retriesExhausted(self):
+        client = APIClient({"retries": 1, "backoff": 0})
+        self.standIn.failNext = 5
+
+        resp = client.get(self.standIn.url + "/repos/Kavakuo/TestRepo")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(len(self.standIn.requests), 2)
+
+    def test_timeout(self):
+        client = APIClient({"timeout": 0.2, "retries": 0})
+        self.standIn.delay = 1
+
+        with self.assertRaises(requests.RequestException):
+            client.get(self.standIn.url + "/repos/Kavakuo/TestRepo")
+
+    def test_releaseRevalidation(self):
+        RELEASE_CACHE.invalidate(("Kavakuo", "TestRepo"))
+
+        for a in range(2):
+            release = Release(APISettings("github"))
+            release.getLatestReleaseTag("TestRepo")
+            self.assertEqual(release.latestReleaseTag, "dev22")
+
+        # second lookup is revalidated with the ETag of the first one
+        paths = list(map(lambda x: x[0], self.standIn.requests))
+        self.assertEqual(paths, ["/repos/Kavakuo/TestRepo/releases/latest"] * 2)
+        self.assertEqual(self.standIn.requests[1][1].get("If-None-Match"), GitHubAPIStandIn.etag("dev22"))
+
+    def test_clientReplaced(self):
+        client = clientFor("github")
+        self.assertIs(clientFor("github"), client)
+
+        # a changed http configuration builds a new client, the old one stays usable for running lookups
+        CONTEXT.CONFIG["github"]["http"] = {"timeout": 3}
+        with patch.object(client.session, "close") as closeMock:
+            self.assertIsNot(clientFor("github"), client)
+            closeMock.assert_not_called()
+        resp = client.get(self.standIn.url + "/repos/Kavakuo/TestRepo")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_releaseCachedOnFailure(self):
+        cachePatch = patch.dict(RELEASE_CACHE._entries, clear=True)
+        cachePatch.start()
+        self.addCleanup(cachePatch.stop)
+        Release(APISettings("github")).getLatestReleaseTag("TestRepo")
+
+        # the API doesn't answer, the expired cache entry is used
+        CONTEXT.CONFIG["github"]["http"] = {"timeout": 0.2, "retries": 0}
+        self.standIn.delay = 1
+        release = Release(APISettings("github"))
+        with self.assertLogs(classes.LOGGER, "CRITICAL"):
+            release.getLatestReleaseTag("TestRepo")
+        self.assertEqual(release.latestReleaseTag, "dev22")
+        self.assertFalse(release.settings.invalidCredentials)
+
+    def test_releaseCachedOnServerError(self):
+        cachePatch = patch.dict(RELEASE_CACHE._entries, clear=True)
+        cachePatch.start()
+        self.addCleanup(cachePatch.stop)
+        Release(APISettings("github")).getLatestReleaseTag("TestRepo")
+
+        # the API still answers 503 after all retries, the expired cache entry is used
+        self.standIn.failNext = 3
+        release = Release(APISettings("github"))
+        with self.assertLogs(classes.LOGGER, "CRITICAL"):
+            release.getLatestReleaseTag("TestRepo")
+        self.assertEqual(release.latestReleaseTag, "dev22")
+        self.assertFalse(release.settings.invalidCredentials)
+        self.assertEqual(len(self.standIn.requests), 4)
+
+    def test_clientOfSnapshot(self):
+        settings = APISettings("github")
+        client = clientFor("github", settings.config)
+
+        # a reload in the middle of the request doesn't change the client of the request
+        CONTEXT.CONFIG = dict(CONTEXT.CONFIG, github=dict(CONTEXT.CONFIG["github"], http={"timeout": 3}))
+        self.assertIs(clientFor("github", settings.config), client)
+        self.assertEqual(clientFor("github").timeout, 3)
@@ -0,0 +1,65 @@
+# coding=utf-8
+from context import CONTEXT
+from unittest.mock import patch
+import unittest, tempfile, shutil, os
+
+
+class ReloadConfigTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.path = os.path.join(self.tmp, "config.py")
+        self.write("CONFIG = {}\n")
+
+        # watch a temporary file, the state of CONTEXT is restored afterwards
+        for name in ["CONFIG", "configPath", "configStat", "configHash"]:
+            self.addCleanup(setattr, CONTEXT, name, getattr(CONTEXT, name))
+        CONTEXT.configPath = self.path
+        CONTEXT.configStat, CONTEXT.configHash = CONTEXT._statConfig(), CONTEXT._calcConfigHash()
+
+        # the test cases of the deployer disable reloads on the instance
+        self.reloadPatch = patch("context.reload")
+        self.reloadMock = self.reloadPatch.start()
+        self.addCleanup(self.reloadPatch.stop)
+
+    def write(self, content, mtime=None):
+        with open(self.path, "w") as a:
+            a.write(content)
+        if mtime:
+            os.utime(self.path, ns=(mtime, mtime))
+
+    @staticmethod
+    def reloadCONFIG():
+        type(CONTEXT).reloadCONFIG(CONTEXT)
+
+    def test_unchangedStat(self):
+        # the file isn't read, if its stat didn't change
+        with patch.object(CONTEXT, "_calcConfigHash") as hashMock:
+            self.reloadCONFIG()
+            hashMock.assert_not_called()
+        self.reloadMock.assert_not_called()
+
+    def test_touchedOnly(self):
+        # same content, only the stat is updated
+        os.utime(self.path, ns=(1, 1))
+        self.reloadCONFIG()
+        self.reloadMock.assert_not_called()
+        self.assertEqual(CONTEXT.configStat, CONTEXT._statConfig())
+
+        with patch.object(CONTEXT, "_calcConfigHash") as hashMock:
+            self.reloadCONFIG()
+            hashMock.assert_not_called()
+
+    def test_failedReload(self):
+        config = CONTEXT.CONFIG
+        self.write("CONFIG = {\n", mtime=1)
+        self.reloadMock.side_effect = SyntaxError("unexpected EOF while parsing")
+
+        with self.assertLogs(CONTEXT.LOGGER, "CRITICAL") as logs:
+            self.reloadCONFIG()
+        self.assertIn("keep using the previous configuration", logs.output[0])
+        self.assertIs(CONTEXT.CONFIG, config)
+
+        # the broken file isn't loaded again until it changes
+        self.reloadCONFIG()
+        self.assertEqual(self.reloadMock.call_count, 1)
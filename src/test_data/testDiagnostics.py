@@ -0,0 +1,41 @@
+# coding=utf-8
+from diagnostics import Diagnostics, PROBES
+from functions import addCallObserver, removeCallObserver
+import main
+import unittest, json
+
+
+class DiagnosticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.commands = []
+        addCallObserver(self.commands.append)
+
+    def tearDown(self):
+        removeCallObserver(self.commands.append)
+
+    def test_probesCached(self):
+        diagnostics = Diagnostics(ttl=60)
+        results = diagnostics.probes()
+        self.assertEqual(list(map(lambda x: x[0], results)), list(map(lambda x: x[0], PROBES)))
+        self.assertEqual(len(self.commands), 2)
+
+        # cached until the ttl expires
+        self.assertIs(diagnostics.probes(), results)
+        self.assertEqual(len(self.commands), 2)
+
+        diagnostics.invalidate()
+        diagnostics.probes()
+        self.assertEqual(len(self.commands), 4)
+
+    def test_report(self):
+        report = Diagnostics().report()
+        self.assertIn("[+] git --version:\n    git version", report)
+        self.assertIn("[+] current sys.path:", report)
+
+    def test_healthz(self):
+        resp = main.app.test_client().get("/healthz")
+        self.assertEqual(resp.status_code, 200)
+
+        health = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(set(health.keys()), {"status", "uptime", "git", "jobs"})
+        self.assertEqual(self.commands, [])
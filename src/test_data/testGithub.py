@@ -5,8 +5,22 @@ from unittest.mock import patch
 from classes import TEST_SEQs
 from context import CONTEXT
 import test_data.config_test as config_test
+from deliveries import DeliveryCache, DELIVERIES, Delivery
+from classes import APISettings, Release, RELEASE_CACHE
+from functions import call
+from metrics import METRICS
+from tracing import DeployTrace, tracePath
+from jobs import WORKING_COPIES
+from flask import Response
 import main
-import os
+import os, shutil, hmac, hashlib, json, time, threading
+
+
+def readTraces():
+    if not os.path.exists(tracePath()):
+        return []
+    with open(tracePath()) as a:
+        return [json.loads(x) for x in a]
 
 
 class GitHubTestCase(DeployerTestCase):
@@ -48,11 +62,23 @@ class GitHubTestCase(DeployerTestCase):
         
 
     def setupRequestMock(self, requestMock, event="push", repo="TestRepo", branch="master", **kwargs):
+        # signed like GitHub does, the secret of the test configuration is set
         requestMock.headers = self.setupHeaders(event)
-        requestMock.get_data.return_value = ""
+        requestMock.get_data.return_value = b""
+        requestMock.headers["X-Hub-Signature-256"] = "sha256=" + hmac.new(b"topSecret", b"", hashlib.sha256).hexdigest()
         requestMock.args = self.setupArgs()
         requestMock.get_json.return_value = self.getJson(event, repo, branch=branch, **kwargs)
     
+    @staticmethod
+    def waitForJob(jobId, timeout=30):
+        # poll /jobs/<id> like a client does
+        deadline = time.time() + timeout
+        while True:
+            job = json.loads(main.jobs(jobId).get_data(as_text=True))
+            if job["status"] not in ["queued", "running"] or time.time() > deadline:
+                return job
+            time.sleep(0.05)
+    
     @patch("main.request")
     def test_push_master(self, requestMock):
         self.setupRequestMock(requestMock)
@@ -62,6 +88,77 @@ class GitHubTestCase(DeployerTestCase):
         self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo"), self.latestPush_at_master)))
         self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
 
+    @patch("main.request")
+    def test_push_coalescedNotTraced(self, requestMock):
+        self.setupRequestMock(requestMock)
+        other = DeployTrace("TestRepo", "master")
+        
+        def coalesced(path, func, variant=None):
+            # another request deploys the working copy, this one only waits for its response
+            WORKING_COPIES._local.joined = True
+            resp = Response("deployed by another request", status=200)
+            resp.deployTrace = other
+            return resp
+        
+        traces = len(readTraces())
+        with patch.object(WORKING_COPIES, "run", coalesced):
+            self.assertEqual(main.github().status_code, 200)
+        self.assertEqual(len(readTraces()), traces)
+        
+        DELIVERIES.clear()
+        main.github()
+        self.assertEqual(len(readTraces()), traces + 1)
+        self.assertEqual(readTraces()[-1]["branch"], "master")
+        self.assertTrue(readTraces()[-1]["steps"])
+
+    @patch("main.request")
+    def test_push_coalescedOutOfOrder(self, requestMock):
+        self.setupRequestMock(requestMock)
+        main.github()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        head = call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip()
+        newer = call(["git", "rev-parse", "HEAD~1"], cwd=repoPath)[0].strip()
+        older = call(["git", "rev-parse", "HEAD~3"], cwd=repoPath)[0].strip()
+        call(["git", "checkout", "-q", "-f", "-B", "master", "HEAD~5"], cwd=repoPath)
+        
+        # another deploy keeps the working copy busy
+        started, release = threading.Event(), threading.Event()
+        busy = threading.Thread(target=lambda: WORKING_COPIES.run(repoPath, lambda: started.set() or release.wait(10), "busy"))
+        busy.start()
+        self.assertTrue(started.wait(10))
+        
+        # two pushes arrive in reverse order and are coalesced
+        responses = dict()
+        def deliver(name, sha, delivery):
+            self.setupRequestMock(requestMock, after=sha)
+            requestMock.headers["X-GitHub-Delivery"] = delivery
+            thread = threading.Thread(target=lambda: responses.__setitem__(name, main.github().get_data(as_text=True)))
+            thread.start()
+            return thread
+        
+        def pending():
+            with WORKING_COPIES._mutex:
+                return list(map(lambda x: x.requests, WORKING_COPIES._pending.values()))
+        
+        threads = [deliver("newer", newer, "newer")]
+        while pending() != [1]:
+            time.sleep(0.01)
+        threads.append(deliver("older", older, "older"))
+        while pending() != [2]:
+            time.sleep(0.01)
+        
+        release.set()
+        busy.join(10)
+        for thread in threads:
+            thread.join(30)
+        
+        # the follow-up deploys the head of the branch, the newer commit isn't lost
+        self.assertEqual(call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip(), head)
+        self.assertEqual(responses["newer"], responses["older"])
+        self.assertNotIn(older[:7], responses["older"])
+
     @patch("main.request")
     def test_push_develop(self, requestMock):
         self.setupRequestMock(requestMock, branch="develop")
@@ -105,6 +202,301 @@ class GitHubTestCase(DeployerTestCase):
         self.assertTrue(not os.path.exists(self.pathRelativeToDeployPath("TestRepo-Tags")))
         self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_tagRequiredNoTag))
 
+    @patch("main.request")
+    def test_push_signature(self, requestMock):
+        self.setupRequestMock(requestMock)
+        requestMock.get_data.return_value = b'{"ref": "refs/heads/master"}'
+        requestMock.headers["X-Hub-Signature-256"] = "sha256=" + hmac.new(b"topSecret", requestMock.get_data.return_value, hashlib.sha256).hexdigest()
+        
+        main.github()
+        self.assertTrue(os.path.exists(self.pathRelativeToDeployPath("TestRepo")))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+    
+    @patch("main.request")
+    def test_push_missingSignature(self, requestMock):
+        self.setupRequestMock(requestMock)
+        del requestMock.headers["X-Hub-Signature-256"]
+        
+        resp = main.github()
+        self.assertEqual(resp.status_code, 401)
+        self.assertFalse(os.path.exists(self.pathRelativeToDeployPath("TestRepo")))
+        self.assertTrue(verifyTEST_SEQUENCE())
+        
+        # without a configured secret nothing is verified
+        config_test.CONFIG["github"]["hmacSecret"] = None
+        main.github()
+        self.assertTrue(os.path.exists(self.pathRelativeToDeployPath("TestRepo")))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+    
+    @patch("main.request")
+    def test_push_invalidSignature(self, requestMock):
+        self.setupRequestMock(requestMock)
+        requestMock.get_data.return_value = b'{"ref": "refs/heads/master"}'
+        requestMock.headers["X-Hub-Signature-256"] = "sha256=" + "0" * 64
+        
+        resp = main.github()
+        self.assertEqual(resp.status_code, 401)
+        self.assertFalse(os.path.exists(self.pathRelativeToDeployPath("TestRepo")))
+        self.assertTrue(verifyTEST_SEQUENCE())
+    
+    @patch("main.request")
+    def test_push_redelivery(self, requestMock):
+        self.setupRequestMock(requestMock)
+        
+        main.github()
+        shutil.rmtree(self.pathRelativeToDeployPath("TestRepo"))
+        
+        # the same delivery again doesn't deploy a second time
+        resp = main.github()
+        self.assertEqual(resp.headers.get("X-Duplicate-Delivery"), "1")
+        self.assertFalse(os.path.exists(self.pathRelativeToDeployPath("TestRepo")))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # deliveries are persisted
+        delivery = DeliveryCache().begin("github:" + self.setupHeaders("push")["X-GitHub-Delivery"])
+        self.assertEqual(delivery.statusCode, resp.status_code)
+
+    @patch("main.request")
+    def test_push_queued(self, requestMock):
+        self.setupRequestMock(requestMock)
+        config_test.CONFIG["concurrency"]["deployWorkers"] = 1
+        
+        resp = main.github()
+        self.assertEqual(resp.status_code, 202)
+        self.assertIn("Deploy job queued with id '" + resp.jobId + "'", resp.get_data(as_text=True))
+        
+        job = self.waitForJob(resp.jobId)
+        self.assertEqual(job["id"], resp.jobId)
+        self.assertEqual(job["name"], "master@TestRepo")
+        self.assertEqual(job["status"], "finished")
+        self.assertEqual(job["statusCode"], 200)
+        self.assertIsNotNone(job["finished"])
+        self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo"), self.latestPush_at_master)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+    
+    @patch("main.request")
+    def test_push_queuedFailed(self, requestMock):
+        self.setupRequestMock(requestMock)
+        config_test.CONFIG["concurrency"]["deployWorkers"] = 1
+        config_test.CONFIG["github"]["baseUrl"] = "/nonexistent/"
+        
+        resp = main.github()
+        self.assertEqual(resp.status_code, 202)
+        
+        job = self.waitForJob(resp.jobId)
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["statusCode"], 500)
+        self.assertFalse(os.path.exists(self.pathRelativeToDeployPath("TestRepo")))
+        self.assertTrue(verifyTEST_SEQUENCE())
+        
+        # unknown ids are answered with 404
+        self.assertEqual(main.jobs("unknown").status_code, 404)
+
+    @patch("main.request")
+    def test_push_failedRedelivery(self, requestMock):
+        self.setupRequestMock(requestMock)
+        baseUrl = config_test.CONFIG["github"]["baseUrl"]
+        config_test.CONFIG["github"]["baseUrl"] = "/nonexistent/"
+        
+        resp = main.github()
+        self.assertEqual(resp.status_code, 500)
+        self.assertTrue(verifyTEST_SEQUENCE())
+        
+        # a failed deploy isn't remembered, redelivering it deploys again
+        config_test.CONFIG["github"]["baseUrl"] = baseUrl
+        resp = main.github()
+        self.assertIsNone(resp.headers.get("X-Duplicate-Delivery"))
+        self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo"), self.latestPush_at_master)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+
+    @patch("main.request")
+    def test_push_filteredNotRemembered(self, requestMock):
+        self.setupRequestMock(requestMock, branch="noWhitelist")
+        main.github()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_autoDeployConfigDisabled))
+        
+        # events without a deploy are not stored
+        key = "github:" + self.setupHeaders("push")["X-GitHub-Delivery"]
+        self.assertNotIn(key, DELIVERIES._entries)
+        self.assertIsNone(DeliveryCache().begin(key))
+
+    def test_delivery_failedClaimTakenOver(self):
+        key = "github:concurrent"
+        self.assertIsNone(DELIVERIES.begin(key))
+        
+        # duplicates wait for the first delivery
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(DELIVERIES.begin(key))) for a in range(3)]
+        for a in threads:
+            a.start()
+        time.sleep(0.2)
+        self.assertEqual(results, [])
+        
+        # the first delivery failed, exactly one duplicate takes over the claim
+        DELIVERIES.finish(key, None)
+        time.sleep(0.2)
+        self.assertEqual(results, [None])
+        
+        # its result is answered to the others
+        DELIVERIES.finish(key, Delivery(200, "deployed", "text/plain"))
+        for a in threads:
+            a.join(5)
+        self.assertEqual(results[0], None)
+        self.assertEqual(list(map(lambda x: x.body, results[1:])), ["deployed", "deployed"])
+
+    @patch("main.request")
+    def test_push_filteredMetricsLabel(self, requestMock):
+        self.setupRequestMock(requestMock, branch="throwaway-1234")
+        main.github()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_autoDeployConfigDisabled))
+        
+        # filtered branches share one label instead of adding a time series each
+        outcomes = dict(METRICS.outcomes.items())
+        self.assertNotIn(("TestRepo", "throwaway-1234", TEST_SEQs.dl_autoDeployConfigDisabled), outcomes)
+        self.assertIn(("TestRepo", "other", TEST_SEQs.dl_autoDeployConfigDisabled), outcomes)
+
+    @patch("main.request")
+    def test_push_payloadSha(self, requestMock):
+        self.setupRequestMock(requestMock)
+        main.github()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        parent = call(["git", "rev-parse", "HEAD~1"], cwd=repoPath)[0].strip()
+        call(["git", "checkout", "-q", "-f", "-B", "master", "HEAD~2"], cwd=repoPath)
+        commands = self.recordCommands()
+        
+        # the commit of the payload is deployed without asking the remote
+        DELIVERIES.clear()
+        self.setupRequestMock(requestMock, after=parent)
+        output = main.github().get_data(as_text=True)
+        self.assertIn("Commit " + parent[:7] + " is already available", output)
+        self.assertFalse(any(map(lambda x: x.startswith("git ls-remote") or x.startswith("git fetch"), commands)))
+        self.assertEqual(call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip(), parent)
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # zero commit id (deleted branch) is ignored
+        DELIVERIES.clear()
+        del commands[:]
+        self.setupRequestMock(requestMock, after="0" * 40)
+        main.github()
+        self.assertTrue(any(map(lambda x: x.startswith("git ls-remote"), commands)))
+        self.assertTrue(os.path.exists(os.path.join(repoPath, self.latestPush_at_master)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+
+    @patch("main.request")
+    def test_push_mirror(self, requestMock):
+        config_test.CONFIG["TestRepo"]["mirror"] = True
+        commands = self.recordCommands()
+        
+        # the first push creates the mirror, the working copy uses its objects
+        self.setupRequestMock(requestMock)
+        main.github()
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        mirrorPath = self.pathRelativeToDeployPath(os.path.join(".mirrors", "TestRepo.git"))
+        self.assertTrue(any(map(lambda x: x.startswith("git clone --bare"), commands)))
+        self.assertEqual(call(["git", "config", "gc.auto"], cwd=mirrorPath)[0].strip(), "0")
+        self.assertTrue(os.path.exists(os.path.join(repoPath, ".git", "objects", "info", "alternates")))
+        self.assertTrue(os.path.exists(os.path.join(repoPath, self.latestPush_at_master)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # the mirror is fetched, if the push doesn't name a commit
+        DELIVERIES.clear()
+        del commands[:]
+        main.github()
+        self.assertTrue(any(map(lambda x: x.startswith("git fetch --prune origin"), commands)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_nothingToDo))
+        
+        # commit of the push is already in the mirror, nothing is fetched
+        DELIVERIES.clear()
+        del commands[:]
+        head = call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip()
+        call(["git", "checkout", "-q", "-f", "-B", "master", "HEAD~1"], cwd=repoPath)
+        self.setupRequestMock(requestMock, after=head)
+        output = main.github().get_data(as_text=True)
+        self.assertIn("Commit " + head[:7] + " is already in the mirror, skipping mirror fetch", output)
+        self.assertFalse(any(map(lambda x: x.startswith("git fetch --prune origin"), commands)))
+        self.assertEqual(call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip(), head)
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_nothingToDo))
+
+    @patch("main.request")
+    def test_push_outOfOrder(self, requestMock):
+        self.setupRequestMock(requestMock)
+        main.github()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # late delivery of an older push doesn't move the branch backwards
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        head = call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip()
+        older = call(["git", "rev-parse", "HEAD~5"], cwd=repoPath)[0].strip()
+        DELIVERIES.clear()
+        self.setupRequestMock(requestMock, after=older)
+        output = main.github().get_data(as_text=True)
+        self.assertIn("Commit " + older[:7] + " is already contained in 'master'", output)
+        self.assertNotIn("Reload script", output)
+        self.assertEqual(call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip(), head)
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_outdatedPush))
+
+    @patch("main.request")
+    def test_push_forcedRollback(self, requestMock):
+        self.setupRequestMock(requestMock)
+        main.github()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # `git push --force` to an older commit is deployed
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        older = call(["git", "rev-parse", "HEAD~5"], cwd=repoPath)[0].strip()
+        DELIVERIES.clear()
+        self.setupRequestMock(requestMock, after=older, forced=True)
+        output = main.github().get_data(as_text=True)
+        self.assertIn("Commit " + older[:7] + " is older than 'master'", output)
+        self.assertEqual(call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip(), older)
+        self.assertFalse(os.path.exists(os.path.join(repoPath, self.latestPush_at_master)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_outdatedPushOW, TEST_SEQs.dl_deploySuccess))
+
+    @patch("main.request")
+    def test_push_droppedEarly(self, requestMock):
+        self.setupRequestMock(requestMock, branch=".Releases")
+        dropped = dict(METRICS.droppedEvents.items()).get(("github", "TestRepo"), 0)
+        
+        # rejected before any release lookup
+        with patch("main.Release") as releaseMock:
+            main.github()
+            releaseMock.assert_not_called()
+        
+        self.assertEqual(dict(METRICS.droppedEvents.items())[("github", "TestRepo")], dropped + 1)
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_releaseOnlyNoRelease))
+
+    @patch("main.request")
+    def test_release_droppedEarly(self, requestMock):
+        # queued deploys would answer with 202
+        config_test.CONFIG["concurrency"]["deployWorkers"] = 1
+        del config_test.CONFIG["TestRepo"]["releasesOnly"]
+        self.setupRequestMock(requestMock, event="release", branch="master", tag_name="dev22")
+        dropped = dict(METRICS.droppedEvents.items()).get(("github", "TestRepo"), 0)
+        requests = len(self.standIn.requests)
+        
+        resp = main.github()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_data(as_text=True), "No release event configured for repo 'TestRepo'!")
+        self.assertEqual(len(self.standIn.requests), requests)
+        self.assertEqual(dict(METRICS.droppedEvents.items())[("github", "TestRepo")], dropped + 1)
+        self.assertTrue(verifyTEST_SEQUENCE())
+
+    @patch("main.request")
+    def test_create_droppedEarly(self, requestMock):
+        config_test.CONFIG["concurrency"]["deployWorkers"] = 1
+        config_test.CONFIG["TestRepo"]["tagsOnly"] = {".Tags": False}
+        self.setupRequestMock(requestMock, event="create", branch="master", tag_name="dev23")
+        dropped = dict(METRICS.droppedEvents.items()).get(("github", "TestRepo"), 0)
+        
+        resp = main.github()
+        self.assertEqual(resp.status_code, 500)
+        self.assertIn("No branch set to tagsOnly mode", resp.get_data(as_text=True))
+        self.assertEqual(dict(METRICS.droppedEvents.items())[("github", "TestRepo")], dropped + 1)
+        self.assertFalse(os.path.exists(self.pathRelativeToDeployPath("TestRepo-Tags")))
+        self.assertTrue(verifyTEST_SEQUENCE())
+
 
 
 
@@ -119,6 +511,34 @@ class GitHubTestCase(DeployerTestCase):
         self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo-Releases"), self.latestReleaseTag)))
         self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
 
+    @patch("main.request")
+    def test_release_cacheInvalidated(self, requestMock):
+        self.addCleanup(self.standIn.releases.update, self.standIn.releases.copy())
+        cachePatch = patch.dict(RELEASE_CACHE._entries, clear=True)
+        cachePatch.start()
+        self.addCleanup(cachePatch.stop)
+        del self.standIn.requests[:]
+        
+        def latestRelease():
+            release = Release(APISettings("github"))
+            release.getLatestReleaseTag("TestRepo")
+            return release.latestReleaseTag
+        
+        # cached within the TTL, even if a new release was published
+        self.assertEqual(latestRelease(), "dev22")
+        self.standIn.releases[("Kavakuo", "TestRepo")] = "dev23"
+        self.assertEqual(latestRelease(), "dev22")
+        self.assertEqual(len(self.standIn.requests), 1)
+        
+        # the release webhook invalidates the cache, the lookup is revalidated with the ETag
+        self.setupRequestMock(requestMock, event="release", branch="master", tag_name="dev23")
+        main.github()
+        self.assertEqual(self.standIn.requests[1][1].get("If-None-Match"), self.standIn.etag("dev22"))
+        self.assertEqual(latestRelease(), "dev23")
+        self.assertEqual(len(self.standIn.requests), 2)
+        self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo-Releases"), self.latestTag)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+
     @patch("main.request")
     def test_release_notNewest(self, requestMock):
         self.setupRequestMock(requestMock, event="release", branch="master", tag_name="dev18")
@@ -152,6 +572,51 @@ class GitHubTestCase(DeployerTestCase):
         self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo-Tags"), self.latestTag)))
         self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
 
+    @patch("main.request")
+    def test_create_reloadedConfig(self, requestMock):
+        self.setupRequestMock(requestMock, event="create", branch="master", tag_name=self.latestTag.replace(".txt", ""))
+        policyFor = main.policyFor
+        
+        def reloadedBefore(*args):
+            # the config is reloaded by another request, the repo was removed
+            CONTEXT.CONFIG = dict(config_test.CONFIG)
+            del CONTEXT.CONFIG["TestRepo"]
+            return policyFor(*args)
+        
+        # the event is handled with the configuration it started with
+        with patch("main.policyFor", reloadedBefore):
+            resp = main.github()
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo-Tags"), self.latestTag)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+
+    @patch("main.request")
+    def test_create_mirrorFetchedOnce(self, requestMock):
+        config_test.CONFIG["TestRepo"]["mirror"] = True
+        config_test.CONFIG["TestRepo"]["tagsOnly"][".Tags2"] = True
+        commands = self.recordCommands()
+        self.setupRequestMock(requestMock, event="create", branch="master", tag_name=self.latestTag.replace(".txt", ""))
+        
+        main.github()
+        self.assertEqual(len(list(filter(lambda x: x.startswith("git clone --bare"), commands))), 1)
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # one remote fetch for both branches, the working copies fetch from the mirror
+        DELIVERIES.clear()
+        del commands[:]
+        main.github()
+        remote = config_test.CONFIG["github"]["baseUrl"]
+        self.assertEqual(len(list(filter(lambda x: x.startswith("git fetch --prune origin"), commands))), 1)
+        self.assertFalse(any(map(lambda x: x.startswith("git clone") or remote in x, commands)))
+        # the fetch of the mirror is traced on its own
+        mirrorTrace = list(filter(lambda x: x["branch"] is None, readTraces()))[-1]
+        self.assertEqual(mirrorTrace["statusCode"], 200)
+        self.assertEqual([x["stage"] for x in mirrorTrace["steps"]], ["mirror"])
+        self.assertTrue(mirrorTrace["steps"][0]["command"].startswith("git fetch --prune origin"))
+        for name in ["TestRepo-Tags", "TestRepo-Tags2"]:
+            self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath(name), self.latestTag)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_nothingToDo))
+
     @patch("main.request")
     def test_create_notLatestTag(self, requestMock):
         self.setupRequestMock(requestMock, event="create", branch="master", tag_name="dev18")
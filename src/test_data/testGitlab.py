@@ -3,6 +3,7 @@ from test_data.testBase import DeployerTestCase, verifyTEST_SEQUENCE
 from unittest.mock import patch
 from classes import TEST_SEQs
 from context import CONTEXT
+from functions import call
 import test_data.config_test as config_test
 import main
 import os
@@ -31,7 +32,8 @@ class GitlabTestCase(DeployerTestCase):
                     "name": repoName
                 },
                 "object_kind": "tag_push",
-                "ref": "refs/tags/"+kwargs["tag_name"]
+                "ref": "refs/tags/"+kwargs["tag_name"],
+                "checkout_sha": kwargs.get("checkout_sha")
             }
         
     def setupRequestMock(self, requestMock, event="Push Hook", repo="TestRepo-Gitlab", branch="master", **kwargs):
@@ -67,6 +69,38 @@ class GitlabTestCase(DeployerTestCase):
         self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_autoDeployConfigDisabled))
 
 
+    @patch("main.request")
+    def test_push_forcedRollback(self, requestMock):
+        self.setupRequestMock(requestMock)
+        main.gitlab()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # GitLab doesn't flag forced pushes, the remote branch was reset to the older commit
+        repoPath = self.pathRelativeToDeployPath("TestRepo-Gitlab")
+        remotePath = os.path.join(config_test.CONFIG["gitlab"]["baseUrl"], "TestRepo-Gitlab.git")
+        head = call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip()
+        older = call(["git", "rev-parse", "HEAD~5"], cwd=repoPath)[0].strip()
+        call(["git", "update-ref", "refs/heads/master", older], cwd=remotePath)
+        self.addCleanup(call, ["git", "update-ref", "refs/heads/master", head], cwd=remotePath)
+        
+        self.setupRequestMock(requestMock, checkout_sha=older)
+        output = main.gitlab().get_data(as_text=True)
+        self.assertIn("Commit " + older[:7] + " is older than 'master'", output)
+        self.assertEqual(call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip(), older)
+        self.assertFalse(os.path.exists(os.path.join(repoPath, self.latestPush_at_master)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_outdatedPushOW, TEST_SEQs.dl_deploySuccess))
+        
+        # a late delivery of an older push is still dropped
+        call(["git", "update-ref", "refs/heads/master", head], cwd=remotePath)
+        self.setupRequestMock(requestMock)
+        main.gitlab()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        self.setupRequestMock(requestMock, checkout_sha=older)
+        output = main.gitlab().get_data(as_text=True)
+        self.assertIn("Commit " + older[:7] + " is already contained in 'master'", output)
+        self.assertEqual(call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip(), head)
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_outdatedPush))
+
     # release
     @patch("main.request")
     def test_push_releaseOnly(self, requestMock):
@@ -102,4 +136,50 @@ class GitlabTestCase(DeployerTestCase):
         main.gitlab()
         self.assertTrue(os.path.exists(self.pathRelativeToDeployPath("TestRepo-Gitlab-Tags")))
         self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo-Gitlab-Tags"), self.latestTag)))
-        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess, TEST_SEQs.dl_notNewestTag))
\ No newline at end of file
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess, TEST_SEQs.dl_notNewestTag))
+
+    @patch("main.request")
+    def test_create_dirtyWorkingCopy(self, requestMock):
+        tag = self.latestTag.replace(".txt", "")
+        self.setupRequestMock(requestMock, event="Tag Push Hook", branch="master", tag_name=tag)
+        main.gitlab()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # older checkout with a changed file and an untracked file in the way of the tag
+        repoPath = self.pathRelativeToDeployPath("TestRepo-Gitlab-Tags")
+        call(["git", "checkout", "-q", "-f", "dev18"], cwd=repoPath)
+        os.remove(os.path.join(repoPath, ".git", "DEPLOYED_HEAD"))
+        for name in ["dev1.txt", self.latestTag]:
+            with open(os.path.join(repoPath, name), "w") as a:
+                a.write("local change\n")
+        
+        main.gitlab()
+        for name, content in [("dev1.txt", "1\n"), (self.latestTag, "23\n")]:
+            with open(os.path.join(repoPath, name)) as a:
+                self.assertEqual(a.read(), content)
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+
+    @patch("main.request")
+    def test_create_tagFetchOnly(self, requestMock):
+        tag = self.latestTag.replace(".txt", "")
+        self.setupRequestMock(requestMock, event="Tag Push Hook", branch="master", tag_name="dev18")
+        main.gitlab()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess, TEST_SEQs.dl_notNewestTag))
+
+        commands = self.recordCommands()
+
+        # existing working copy, only the tag is fetched
+        self.setupRequestMock(requestMock, event="Tag Push Hook", branch="master", tag_name=tag)
+        main.gitlab()
+        self.assertEqual(list(filter(lambda x: x.startswith("git fetch"), commands)), ["git fetch origin +refs/tags/%s:refs/tags/%s" % (tag, tag)])
+        self.assertFalse(any(map(lambda x: x.startswith("git checkout -f -B") or x.startswith("git clean"), commands)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_nothingToDo))
+
+        # commit of the payload is already available
+        del commands[:]
+        sha, error = call(["git", "rev-parse", tag + "^{commit}"], cwd=self.pathRelativeToDeployPath("TestRepo-Gitlab-Tags"))
+        self.setupRequestMock(requestMock, event="Tag Push Hook", branch="master", tag_name=tag, checkout_sha=sha.strip())
+        output = main.gitlab().get_data(as_text=True)
+        self.assertIn("skipping fetch", output)
+        self.assertFalse(any(map(lambda x: x.startswith("git fetch"), commands)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_nothingToDo))
@@ -0,0 +1,221 @@
+# coding=utf-8
+from test_data.testBase import ConfigTestCase
+from jobs import BranchPool, WorkingCopyLocks, JobQueue
+from context import CONTEXT
+from flask import Response
+import unittest, threading, time
+
+
+def waitFor(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("condition not met within %g seconds" % timeout)
+        time.sleep(0.01)
+
+
+class WorkingCopyLocksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.locks = WorkingCopyLocks()
+        self.runs = []
+        self.funcs = dict()
+        self.results = dict()
+        self.joined = dict()
+        self.coalesced = dict()
+        self.threads = []
+        self.addCleanup(self.joinAll)
+
+    def joinAll(self):
+        for thread in self.threads:
+            thread.join(10)
+
+    def deploy(self, name, path="/deploy/TestRepo", variant=None, release=None, started=None):
+        # deploy in a request thread, *started* is set when the deploy runs, *release* lets it finish
+        def func():
+            self.runs.append(name)
+            self.coalesced[name] = self.locks.coalesced()
+            if started:
+                started.set()
+            if release:
+                self.assertTrue(release.wait(10))
+            return name
+        self.funcs[name] = func
+
+        def request():
+            self.results[name] = self.locks.run(path, func, variant)
+            self.joined[name] = self.locks.joined()
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        self.threads.append(thread)
+        return thread
+
+    def pending(self, path="/deploy/TestRepo", variant=None):
+        with self.locks._mutex:
+            return self.locks._pending.get((path, variant))
+
+    def test_serialized(self):
+        started, release = threading.Event(), threading.Event()
+        self.deploy("first", release=release, started=started)
+        self.assertTrue(started.wait(10))
+
+        # the second deploy waits for the running one
+        second = self.deploy("second")
+        waitFor(lambda: self.pending() is not None)
+        self.assertEqual(self.runs, ["first"])
+
+        release.set()
+        second.join(10)
+        self.assertEqual(self.runs, ["first", "second"])
+        self.assertEqual(self.results, {"first": "first", "second": "second"})
+        self.assertEqual(self.coalesced, {"first": False, "second": False})
+
+    def test_coalesced(self):
+        started, release = threading.Event(), threading.Event()
+        self.deploy("running", release=release, started=started)
+        self.assertTrue(started.wait(10))
+
+        # requests arriving meanwhile collapse into one follow-up deploy of the newest request
+        self.deploy("older")
+        waitFor(lambda: self.pending() is not None)
+        for name in ["old", "newest"]:
+            self.deploy(name)
+            waitFor(lambda: self.pending().func is self.funcs[name])
+
+        release.set()
+        self.joinAll()
+        self.assertEqual(self.runs, ["running", "newest"])
+        self.assertEqual(self.results, {"running": "running", "older": "newest", "old": "newest", "newest": "newest"})
+        # the first waiting request runs the deploy of the newest one
+        self.assertEqual(self.joined, {"running": False, "older": False, "old": True, "newest": True})
+        # the follow-up deploy knows it stands for several requests
+        self.assertEqual(self.coalesced, {"running": False, "newest": True})
+        self.assertFalse(self.locks.coalesced())
+
+    def test_variantsNotCoalesced(self):
+        started, release = threading.Event(), threading.Event()
+        self.deploy("running", release=release, started=started)
+        self.assertTrue(started.wait(10))
+
+        self.deploy("dev22", variant="dev22")
+        self.deploy("dev23", variant="dev23")
+        waitFor(lambda: self.pending(variant="dev22") is not None and self.pending(variant="dev23") is not None)
+
+        release.set()
+        self.joinAll()
+        self.assertEqual(self.runs[0], "running")
+        self.assertEqual(sorted(self.runs[1:]), ["dev22", "dev23"])
+
+    def test_pathsIndependent(self):
+        # both deploys wait for each other, only possible if they run at the same time
+        barrier = threading.Barrier(2, timeout=10)
+        for path in ["/deploy/TestRepo", "/deploy/TestRepo-develop"]:
+            self.threads.append(threading.Thread(target=lambda x: self.locks.run(x, barrier.wait), args=(path,)))
+            self.threads[-1].start()
+
+        self.joinAll()
+        self.assertFalse(barrier.broken)
+
+
+class BranchPoolTestCase(ConfigTestCase):
+    def setUp(self):
+        super(BranchPoolTestCase, self).setUp()
+        self.concurrency = CONTEXT.CONFIG["concurrency"]
+        self.concurrency.update(branchWorkers=4, hostLimit=2)
+        self.pool = BranchPool()
+
+        self.active = 0
+        self.maxActive = 0
+        self.counterLock = threading.Lock()
+
+    def track(self, func):
+        def wrapper(item):
+            with self.counterLock:
+                self.active += 1
+                self.maxActive = max(self.maxActive, self.active)
+            try:
+                return func(item)
+            finally:
+                with self.counterLock:
+                    self.active -= 1
+        return wrapper
+
+    def test_fanOut(self):
+        # every branch waits for the others, only possible if all run at once
+        self.concurrency["hostLimit"] = 4
+        barrier = threading.Barrier(4, timeout=10)
+        results = self.pool.map(self.track(lambda x: (barrier.wait(), x * 2)[1]), [1, 2, 3, 4], "git@github.com:user/")
+
+        self.assertEqual(results, [2, 4, 6, 8])
+        self.assertEqual(self.maxActive, 4)
+
+    def test_hostLimit(self):
+        # pairs meet at the barrier, a third deploy to the same host would have to wait
+        barrier = threading.Barrier(2, timeout=10)
+        results = self.pool.map(self.track(lambda x: (barrier.wait(), x)[1]), [1, 2, 3, 4], "git@github.com:user/")
+
+        self.assertEqual(results, [1, 2, 3, 4])
+        self.assertEqual(self.maxActive, 2)
+
+    def test_hostsIndependent(self):
+        self.pool._setup()
+        first = self.pool._hostSemaphore("github.com")
+        self.assertIsNot(first, self.pool._hostSemaphore("gitlab.com"))
+        self.assertIs(first, self.pool._hostSemaphore("github.com"))
+
+    def test_sequential(self):
+        self.concurrency["branchWorkers"] = 0
+        threads = set()
+        results = self.pool.map(lambda x: threads.add(threading.current_thread()) or x, [1, 2, 3], "git@github.com:user/")
+
+        self.assertEqual(results, [1, 2, 3])
+        self.assertEqual(threads, {threading.current_thread()})
+
+    def test_resizeWhileMapping(self):
+        pool = self.pool
+        hostSemaphore = pool._hostSemaphore
+
+        def resizeFirst(host):
+            # another event with a changed configuration replaces the executor before this map submits
+            pool._hostSemaphore = hostSemaphore
+            self.concurrency["branchWorkers"] = 2
+            self.assertEqual(pool.map(lambda x: x, [3, 4], "git@github.com:user/"), [3, 4])
+            return hostSemaphore(host)
+
+        pool._hostSemaphore = resizeFirst
+        self.assertEqual(pool.map(lambda x: x, [1, 2], "git@github.com:user/"), [1, 2])
+        self.assertEqual(pool._workers, 2)
+
+
+class JobQueueTestCase(ConfigTestCase):
+    def setUp(self):
+        super(JobQueueTestCase, self).setUp()
+        self.concurrency = CONTEXT.CONFIG["concurrency"]
+        self.jobs = JobQueue()
+
+    def alive(self):
+        return len(list(filter(lambda x: x.is_alive(), self.jobs._threads)))
+
+    def submit(self):
+        job = self.jobs.submit("job", lambda: Response(threading.current_thread().name))
+        self.assertTrue(job.done.wait(10))
+        return job
+
+    def test_resize(self):
+        self.concurrency["deployWorkers"] = 3
+        self.assertTrue(self.submit().wasQueued)
+        self.assertEqual(self.alive(), 3)
+
+        # a reloaded configuration with less workers retires the surplus ones
+        self.concurrency["deployWorkers"] = 1
+        self.assertTrue(self.submit().wasQueued)
+        waitFor(lambda: self.alive() == 1)
+        self.assertEqual(self.jobs.depth(), 0)
+
+        # without workers jobs run synchronously and the last worker exits
+        self.concurrency["deployWorkers"] = 0
+        job = self.submit()
+        self.assertFalse(job.wasQueued)
+        self.assertEqual(job.output, threading.current_thread().name)
+        waitFor(lambda: self.alive() == 0)
+
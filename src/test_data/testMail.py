@@ -0,0 +1,76 @@
+# coding=utf-8
+from test_data.smtpStandIn import SMTPStandIn
+from utils import logger
+import unittest, logging, queue, time
+
+
+class MailTestCase(unittest.TestCase):
+    def setUp(self):
+        self.standIn = SMTPStandIn().start()
+        self.logger = logging.getLogger("MailTestCase")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.listener = None
+
+    def tearDown(self):
+        if self.listener:
+            self.listener.stop()
+        self.logger.handlers = []
+        self.standIn.stop()
+
+    def setupDigest(self, **kwargs):
+        smtpHandler = logging.handlers.SMTPHandler(self.standIn.address, "deployer@localhost", ["admin@localhost"], "Deployer")
+        digest = logger.configureHandler(logger.DigestMailHandler(smtpHandler, **kwargs), logger.PNMailLogFormatter(), logLevel=logging.INFO)
+        digest.addFilter(logger.MailFilter())
+
+        self.listener = logger.QueueListener(queue.Queue(), digest, respect_handler_level=True)
+        self.listener.start()
+        self.logger.handlers = [logger.QueueHandler(self.listener.queue)]
+        return digest
+
+    def test_digest(self):
+        self.setupDigest(window=0.3)
+
+        for a in range(5):
+            self.logger.critical("deploy %d failed" % a)
+        self.logger.info("not mailed")
+        self.logger.info("deploy successful", extra={"mail": True})
+
+        self.assertTrue(self.standIn.waitForMails(1))
+        time.sleep(0.5)
+
+        # all messages in one mail
+        self.assertEqual(len(self.standIn.mails), 1)
+        mail = self.standIn.mails[0]
+        self.assertIn("deploy 4 failed", mail)
+        self.assertIn("deploy successful", mail)
+        self.assertNotIn("not mailed", mail)
+
+    def test_rateLimit(self):
+        digest = self.setupDigest(window=0, maxMails=2, maxRecords=3)
+
+        for a in range(10):
+            self.logger.critical("failure %d" % a)
+
+        self.assertTrue(self.standIn.waitForMails(2))
+        time.sleep(0.3)
+        self.assertEqual(len(self.standIn.mails), 2)
+
+        # remaining messages are sent as one mail on close, above maxRecords only counted
+        self.listener.stop()
+        self.listener = None
+        digest.close()
+
+        self.assertTrue(self.standIn.waitForMails(3))
+        self.assertIn("failure 4", self.standIn.mails[2])
+        self.assertNotIn("failure 5", self.standIn.mails[2])
+        self.assertIn("5 further messages were dropped", self.standIn.mails[2])
+
+    def test_requestNotBlocked(self):
+        self.setupDigest(window=0)
+        self.standIn.stop()
+
+        # log calls return immediately, even if the mail server is gone
+        start = time.time()
+        self.logger.critical("mail server down")
+        self.assertLess(time.time() - start, 0.1)
@@ -3,6 +3,7 @@
 from test_data.testBase import DeployerTestCase, verifyTEST_SEQUENCE
 from unittest.mock import patch
 from classes import TEST_SEQs
+from functions import call
 from context import CONTEXT
 import test_data.config_test as config_test
 import main
@@ -27,6 +28,71 @@ class ManualTestCase(DeployerTestCase):
         self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo"), self.latestPush_at_master)))
         self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
 
+    @patch("main.request")
+    def test_update(self, requestMock):
+        requestMock.args = self.setupArgs()
+        self.deployWrap()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # outdated working copy with local changes
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        call(["git", "checkout", "-q", "-f", "-B", "master", "HEAD~3"], cwd=repoPath)
+        call(["git", "update-ref", "refs/remotes/origin/master", "HEAD"], cwd=repoPath)
+        os.remove(os.path.join(repoPath, ".git", "DEPLOYED_HEAD"))
+        with open(os.path.join(repoPath, "dev1.txt"), "w") as a:
+            a.write("changed\n")
+        with open(os.path.join(repoPath, "untracked.txt"), "w") as a:
+            a.write("untracked\n")
+        
+        # one fetch, then a single checkout resets branch, index and files
+        commands = self.recordCommands()
+        self.deployWrap()
+        gitCommands = list(filter(lambda x: x.startswith("git ") and not x.startswith("git rev-parse") and not x.startswith("git for-each-ref"), commands))
+        self.assertEqual(gitCommands[1:], ["git fetch", "git checkout -f -B master origin/master", "git clean -d -f"])
+        self.assertTrue(gitCommands[0].startswith("git ls-remote origin refs/heads/master"))
+        self.assertTrue(os.path.exists(os.path.join(repoPath, self.latestPush_at_master)))
+        self.assertFalse(os.path.exists(os.path.join(repoPath, "untracked.txt")))
+        with open(os.path.join(repoPath, "dev1.txt")) as a:
+            self.assertEqual(a.read(), "1\n")
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # nothing is fetched or reset, if the remote didn't move
+        del commands[:]
+        self.deployWrap()
+        self.assertFalse(any(map(lambda x: x.startswith("git fetch") or x.startswith("git checkout"), commands)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_nothingToDo))
+
+    @patch("main.request")
+    def test_nothingToDo(self, requestMock):
+        requestMock.args = self.setupArgs()
+        requestMock.headers = {"Host": "localhost"}
+        self.deployWrap()
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # the deployed commit is recorded in the working copy
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        head = call(["git", "rev-parse", "HEAD"], cwd=repoPath)[0].strip()
+        with open(os.path.join(repoPath, ".git", "DEPLOYED_HEAD")) as a:
+            self.assertEqual(a.read().strip(), head)
+        
+        # reload script counting its runs
+        reloads = os.path.join(repoPath, ".git", "reloads")
+        with open(os.path.join(repoPath, "reload"), "w") as a:
+            a.write("#!/bin/sh\necho $1 >> " + reloads + "\n")
+        os.chmod(os.path.join(repoPath, "reload"), 0o755)
+        
+        resp = main.deploy("TestRepo", "master")
+        self.assertIn("Nothing to do, commit " + head[:7] + " is already deployed", resp.get_data(as_text=True))
+        self.assertFalse(os.path.exists(reloads))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_nothingToDo))
+        
+        # force=1 runs the reload script anyway
+        requestMock.args = self.setupArgs(force=True)
+        self.deployWrap()
+        with open(reloads) as a:
+            self.assertEqual(a.read(), "master\n")
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess, TEST_SEQs.dl_nothingToDoOW))
+
     @patch("main.request")
     def test_develop(self, requestMock):
         # pull latest push@develop
@@ -199,4 +265,79 @@ class ManualTestCase(DeployerTestCase):
     
         self.assertTrue(os.path.exists(self.pathRelativeToDeployPath("TestRepo-Tags")))
         self.assertTrue(os.path.exists(os.path.join(self.pathRelativeToDeployPath("TestRepo-Tags"), self.latestReleaseTag)))
-        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess, TEST_SEQs.dl_nwhTagLatestRelease))
\ No newline at end of file
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess, TEST_SEQs.dl_nwhTagLatestRelease))
+
+
+    # clone options
+    def cloneWith(self, **options):
+        # git ignores --depth and --filter for plain local paths
+        config_test.CONFIG["TestRepo"]["clone"] = options
+        config_test.CONFIG["github"]["baseUrl"] = "file://" + config_test.CONFIG["github"]["baseUrl"]
+        
+        return self.recordCommands()
+    
+    @staticmethod
+    def git(args, path):
+        return call(["git"] + args, cwd=path)[0].strip()
+    
+    @patch("main.request")
+    def test_cloneDepth(self, requestMock):
+        requestMock.args = self.setupArgs()
+        commands = self.cloneWith(depth=1)
+        
+        self.deployWrap()
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        self.assertTrue(any(map(lambda x: x.startswith("git clone --depth=1 --no-single-branch -b master"), commands)))
+        self.assertEqual(self.git(["rev-list", "--count", "HEAD"], repoPath), "1")
+        self.assertTrue(os.path.exists(os.path.join(repoPath, self.latestPush_at_master)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+        
+        # updates fetch with the same depth
+        del commands[:]
+        self.git(["checkout", "-q", "-f", "-B", "master", "origin/develop"], repoPath)
+        self.git(["update-ref", "refs/remotes/origin/master", "origin/develop"], repoPath)
+        requestMock.args = self.setupArgs(force=True)
+        self.deployWrap()
+        self.assertIn("git fetch --depth=1", commands)
+        self.assertEqual(self.git(["rev-parse", "--is-shallow-repository"], repoPath), "true")
+        self.assertTrue(os.path.exists(os.path.join(repoPath, self.latestPush_at_master)))
+        self.assertFalse(os.path.exists(os.path.join(repoPath, self.latestPush_at_develop)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess, TEST_SEQs.dl_nothingToDoOW))
+    
+    @patch("main.request")
+    def test_cloneSingleBranch(self, requestMock):
+        requestMock.args = self.setupArgs()
+        commands = self.cloneWith(singleBranch=True)
+        
+        self.deployWrap()
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        self.assertTrue(any(map(lambda x: x.startswith("git clone --single-branch -b master"), commands)))
+        self.assertNotIn("origin/develop", self.git(["branch", "-r"], repoPath))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+    
+    @patch("main.request")
+    def test_cloneFilter(self, requestMock):
+        requestMock.args = self.setupArgs()
+        commands = self.cloneWith(filter="blob:none")
+        
+        self.deployWrap()
+        repoPath = self.pathRelativeToDeployPath("TestRepo")
+        self.assertTrue(any(map(lambda x: x.startswith("git clone --filter=blob:none -b master"), commands)))
+        self.assertEqual(self.git(["config", "remote.origin.partialclonefilter"], repoPath), "blob:none")
+        self.assertTrue(os.path.exists(os.path.join(repoPath, self.latestPush_at_master)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+    
+    @patch("main.request")
+    def test_shallowTag(self, requestMock):
+        # tags outside of the shallow history are fetched before the tag is deployed
+        requestMock.args = self.setupArgs()
+        commands = self.cloneWith(depth=1)
+        
+        self.deployWrap(branch=".Tags", tag="dev23")
+        repoPath = self.pathRelativeToDeployPath("TestRepo-Tags")
+        fetch = commands.index("git fetch --tags --depth=1")
+        self.assertLess(fetch, commands.index("git checkout -f dev23"))
+        self.assertTrue(os.path.exists(os.path.join(repoPath, self.latestTag)))
+        self.assertFalse(os.path.exists(os.path.join(repoPath, self.latestPush_at_master)))
+        self.assertTrue(verifyTEST_SEQUENCE(TEST_SEQs.dl_deploySuccess))
+
@@ -0,0 +1,42 @@
+# coding=utf-8
+from metrics import Metrics, Histogram, commandStage
+from functions import CommandResult
+import unittest
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_commandStage(self):
+        self.assertEqual(commandStage("git clone -b master url ."), "clone")
+        self.assertEqual(commandStage("git clone --bare url ."), "mirror")
+        self.assertEqual(commandStage("git fetch origin"), "fetch")
+        self.assertEqual(commandStage("git checkout -f -B master origin/master"), "reset")
+        self.assertEqual(commandStage("git checkout dev22"), "checkout")
+        self.assertEqual(commandStage("/deploy/TestRepo/reload master localhost"), "reload")
+        self.assertEqual(commandStage("which git"), "other")
+
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "Test.", ("stage",), buckets=(1, 10))
+        histogram.observe(("clone",), 0.5)
+        histogram.observe(("clone",), 5)
+
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="clone",le="1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="clone",le="10"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="clone",le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_count{stage="clone"} 2', lines)
+
+    def test_labels(self):
+        metrics = Metrics()
+        result = CommandResult("git fetch origin")
+        result.exitCode = 0
+        result.wallTime = 2
+
+        with metrics.deploy("TestRepo", "develop"):
+            metrics.observeCommand(result)
+            metrics.outcome("dl_deploySuccess")
+
+        output = metrics.render()
+        self.assertIn('deployer_stage_duration_seconds_count{repo="TestRepo",branch="develop",stage="fetch"} 1', output)
+        self.assertIn('deployer_outcomes_total{repo="TestRepo",branch="develop",outcome="dl_deploySuccess"} 1', output)
+        self.assertIn('deployer_commands_total{stage="fetch",result="ok"} 1', output)
+        self.assertIn("deployer_deploys_in_flight 0", output)
@@ -0,0 +1,57 @@
+# coding=utf-8
+from classes import BranchPolicy, policyFor
+from context import CONTEXT
+from test_data.testBase import ConfigTestCase
+from copy import deepcopy
+
+
+class PolicyTestCase(ConfigTestCase):
+    def test_lists(self):
+        policy = BranchPolicy({
+            "whitelistedBranches": ["master", "dev.*"],
+            "blacklistedBranches": ["devNo"]
+        })
+
+        self.assertTrue(policy.evaluate("master").allowed)
+        self.assertTrue(policy.evaluate("develop").allowed)
+        self.assertTrue(policy.evaluate(".Tags").allowed)
+        self.assertTrue(policy.evaluate("devNo").blacklisted)
+        self.assertTrue(policy.evaluate("feature").notWhitelisted)
+        self.assertFalse(policy.evaluate("xdev").allowed)
+
+    def test_inlineFlags(self):
+        policy = BranchPolicy({
+            "whitelistedBranches": ["develop", "(?i)master"],
+            "blacklistedBranches": ["(?i)DEVNO", "feature/(x|y)"]
+        })
+
+        self.assertTrue(policy.evaluate("MASTER").allowed)
+        self.assertTrue(policy.evaluate("develop").allowed)
+        # the flag applies only to its own pattern
+        self.assertTrue(policy.evaluate("DEVELOP").notWhitelisted)
+        self.assertTrue(policy.evaluate("devno").blacklisted)
+
+    def test_modes(self):
+        policy = BranchPolicy({
+            "whitelistedBranches": ["master"],
+            "releasesOnly": True,
+            "tagsOnly": {".Tags": True, "develop": False}
+        })
+
+        self.assertTrue(policy.evaluate("master").releaseOnly)
+        self.assertFalse(policy.evaluate("master").tagsOnly)
+        self.assertTrue(policy.evaluate(".Tags").tagsOnly)
+        self.assertEqual(policy.releasesOnlyBranches, ["master"])
+        self.assertEqual(policy.tagsOnlyBranches, [".Tags"])
+
+    def test_unconfigured(self):
+        decision = policyFor("UnknownRepo").evaluate("feature")
+        self.assertTrue(decision.allowed)
+        self.assertFalse(decision.releaseOnly or decision.tagsOnly)
+
+    def test_rebuiltOnReload(self):
+        policy = policyFor("TestRepo")
+        self.assertIs(policyFor("TestRepo"), policy)
+
+        CONTEXT.CONFIG = deepcopy(CONTEXT.CONFIG)
+        self.assertIsNot(policyFor("TestRepo"), policy)
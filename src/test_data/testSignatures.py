@@ -0,0 +1,53 @@
+# coding=utf-8
+from signatures import SignatureVerifier, verifierFor
+from classes import APISettings
+from context import CONTEXT
+from test_data.testBase import ConfigTestCase
+from copy import deepcopy
+import hmac, hashlib
+
+
+class SignatureTestCase(ConfigTestCase):
+    def setUp(self):
+        super(SignatureTestCase, self).setUp()
+        self.verifier = SignatureVerifier(b"topSecret")
+        self.body = b'{"ref": "refs/heads/master"}'
+
+    def sign(self, digest, prefix, body=None):
+        return prefix + "=" + hmac.new(b"topSecret", body or self.body, digest).hexdigest()
+
+    def test_sha256(self):
+        headers = {"X-Hub-Signature-256": self.sign(hashlib.sha256, "sha256")}
+        self.assertTrue(self.verifier.verifyHmac(headers, self.body))
+        self.assertFalse(self.verifier.verifyHmac(headers, self.body + b" "))
+
+    def test_sha1(self):
+        headers = {"X-Hub-Signature": self.sign(hashlib.sha1, "sha1")}
+        self.assertTrue(self.verifier.verifyHmac(headers, self.body))
+
+    def test_sha256Preferred(self):
+        # a valid legacy signature doesn't help, if the sha256 signature is wrong
+        headers = {
+            "X-Hub-Signature-256": "sha256=" + "0" * 64,
+            "X-Hub-Signature": self.sign(hashlib.sha1, "sha1")
+        }
+        self.assertFalse(self.verifier.verifyHmac(headers, self.body))
+
+    def test_oversizedBody(self):
+        CONTEXT.CONFIG["maxBodySize"] = 16
+        headers = {"X-Hub-Signature-256": self.sign(hashlib.sha256, "sha256")}
+        self.assertFalse(self.verifier.verifyHmac(headers, self.body))
+
+    def test_token(self):
+        verifier = SignatureVerifier("gitlabToken")
+        self.assertTrue(verifier.verifyToken("gitlabToken"))
+        self.assertFalse(verifier.verifyToken("gitlabTokem"))
+        self.assertFalse(verifier.verifyToken("ünicode"))
+
+    def test_cachedPerConfig(self):
+        settings = APISettings("github")
+        verifier = verifierFor(settings, settings.hmacSecret)
+        self.assertIs(verifierFor(settings, settings.hmacSecret), verifier)
+
+        CONTEXT.CONFIG = deepcopy(CONTEXT.CONFIG)
+        self.assertIsNot(verifierFor(settings, settings.hmacSecret), verifier)
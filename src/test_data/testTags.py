@@ -0,0 +1,126 @@
+# coding=utf-8
+from test_data.testBase import ConfigTestCase
+from tags import TagIndex
+from functions import call
+from context import CONTEXT
+import subprocess, tempfile, shutil, os
+
+
+class TagIndexTestCase(ConfigTestCase):
+    def setUp(self):
+        super(TagIndexTestCase, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.remote = os.path.join(self.tmp, "remote")
+        self.repo = os.path.join(self.tmp, "repo")
+
+        os.makedirs(self.remote)
+        self.git(["init", "-q"], self.remote)
+        for a in range(3):
+            self.commitAndTag("dev%d" % a, 1000000000 + a * 100)
+        self.git(["clone", "-q", self.remote, self.repo], self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def git(self, args, cwd, env=None):
+        out, error = call(["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"] + args, cwd=cwd, env=env)
+        self.assertFalse(error, out)
+        return out
+
+    def commitAndTag(self, tag, date):
+        env = dict(os.environ, GIT_COMMITTER_DATE="%d +0000" % date, GIT_AUTHOR_DATE="%d +0000" % date)
+        self.git(["commit", "-q", "--allow-empty", "-m", tag], self.remote, env)
+        self.git(["tag", tag], self.remote)
+
+    def gitOrder(self):
+        return self.git(["tag", "--sort=-committerdate"], self.repo).split()
+
+    def test_order(self):
+        index = TagIndex(self.repo)
+        self.assertEqual(index.load(), ("", False))
+
+        self.assertEqual(index.tags, ["dev2", "dev1", "dev0"])
+        self.assertEqual(index.tags, self.gitOrder())
+        self.assertEqual(index.rank("dev2"), 0)
+        self.assertEqual(index.rank("dev0"), 2)
+        self.assertIsNone(index.rank("dev9"))
+        self.assertEqual(index.commit("dev1"), self.git(["rev-parse", "dev1"], self.repo).strip())
+
+    def test_persisted(self):
+        TagIndex(self.repo).load()
+        self.assertTrue(os.path.exists(os.path.join(self.repo, ".git", "TAG_INDEX")))
+
+        # a second instance doesn't query git
+        index = TagIndex(self.repo)
+        index._query = None
+        index.load()
+        self.assertEqual(index.tags, ["dev2", "dev1", "dev0"])
+
+    def test_applyFetch(self):
+        index = TagIndex(self.repo)
+        index.load()
+
+        self.commitAndTag("dev3", 1000000500)
+        self.git(["tag", "-d", "dev0"], self.remote)
+        fetchOut = self.git(["fetch", "--prune", "--prune-tags", "origin"], self.repo)
+
+        index.applyFetch(fetchOut)
+        self.assertEqual(index.tags, ["dev3", "dev2", "dev1"])
+        self.assertEqual(index.tags, self.gitOrder())
+
+        # stored index is still valid after the fetch
+        index = TagIndex(self.repo)
+        index._query = None
+        index.load()
+        self.assertEqual(index.tags, ["dev3", "dev2", "dev1"])
+
+    def test_outdated(self):
+        TagIndex(self.repo).load()
+        self.git(["tag", "local", "dev0"], self.repo)
+
+        # tag created outside of a fetch, index is rebuilt
+        index = TagIndex(self.repo)
+        index.load()
+        self.assertEqual(index.tags, self.gitOrder())
+        self.assertEqual(index.rank("local"), 3)
+
+    def test_manyTags(self):
+        # the listing is longer than the output kept of other commands
+        CONTEXT.CONFIG["commands"] = {"maxOutput": 4096}
+        head = self.git(["rev-parse", "HEAD"], self.repo).strip()
+        refs = "".join(map(lambda x: "create refs/tags/t%d %s\n" % (x, head), range(300)))
+        subprocess.run(["git", "update-ref", "--stdin"], input=refs.encode(), cwd=self.repo, check=True)
+
+        index = TagIndex(self.repo)
+        self.assertEqual(index.load(), ("", False))
+        self.assertEqual(len(index.tags), 303)
+        self.assertEqual(index.tags, self.gitOrder())
+        self.assertIsNotNone(index.rank("t150"))
+
+        # the stored index is complete as well
+        index = TagIndex(self.repo)
+        index._query = None
+        index.load()
+        self.assertEqual(len(index.tags), 303)
+
+    def test_outdatedSubdirectory(self):
+        self.git(["tag", "release/first", "dev0"], self.repo)
+        TagIndex(self.repo).load()
+        self.git(["tag", "release/second", "dev0"], self.repo)
+
+        # tag created in an existing subdirectory of refs/tags, index is rebuilt
+        index = TagIndex(self.repo)
+        index.load()
+        self.assertEqual(index.tags, self.gitOrder())
+        self.assertEqual(index.rank("release/second"), 4)
+
+    def test_applyCappedFetch(self):
+        index = TagIndex(self.repo)
+        index.load()
+
+        # the tag updates of a capped fetch output are incomplete, the index is rebuilt
+        self.commitAndTag("dev3", 1000000500)
+        self.git(["fetch", "origin"], self.repo)
+        index.applyFetch("From ../remote\n\n[!] 4096 bytes of output omitted\n\n")
+        self.assertEqual(index.tags, ["dev3", "dev2", "dev1", "dev0"])
+        self.assertEqual(index.tags, self.gitOrder())
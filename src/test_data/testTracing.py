@@ -0,0 +1,32 @@
+# coding=utf-8
+from tracing import traceDeploy, tracePath
+from functions import call
+from test_data.testBase import ConfigTestCase
+from context import CONTEXT
+import json
+
+
+class TracingTestCase(ConfigTestCase):
+    def test_trace(self):
+        logPath = tracePath()
+        self.assertFalse(logPath.startswith(CONTEXT.PROJECT_FOLDER))
+
+        with traceDeploy("TestRepo", "develop") as trace:
+            call("echo https://token@github.com/u/r.git", shell=True)
+            call("exit 2", shell=True)
+            trace.finish(200)
+
+        steps = trace.toDict()["steps"]
+        self.assertEqual(len(steps), 2)
+        self.assertEqual(steps[0]["command"], "echo https://***@github.com/u/r.git")
+        self.assertEqual(steps[0]["outputBytes"], len("https://token@github.com/u/r.git\n"))
+        self.assertEqual(steps[1]["exitCode"], 2)
+        self.assertLessEqual(steps[0]["start"], steps[1]["start"])
+
+        # calls outside of a deploy are not traced
+        call("true", shell=True)
+        self.assertEqual(len(trace.steps), 2)
+
+        with open(logPath) as a:
+            lastLine = a.readlines()[-1]
+        self.assertEqual(json.loads(lastLine), json.loads(json.dumps(trace.toDict())))
@@ -0,0 +1,114 @@
+# coding=utf-8
+from context import CONTEXT
+from functions import addCallObserver, redact
+from metrics import commandStage
+from contextlib import contextmanager
+import threading, time, json, os
+
+_current = threading.local()
+_logLock = threading.Lock()
+
+
+class DeployTrace(object):
+    def __init__(self, repoName, branch, tag=None):
+        """
+        Steps of one branch deploy with their timing, exit status and output size.
+        """
+
+        self.repoName = repoName
+        self.branch = branch
+        self.tag = tag
+        self.started = time.time()
+        self.duration = None
+        self.statusCode = None
+        self.steps = []
+        # traces of requests which didn't run any commands themselves aren't written
+        self.discarded = False
+
+    def addStep(self, result):
+        """
+        :type result: functions.CommandResult
+        """
+
+        self.steps.append({
+            # don't write access tokens of git urls to the log
+            "command": redact(result.cmd),
+            "stage": commandStage(result.cmd),
+            "start": round(result.started - self.started, 4),
+            "duration": round(result.wallTime, 4),
+            "exitCode": result.exitCode,
+            "timedOut": result.timedOut,
+            "outputBytes": result.bytes
+        })
+
+    def finish(self, statusCode):
+        self.statusCode = statusCode
+        self.duration = time.time() - self.started
+
+    def toDict(self):
+        return {
+            "repoName": self.repoName,
+            "branch": self.branch,
+            "tag": self.tag,
+            "started": self.started,
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+            "statusCode": self.statusCode,
+            "steps": self.steps
+        }
+
+
+def _observeCall(result):
+    trace = getattr(_current, "trace", None)
+    if trace:
+        trace.addStep(result)
+
+
+def currentTrace():
+    """
+    :return: trace of the deploy running in the current thread
+    :rtype: DeployTrace
+    """
+
+    return getattr(_current, "trace", None)
+
+
+def tracePath():
+    traces = (CONTEXT.CONFIG or dict()).get("traces") or dict()
+    return traces.get("path") or os.path.join(CONTEXT.PROJECT_FOLDER, "Logs", "deploys.jsonl")
+
+
+def writeTrace(trace):
+    # one JSON line per deploy
+    path = tracePath()
+    line = json.dumps(trace.toDict(), sort_keys=True) + "\n"
+    try:
+        with _logLock, open(path, "a", encoding="utf-8") as a:
+            a.write(line)
+    except OSError as e:
+        CONTEXT.LOGGER.warning("Writing deploy trace failed: " + str(e))
+
+
+@contextmanager
+def traceDeploy(repoName, branch, tag=None):
+    """
+    Records the commands run by the current thread into a new DeployTrace.
+    The caller sets the status with `trace.finish()`, the trace is written to `tracePath()` afterwards,
+    unless it was discarded.
+
+    :rtype: DeployTrace
+    """
+
+    trace = DeployTrace(repoName, branch, tag)
+    oldTrace = getattr(_current, "trace", None)
+    _current.trace = trace
+    try:
+        yield trace
+    finally:
+        _current.trace = oldTrace
+        if trace.duration is None:
+            trace.finish(500)
+        if not trace.discarded:
+            writeTrace(trace)
+
+
+addCallObserver(_observeCall)
@@ -1,6 +1,7 @@
-import logging
+import logging, threading, time
 from logging import StreamHandler
-from logging.handlers import WatchedFileHandler, SMTPHandler
+from logging.handlers import WatchedFileHandler, SMTPHandler, QueueHandler, QueueListener
+from collections import deque
 from .formatter_const import *
 
 def loggerWithName(name):
@@ -64,4 +65,155 @@ class PNLogFormatter(logging.Formatter):
 
 class PNMailLogFormatter(logging.Formatter):
     def __init__(self, fmt='%(asctime)s in %(pathname)s:%(lineno)d\n%(levelname)s: %(message)s', datefmt="%Y-%m-%d %H:%M:%S"):
-        super(PNMailLogFormatter, self).__init__(fmt, datefmt)
\ No newline at end of file
+        super(PNMailLogFormatter, self).__init__(fmt, datefmt)
+
+
+class MailFilter(logging.Filter):
+    """
+    Passes records of *level* and above and records logged with `extra={"mail": True}`.
+    """
+
+    def __init__(self, level=logging.CRITICAL):
+        super(MailFilter, self).__init__()
+        self.level = level
+
+    def filter(self, record):
+        return record.levelno >= self.level or getattr(record, "mail", False)
+
+
+class DigestMailHandler(logging.Handler):
+    def __init__(self, mailHandler, window=60, maxMails=10, maxRecords=100):
+        """
+        Collects records for *window* seconds and sends them as one mail with *mailHandler*.
+        At most *maxMails* mails are sent per hour, further records wait for the next free slot.
+
+        :param mailHandler: handler used to deliver the digest (e.g. SMTPHandler)
+        :type mailHandler: logging.Handler
+
+        :param window: seconds to collect records before a digest is sent, 0 sends every record at once
+        :type window: float
+
+        :param maxMails: maximum number of mails per hour
+        :type maxMails: int
+
+        :param maxRecords: maximum number of records in one digest, additional records are only counted
+        :type maxRecords: int
+        """
+
+        super(DigestMailHandler, self).__init__()
+        self.mailHandler = mailHandler
+        self.mailHandler.setFormatter(logging.Formatter("%(message)s"))
+        self.mailHandler.setLevel(logging.NOTSET)
+        self.window = window
+        self.maxMails = maxMails
+        self.maxRecords = maxRecords
+
+        self._records = []
+        self._dropped = 0
+        self._level = logging.NOTSET
+        self._sent = deque()
+        self._timer = None
+        self._digestLock = threading.Lock()
+
+    def takeOver(self, other):
+        """
+        Moves pending records and the rate limit state of *other* to this handler, e.g. after a config reload.
+
+        :type other: DigestMailHandler
+        """
+
+        with other._digestLock:
+            if other._timer:
+                other._timer.cancel()
+                other._timer = None
+            records, dropped, level, sent = other._records, other._dropped, other._level, other._sent
+            other._records, other._dropped, other._level = [], 0, logging.NOTSET
+
+        with self._digestLock:
+            self._records = records + self._records
+            self._dropped += dropped
+            self._level = max(self._level, level)
+            self._sent = sent
+
+        if records:
+            self._schedule(self.window)
+
+    def emit(self, record):
+        try:
+            text = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._digestLock:
+            if len(self._records) < self.maxRecords:
+                self._records.append(text)
+            else:
+                self._dropped += 1
+            self._level = max(self._level, record.levelno)
+
+        if self.window > 0:
+            self._schedule(self.window)
+        else:
+            self.flush()
+
+    def _schedule(self, delay):
+        with self._digestLock:
+            if self._timer:
+                return
+            self._timer = threading.Timer(delay, self._send)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _send(self):
+        with self._digestLock:
+            self._timer = None
+        self.flush()
+
+    def _nextSlot(self):
+        # seconds until another mail may be sent
+        now = time.time()
+        while self._sent and self._sent[0] <= now - 3600:
+            self._sent.popleft()
+        if len(self._sent) < self.maxMails:
+            return 0
+        return self._sent[0] + 3600 - now
+
+    def flush(self, force=False):
+        with self._digestLock:
+            if not self._records:
+                return
+
+            wait = self._nextSlot()
+            if wait > 0 and not force:
+                wait = max(wait, self.window)
+            else:
+                records, dropped, level = self._records, self._dropped, self._level
+                self._records, self._dropped, self._level = [], 0, logging.NOTSET
+                self._sent.append(time.time())
+
+        if wait > 0 and not force:
+            # rate limited, keep collecting
+            self._schedule(wait)
+            return
+
+        message = ("\n\n" + "-" * 40 + "\n\n").join(records)
+        if dropped:
+            message += "\n\n[!] %d further messages were dropped." % dropped
+
+        record = logging.makeLogRecord({
+            "name": "DigestMailHandler",
+            "msg": message,
+            "levelno": level,
+            "levelname": logging.getLevelName(level)
+        })
+        self.mailHandler.handle(record)
+
+    def close(self):
+        with self._digestLock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        self.flush(force=True)
+        self.mailHandler.close()
+        super(DigestMailHandler, self).close()
@@ -23,6 +23,33 @@ def validateGeneralApiConfig(c, apiName):
     
     assert isinstance(deployPath, str), "'deployPath' must be a String"
     assert isinstance(baseUrl, str), "'baseUrl' must be a String"
+    
+    http = c.pop("http", None)
+    if http is not None:
+        validateHttp(http, apiName)
+
+
+def validateHttp(h, apiName):
+    assert isinstance(h, dict), "'http' in '" + apiName + "' configuration must be a dictionary"
+    
+    timeout = h.pop("timeout", None)
+    retries = h.pop("retries", None)
+    backoff = h.pop("backoff", None)
+    poolSize = h.pop("poolSize", None)
+    
+    if timeout is not None:
+        assert isinstance(timeout, (int, float)) and timeout > 0, "'timeout' in '" + apiName + "' http configuration must be a number > 0"
+    
+    if retries is not None:
+        assert isinstance(retries, int) and retries >= 0, "'retries' in '" + apiName + "' http configuration must be an Int >= 0"
+    
+    if backoff is not None:
+        assert isinstance(backoff, (int, float)) and backoff >= 0, "'backoff' in '" + apiName + "' http configuration must be a number >= 0"
+    
+    if poolSize is not None:
+        assert isinstance(poolSize, int) and poolSize > 0, "'poolSize' in '" + apiName + "' http configuration must be an Int > 0"
+    
+    assert len(h.keys()) == 0, "Unknown keys in '" + apiName + "' http dictionary found: " + ", ".join(h.keys())
 
 
 def validateGithub(a):
@@ -31,6 +58,8 @@ def validateGithub(a):
     accessToken = a.pop("accessToken", None)
     username = a.pop("username", None)
     hmacSecret = a.pop("hmacSecret", None)
+    releaseCacheTTL = a.pop("releaseCacheTTL", None)
+    apiUrl = a.pop("apiUrl", None)
     
     if not accessToken:
         LOGGER.info("ReleaseOnly mode not supported for private repositories, github 'accessToken' is missing.")
@@ -46,6 +75,12 @@ def validateGithub(a):
         LOGGER.info("Signature of github webhook post requests can't be validated. 'hmacSecret' key is missing in configuration.")
     else:
         assert isinstance(hmacSecret, bytes), "'hmacScret' must be bytes"
+    
+    if releaseCacheTTL is not None:
+        assert isinstance(releaseCacheTTL, int) and releaseCacheTTL >= 0, "'releaseCacheTTL' must be an Int >= 0"
+    
+    if apiUrl is not None:
+        assert isinstance(apiUrl, str) and apiUrl[:4] == "http", "'apiUrl' must be a http(s) url String"
         
     assert len(a.keys()) == 0, "Unknown keys in github dictionary found: " + ", ".join(a.keys())
     
@@ -100,6 +135,106 @@ def validateProtection(p):
     assert len(p.keys()) == 0, "Unknown keys in 'protection' dictionary found: " + ", ".join(p.keys())
     
     
+def validateConcurrency(c):
+    deployWorkers = c.pop("deployWorkers", None)
+    branchWorkers = c.pop("branchWorkers", None)
+    hostLimit = c.pop("hostLimit", None)
+    
+    if deployWorkers is not None:
+        assert isinstance(deployWorkers, int) and deployWorkers >= 0, "'deployWorkers' must be an Int >= 0"
+    
+    if branchWorkers is not None:
+        assert isinstance(branchWorkers, int) and branchWorkers >= 0, "'branchWorkers' must be an Int >= 0"
+    
+    if hostLimit is not None:
+        assert isinstance(hostLimit, int) and hostLimit >= 1, "'hostLimit' must be an Int >= 1"
+    
+    assert len(c.keys()) == 0, "Unknown keys in 'concurrency' dictionary found: " + ", ".join(c.keys())
+    
+    
+def validateCommands(c):
+    timeout = c.pop("timeout", None)
+    scriptTimeout = c.pop("scriptTimeout", None)
+    maxOutput = c.pop("maxOutput", None)
+    killScriptProcessGroup = c.pop("killScriptProcessGroup", None)
+    
+    if timeout is not None:
+        assert isinstance(timeout, (int, float)) and timeout > 0, "'timeout' in 'commands' must be a number > 0"
+    
+    if scriptTimeout is not None:
+        assert isinstance(scriptTimeout, (int, float)) and scriptTimeout > 0, "'scriptTimeout' in 'commands' must be a number > 0"
+    
+    if maxOutput is not None:
+        assert isinstance(maxOutput, int) and maxOutput >= 1024, "'maxOutput' in 'commands' must be an Int >= 1024"
+    
+    if killScriptProcessGroup is not None:
+        assert isinstance(killScriptProcessGroup, bool), "'killScriptProcessGroup' in 'commands' must be a Bool"
+    
+    assert len(c.keys()) == 0, "Unknown keys in 'commands' dictionary found: " + ", ".join(c.keys())
+    
+    
+def validateDeliveries(d):
+    path = d.pop("path", None)
+    maxEntries = d.pop("maxEntries", None)
+    ttl = d.pop("ttl", None)
+    
+    if path is not None:
+        assert isinstance(path, str) and len(path) > 0, "'path' in 'deliveries' must be a non empty string"
+    
+    if maxEntries is not None:
+        assert isinstance(maxEntries, int) and maxEntries >= 1, "'maxEntries' in 'deliveries' must be an Int >= 1"
+    
+    if ttl is not None:
+        assert isinstance(ttl, (int, float)) and ttl > 0, "'ttl' in 'deliveries' must be a number > 0"
+    
+    assert len(d.keys()) == 0, "Unknown keys in 'deliveries' dictionary found: " + ", ".join(d.keys())
+    
+    
+def validateTraces(d):
+    path = d.pop("path", None)
+    
+    if path is not None:
+        assert isinstance(path, str) and len(path) > 0, "'path' in 'traces' must be a non empty string"
+    
+    assert len(d.keys()) == 0, "Unknown keys in 'traces' dictionary found: " + ", ".join(d.keys())
+    
+    
+def validateMailDigest(d):
+    window = d.pop("window", None)
+    maxMails = d.pop("maxMails", None)
+    maxRecords = d.pop("maxRecords", None)
+    
+    if window is not None:
+        assert isinstance(window, (int, float)) and window >= 0, "'window' in 'mailDigest' must be a number >= 0"
+    
+    if maxMails is not None:
+        assert isinstance(maxMails, int) and maxMails >= 1, "'maxMails' in 'mailDigest' must be an Int >= 1"
+    
+    if maxRecords is not None:
+        assert isinstance(maxRecords, int) and maxRecords >= 1, "'maxRecords' in 'mailDigest' must be an Int >= 1"
+    
+    assert len(d.keys()) == 0, "Unknown keys in 'mailDigest' dictionary found: " + ", ".join(d.keys())
+    
+    
+def validateClone(repoName, c):
+    assert isinstance(c, dict), "'clone' in '" + repoName + "' configuration must be a dictionary"
+    
+    depth = c.pop("depth", None)
+    singleBranch = c.pop("singleBranch", None)
+    filter = c.pop("filter", None)
+    
+    if depth is not None:
+        assert isinstance(depth, int) and not isinstance(depth, bool) and depth > 0, "'depth' in '" + repoName + "' clone configuration must be an Int > 0"
+    
+    if singleBranch is not None:
+        assert isinstance(singleBranch, bool), "'singleBranch' in '" + repoName + "' clone configuration must be a Bool"
+    
+    if filter is not None:
+        assert filter in ["blob:none", "tree:0"], "unsupported 'filter' in '" + repoName + "' clone configuration. Supported values are: blob:none, tree:0"
+    
+    assert len(c.keys()) == 0, "Unknown keys in '" + repoName + "' clone configuration found: " + ", ".join(c.keys())
+
+
 def validateRepo(repoName, dic):
     assert isinstance(dic, dict), "'"+ repoName + "' configuration must be a dictionary"
     
@@ -110,6 +245,8 @@ def validateRepo(repoName, dic):
     tagsOnly = dic.pop("tagsOnly", None)
     
     api = dic.pop("api", None)
+    mirror = dic.pop("mirror", None)
+    clone = dic.pop("clone", None)
     
     if whitelist:
         assert isinstance(whitelist, list), "'whitelistedBranches' in '" + repoName + "' configuration must be a list"
@@ -139,6 +276,13 @@ def validateRepo(repoName, dic):
         assert isinstance(api, str), "'api' in '" + repoName + "' configuration must be a String"
         assert api == "github" or api == "bitbucket" or api == "gitlab", "unsupported value for 'api' in '" + repoName + "' configuration. Supported values are: github, gitlab, bitbucket"
     
+    if mirror is not None:
+        assert isinstance(mirror, bool), "'mirror' in '" + repoName + "' configuration must be a Bool"
+    
+    if clone is not None:
+        validateClone(repoName, clone)
+        assert not mirror, "'clone' options in '" + repoName + "' configuration can't be combined with 'mirror'"
+    
     assert len(dic.keys()) == 0, "Unsupported keys in '" + repoName + "' configuration found: " + ", ".join(dic)
     
 
@@ -160,12 +304,46 @@ def main():
     
     if logger:
         assert isinstance(logger, logging.handlers.SMTPHandler), "'mailLogger' needs to be an instance of logging.handlers.SMTPHandler"
+    
+    maxBodySize = CONFIG.pop("maxBodySize", None)
+    if maxBodySize is not None:
+        assert isinstance(maxBodySize, int) and maxBodySize >= 1024, "'maxBodySize' must be an Int >= 1024"
+    
+    mailDigest = CONFIG.pop("mailDigest", None)
+    if mailDigest:
+        assert isinstance(mailDigest, dict), "'mailDigest' must be a dictionary"
+        validateMailDigest(mailDigest)
         
     
     # validate protection configuration
     protection = CONFIG.pop("protection", None)
     if protection:
         validateProtection(protection)
+    
+    # validate worker configuration
+    concurrency = CONFIG.pop("concurrency", None)
+    if concurrency:
+        assert isinstance(concurrency, dict), "'concurrency' must be a dictionary"
+        validateConcurrency(concurrency)
+
+
+    # validate webhook delivery cache
+    deliveries = CONFIG.pop("deliveries", None)
+    if deliveries:
+        assert isinstance(deliveries, dict), "'deliveries' must be a dictionary"
+        validateDeliveries(deliveries)
+    
+    # validate deploy traces
+    traces = CONFIG.pop("traces", None)
+    if traces:
+        assert isinstance(traces, dict), "'traces' must be a dictionary"
+        validateTraces(traces)
+    
+    # validate subprocess limits
+    commands = CONFIG.pop("commands", None)
+    if commands:
+        assert isinstance(commands, dict), "'commands' must be a dictionary"
+        validateCommands(commands)
 
 
     # validate API Configurations